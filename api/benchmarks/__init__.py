@@ -0,0 +1 @@
+# Benchmarks de l'API (à lancer depuis le dossier api/, voir README.md)
@@ -0,0 +1,150 @@
+# --- Benchmark : couche base de données synchrone (ancienne) contre asynchrone (nouvelle)
+# Lancer depuis le dossier api/ : python -m benchmarks.bench_async_db --requests 2000 --concurrency 10
+# Par défaut une base SQLite temporaire est utilisée, définir DATABASE_URL pour cibler PostgreSQL.
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_async_db.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.makedirs("static", exist_ok=True)
+
+import httpx
+from fastapi import FastAPI, Depends, HTTPException
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+import database, models, schemas
+import services.utils as service_utils
+from services.utils import loading_plan
+import main
+
+
+# --- Ancien chemin : requêtes synchrones exécutées dans des routes async (code d'origine, avec les mêmes requêtes SQL
+# que le nouveau chemin pour ne comparer que le blocage de la boucle d'événements)
+def get_sync_db():
+    db = database.SessionLocal(expire_on_commit=False)
+    try:
+        yield db
+    finally:
+        db.close()
+
+old_app = FastAPI()
+
+@old_app.get("/user/{user_id}/comptes/", response_model=list[schemas.Compte])
+async def old_read_user_comptes(user_id: int, db: Session = Depends(get_sync_db)):
+    user = db.get(models.Utilisateur, user_id)
+    if user:
+        return db.scalars(
+            select(models.Compte).filter(models.Compte.utilisateur_id == user_id).options(*loading_plan(schemas.Compte))
+        ).all()
+    raise HTTPException(status_code=404, detail="Utilisateur not found")
+
+@old_app.post("/user/{user_id}/compte/", response_model=schemas.Compte)
+async def old_add_user_compte(user_id: int, compte: schemas.CompteCreate, db: Session = Depends(get_sync_db)):
+    user = db.query(models.Utilisateur).filter(models.Utilisateur.id == user_id).first()
+    if user:
+        db_compte = models.Compte(**compte.dict(), utilisateur_id=user_id, personnages=[])
+        db.add(db_compte)
+        db.commit()
+        return db_compte
+    raise HTTPException(status_code=404, detail="Utilisateur not found")
+
+
+def seed_user() -> int:
+    """
+    Cette fonction permet de créer l'utilisateur utilisé par le benchmark
+    @return int
+    """
+    with database.SessionLocal() as db:
+        user = models.Utilisateur(login=f"bench-{uuid.uuid4().hex}", email=f"{uuid.uuid4().hex}@bench", password="x")
+        db.add(user)
+        db.commit()
+        return user.id
+
+
+def percentile(values: list, p: float) -> float:
+    """
+    Cette fonction permet de calculer un percentile (plus proche rang)
+    @param values: list (triée)
+    @param p: float entre 0 et 100
+    @return float
+    """
+    if not values:
+        return 0.0
+    index = max(0, min(len(values) - 1, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+async def run(app: FastAPI, user_id: int, total: int, concurrency: int, write_ratio: float) -> dict:
+    """
+    Cette fonction permet de lancer un mélange de lectures et d'écritures concurrentes sur une application
+    @param app: FastAPI
+    @param user_id: int
+    @param total: int
+    @param concurrency: int
+    @param write_ratio: float
+    @return dict
+    """
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(random.random() < write_ratio)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                is_write = queue.get_nowait()
+                start = time.perf_counter()
+                if is_write:
+                    response = await client.post(f"/user/{user_id}/compte/", json={"nom": uuid.uuid4().hex})
+                else:
+                    response = await client.get(f"/user/{user_id}/comptes/")
+                latencies.append((time.perf_counter() - start) * 1000)
+                if response.status_code != 200:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "requests": total,
+        "errors": errors,
+        "throughput_rps": total / elapsed,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+    }
+
+
+async def main_benchmark(args):
+    service_utils.create_database()
+    for name, app in (("sync (old)", old_app), ("async (new)", main.app)):
+        # chaque chemin part d'un utilisateur sans compte pour comparer des lectures de même taille
+        user_id = seed_user()
+        result = await run(app, user_id, args.requests, args.concurrency, args.write_ratio)
+        print(
+            f"{name:<12} {result['throughput_rps']:8.1f} req/s  "
+            f"p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms p99={result['p99_ms']:.2f}ms "
+            f"errors={result['errors']}"
+        )
+    await database.async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare la latence des chemins base de données synchrone et asynchrone")
+    parser.add_argument("--requests", type=int, default=1000)
+    # au-delà de 15 clients (pool_size + max_overflow par défaut) l'ancien chemin épuise le pool et se bloque
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    asyncio.run(main_benchmark(parser.parse_args()))
@@ -0,0 +1,98 @@
+# --- Benchmark : écriture d'inventaire objet par objet contre lot unique
+# Lancer depuis le dossier api/ : python -m benchmarks.bench_inventaire_batch --items 50 --rounds 5
+# Par défaut une base SQLite temporaire est utilisée, définir DATABASE_URL pour cibler PostgreSQL.
+# Avant la mesure, le script vérifie les résultats d'un lot qui vise deux fois le même emplacement (code de sortie 1 sinon).
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_inventaire_batch.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.makedirs("static", exist_ok=True)
+
+from fastapi.testclient import TestClient
+
+import database, models
+import services.utils as service_utils
+import main
+
+
+def seed_personnage() -> tuple:
+    """
+    Cette fonction permet de créer un personnage vide
+    @return tuple (id utilisateur, id compte, id personnage)
+    """
+    with database.SessionLocal() as db:
+        user = models.Utilisateur(login=uuid.uuid4().hex, email=f"{uuid.uuid4().hex}@bench", password="x")
+        compte = models.Compte(nom=uuid.uuid4().hex, utilisateur=user)
+        personnage = models.Personnage(nom=uuid.uuid4().hex, compte=compte)
+        db.add(user)
+        db.commit()
+        return user.id, compte.id, personnage.id
+
+
+def run_per_item(client: TestClient, base: str, items: int) -> None:
+    # une requête, une vérification du personnage et un commit par objet
+    for i in range(items):
+        client.post(base, json={"objet": f"objet-{i}"})
+
+
+def run_batch(client: TestClient, base: str, items: int) -> None:
+    # une requête, un INSERT groupé et un commit pour tout le lot
+    operations = [{"action": "add", "objet": f"objet-{i}"} for i in range(items)]
+    client.post(f"{base}batch/", json={"operations": operations})
+
+
+def check_superseded(client: TestClient) -> int:
+    """
+    Cette fonction permet de vérifier qu'une opération suivie dans le lot d'une autre sur le même emplacement est signalée
+    "superseded" et que seule la dernière est appliquée
+    @param client: TestClient
+    @return int (nombre de vérifications en échec)
+    """
+    failures = 0
+    for label, actions, expected, kept in (
+        ("update puis remove", [("update", 5), ("remove", None)], ["superseded", "ok"], None),
+        ("update puis update", [("update", 5), ("update", 7)], ["superseded", "ok"], 7),
+        ("remove puis update", [("remove", None), ("update", 7)], ["ok", "not_found"], None),
+    ):
+        user_id, compte_id, personnage_id = seed_personnage()
+        base = f"/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/"
+        slot_id = client.post(base, json={"objet": "objet-0"}).json()["id"]
+        operations = [{"action": action, "id": slot_id, "quantite": quantite} for action, quantite in actions]
+        results = client.post(f"{base}batch/", json={"operations": operations}).json()
+        slots = {slot["id"]: slot["quantite"] for slot in client.get(base).json()}
+        statuses = [result["status"] for result in results]
+        ok = statuses == expected and slots.get(slot_id) == kept
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {label:<20} statuts {statuses} (attendu {expected}), quantité finale {slots.get(slot_id)} (attendu {kept})")
+    return failures
+
+
+def main_benchmark(args) -> int:
+    service_utils.create_database()
+    with TestClient(main.app) as client:
+        failures = check_superseded(client)
+        for name, func in (("per item", run_per_item), ("batch", run_batch)):
+            timings = []
+            for _ in range(args.rounds):
+                user_id, compte_id, personnage_id = seed_personnage()
+                base = f"/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/"
+                start = time.perf_counter()
+                func(client, base, args.items)
+                timings.append((time.perf_counter() - start) * 1000)
+            median = statistics.median(timings)
+            print(f"{name:<9} {args.items} objets : médiane {median:8.2f} ms ({args.items / median * 1000:8.1f} objets/s)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare l'ajout d'objets d'inventaire un par un et par lot")
+    parser.add_argument("--items", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=5)
+    sys.exit(main_benchmark(parser.parse_args()))
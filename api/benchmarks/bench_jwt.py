@@ -0,0 +1,74 @@
+# --- Benchmark : création et vérification des tokens d'accès par implémentation
+# Lancer depuis le dossier api/ : python -m benchmarks.bench_jwt --tokens 20000
+# Vérifie aussi que les tokens d'une implémentation sont acceptés par les autres et qu'un token falsifié est refusé.
+import argparse
+import os
+import time
+from datetime import timedelta
+
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+import tasks
+
+
+def available_backends() -> dict:
+    """
+    Cette fonction permet de construire les implémentations utilisables (PyJWT n'est pas toujours installé)
+    @return dict
+    """
+    backends = {}
+    for name in tasks.JWT_BACKENDS:
+        try:
+            backends[name] = tasks.get_token_backend(name)
+        except RuntimeError as exc:
+            print(f"{name:<6} ignoré : {exc}")
+    return backends
+
+
+def claims(n: int) -> dict:
+    return {"sub": f"user{n}@bench", "exp": tasks.get_current_datetime() + timedelta(minutes=300)}
+
+
+def check_compatibility(backends: dict):
+    for name, backend in backends.items():
+        token = backend.encode(claims(0))
+        for other_name, other in backends.items():
+            assert other.decode(token)["sub"] == "user0@bench", f"{other_name} rejette un token {name}"
+        forged = token[:-2] + ("AA" if not token.endswith("AA") else "BB")
+        for other_name, other in backends.items():
+            try:
+                other.decode(forged)
+            except tasks.TokenError:
+                continue
+            raise AssertionError(f"{other_name} accepte un token {name} falsifié")
+
+
+def main_benchmark(args):
+    backends = available_backends()
+    check_compatibility(backends)
+    payloads = [claims(n) for n in range(args.tokens)]
+    for name, backend in backends.items():
+        start = time.perf_counter()
+        tokens = [backend.encode(payload) for payload in payloads]
+        encode = time.perf_counter() - start
+        start = time.perf_counter()
+        for token in tokens:
+            backend.decode(token)
+        decode = time.perf_counter() - start
+        print(f"{name:<6} encode {args.tokens / encode:10.0f} tokens/s   decode {args.tokens / decode:10.0f} tokens/s")
+
+    # vérification répétée d'un même token : les claims sont mémorisés jusqu'à l'expiration
+    tasks.claims_cache.clear()
+    token = tasks.create_access_token({"sub": "cached@bench"})
+    start = time.perf_counter()
+    for _ in range(args.tokens):
+        tasks.verify_access_token(token)
+    cached = time.perf_counter() - start
+    print(f"cache  verify {args.tokens / cached:10.0f} tokens/s ({tasks.token_backend.name}, {tasks.claims_cache.stats()['hits']} succès)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare les implémentations des tokens d'accès")
+    parser.add_argument("--tokens", type=int, default=20000)
+    main_benchmark(parser.parse_args())
@@ -0,0 +1,160 @@
+# --- Benchmark : recherche par nom (GET /search/) sur un grand volume
+# Lancer depuis le dossier api/ : python -m benchmarks.bench_search --personnages 1000000 --objets 10000
+# Remplit une base (DATABASE_URL, SQLite temporaire par défaut) avec des noms générés, puis mesure la recherche indexée
+# (services.search, index trigramme de la migration 0006) dans chaque mode et, pour comparaison, le parcours complet
+# de la table (nom LIKE '%q%' sans index), équivalent côté base du filtrage fait aujourd'hui par les clients.
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_search.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import insert, select, func
+
+import database, models
+import services.utils as service_utils
+import services.search as service_search
+
+BATCH_SIZE = 10000
+# syllabes consonne(s) + voyelle (+ consonne finale) : environ 2000 syllabes, des noms aussi variés que des noms de joueurs
+SYLLABES = [
+    onset + vowel + coda
+    for onset in ("", "b", "br", "d", "dr", "f", "g", "gr", "k", "kr", "l", "m", "n", "p", "r", "s", "sh", "t", "th", "v", "z")
+    for vowel in ("a", "e", "i", "o", "u", "y", "ae", "ou")
+    for coda in ("", "l", "n", "r", "s", "x", "th", "nd", "rk", "sh", "m", "g")
+]
+
+
+def random_name(rng: random.Random, index: int) -> str:
+    """
+    Cette fonction permet de générer un nom de 2 à 4 syllabes, rendu unique par l'index (en base 36)
+    @param rng: random.Random
+    @param index: int
+    @return str
+    """
+    name = "".join(rng.choice(SYLLABES) for _ in range(rng.randint(2, 4))).capitalize()
+    suffix = ""
+    while True:
+        index, digit = divmod(index, 36)
+        suffix = "0123456789abcdefghijklmnopqrstuvwxyz"[digit] + suffix
+        if index == 0:
+            return f"{name}-{suffix}"
+
+
+def seed(nb_personnages: int, nb_objets: int, rng: random.Random) -> list[str]:
+    """
+    Cette fonction permet de remplir la base : un compte pour 4 personnages, un utilisateur pour 2 comptes
+    @param nb_personnages: int
+    @param nb_objets: int
+    @param rng: random.Random
+    @return list[str] (échantillon de noms de personnages, pour construire les recherches)
+    """
+    nb_comptes = max(nb_personnages // 4, 1)
+    nb_users = max(nb_comptes // 2, 1)
+    sample = []
+    with database.engine.begin() as connection:
+        for start in range(0, nb_users, BATCH_SIZE):
+            connection.execute(insert(models.Utilisateur), [
+                {"id": n + 1, "login": f"bench-{n}", "email": f"bench-{n}@bench", "password": "-"}
+                for n in range(start, min(start + BATCH_SIZE, nb_users))
+            ])
+        for start in range(0, nb_comptes, BATCH_SIZE):
+            connection.execute(insert(models.Compte), [
+                {"id": n + 1, "nom": random_name(rng, n), "utilisateur_id": n % nb_users + 1}
+                for n in range(start, min(start + BATCH_SIZE, nb_comptes))
+            ])
+        for start in range(0, nb_personnages, BATCH_SIZE):
+            rows = [
+                {"id": n + 1, "nom": random_name(rng, n), "compte_id": n % nb_comptes + 1}
+                for n in range(start, min(start + BATCH_SIZE, nb_personnages))
+            ]
+            connection.execute(insert(models.Personnage), rows)
+            sample.extend(row["nom"] for row in rng.sample(rows, min(10, len(rows))))
+        for start in range(0, nb_objets, BATCH_SIZE):
+            connection.execute(insert(models.Objet), [
+                {"id": n + 1, "nom": random_name(rng, n)} for n in range(start, min(start + BATCH_SIZE, nb_objets))
+            ])
+    return sample
+
+
+def queries(sample: list[str], rng: random.Random) -> dict[str, list[tuple]]:
+    """
+    Cette fonction permet de construire les recherches de chaque mode à partir de noms existants
+    @param sample: list[str]
+    @param rng: random.Random
+    @return dict[str, list[tuple]] (mode -> (recherche, nom d'origine))
+    """
+    prefix, contains, fuzzy = [], [], []
+    for name in sample:
+        syllables = name.split("-")[0]
+        prefix.append((syllables[:4], name))
+        start = rng.randint(0, max(len(syllables) - 4, 0))
+        contains.append((syllables[start:start + 4], name))
+        # une faute de frappe : une lettre remplacée
+        position = rng.randrange(len(syllables))
+        fuzzy.append((syllables[:position] + "e" + syllables[position + 1:], name))
+    return {"prefix": prefix, "contains": contains, "fuzzy": fuzzy}
+
+
+async def measure(args, searches: dict[str, list[tuple]]) -> tuple:
+    """
+    Cette fonction permet de mesurer la durée de chaque recherche (ms) et de compter, par mode, les recherches dont
+    le nom d'origine (aux chiffres près) figure dans la première page
+    @return tuple (dict[str, list[float]], dict[str, int])
+    """
+    timings, found = {}, {}
+    async with database.AsyncSessionLocal() as db:
+        for mode, values in searches.items():
+            timings[mode], found[mode] = [], 0
+            for q, name in values:
+                start = time.perf_counter()
+                results = await service_search.search(db, q, None, mode, args.limit)
+                timings[mode].append((time.perf_counter() - start) * 1000)
+                found[mode] += any(result.nom.split("-")[0] == name.split("-")[0] for result in results)
+        timings["scan (sans index)"] = []
+        for q, _ in searches["contains"][:args.scans]:
+            start = time.perf_counter()
+            # noms des personnages seuls : le parcours d'une table suffit à montrer l'écart
+            await db.execute(
+                select(models.Personnage.id, models.Personnage.nom)
+                .filter(models.Personnage.nom.like("%" + service_search.escape_like(q) + "%", escape="\\"))
+                .limit(args.limit)
+                .order_by(func.length(models.Personnage.nom))
+            )
+            timings["scan (sans index)"].append((time.perf_counter() - start) * 1000)
+    await database.async_engine.dispose()
+    return timings, found
+
+
+def main_benchmark(args):
+    rng = random.Random(args.seed)
+    service_utils.create_database()
+    start = time.perf_counter()
+    sample = seed(args.personnages, args.objets, rng)
+    print(f"remplissage : {args.personnages} personnages, {args.objets} objets en {time.perf_counter() - start:.1f}s")
+    searches = queries(rng.sample(sample, min(args.queries, len(sample))), rng)
+    timings, found = asyncio.run(measure(args, searches))
+    for mode, values in timings.items():
+        ordered = sorted(values)
+        p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+        line = f"{mode:<20} {len(values):>4} recherches : médiane {statistics.median(values):9.2f} ms, p95 {p95:9.2f} ms"
+        if mode in found:
+            line += f", nom d'origine en première page : {found[mode]}/{len(values)}"
+        print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de la recherche par nom (index trigramme)")
+    parser.add_argument("--personnages", type=int, default=1000000, help="nombre de personnages (un compte pour 4, un utilisateur pour 2 comptes)")
+    parser.add_argument("--objets", type=int, default=10000, help="nombre d'objets du catalogue")
+    parser.add_argument("--queries", type=int, default=50, help="nombre de recherches par mode")
+    parser.add_argument("--scans", type=int, default=5, help="nombre de parcours complets mesurés (lents)")
+    parser.add_argument("--limit", type=int, default=20, help="taille de la page")
+    parser.add_argument("--seed", type=int, default=0)
+    main_benchmark(parser.parse_args())
@@ -0,0 +1,79 @@
+# --- Benchmark : sérialisation d'un arbre utilisateur (comptes, personnages, inventaires)
+# Lancer depuis le dossier api/ : python -m benchmarks.bench_serialization --comptes 10 --personnages 10 --objets 20
+# Compare le chemin par défaut de FastAPI (validation du modèle renvoyé, conversion en types JSON puis json.dumps), le même
+# chemin encodé par orjson (JSON_RESPONSE=orjson) et la sérialisation directe d'un modèle déjà validé (json_response),
+# avec et sans ?fields=.
+import argparse
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/bench_serialization.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from pydantic import TypeAdapter
+
+import schemas
+import services.utils as service_utils
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def build_tree(nb_comptes: int, nb_personnages: int, nb_objets: int) -> schemas.Utilisateur:
+    """
+    Cette fonction permet de construire un arbre utilisateur validé
+    @return schemas.Utilisateur
+    """
+    return schemas.Utilisateur.model_validate({
+        "id": 1, "login": "bench", "email": "bench@bench",
+        "comptes": [{
+            "id": c, "nom": f"compte-{c}", "utilisateur_id": 1,
+            "personnages": [{
+                "id": c * 1000 + p, "nom": f"personnage-{c}-{p}", "compte_id": c,
+                "inventaire": [
+                    {"id": (c * 1000 + p) * 100 + o, "personnage_id": c * 1000 + p, "objet_id": o, "objet": f"objet-{o}", "quantite": o + 1}
+                    for o in range(nb_objets)
+                ],
+            } for p in range(nb_personnages)],
+        } for c in range(nb_comptes)],
+    })
+
+
+def main_benchmark(args):
+    user = build_tree(args.comptes, args.personnages, args.objets)
+    adapter = TypeAdapter(schemas.Utilisateur)
+    fields = service_utils.parse_fields(schemas.Utilisateur, "id,login,comptes.nom,comptes.personnages.nom")
+
+    candidates = {
+        # ce que fait FastAPI avec response_model : validation puis dump en types JSON, encodé par la classe de réponse
+        "fastapi + json": lambda: json.dumps(adapter.dump_python(adapter.validate_python(user), mode="json"), ensure_ascii=False, separators=(",", ":")).encode(),
+        "json_response": lambda: service_utils.dump_json(user, schemas.Utilisateur),
+        "json_response + fields": lambda: service_utils.dump_json(user, schemas.Utilisateur, fields),
+    }
+    if orjson is not None:
+        candidates["fastapi + orjson"] = lambda: orjson.dumps(adapter.dump_python(adapter.validate_python(user), mode="json"))
+
+    slots = args.comptes * args.personnages * args.objets
+    for name, func in candidates.items():
+        size = len(func())
+        timings = []
+        for _ in range(args.rounds):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{name:<24} {slots} emplacements, {size / 1000:8.1f} ko : médiane {statistics.median(timings):8.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare les sérialisations d'un arbre utilisateur")
+    parser.add_argument("--comptes", type=int, default=10)
+    parser.add_argument("--personnages", type=int, default=10)
+    parser.add_argument("--objets", type=int, default=20)
+    parser.add_argument("--rounds", type=int, default=20)
+    main_benchmark(parser.parse_args())
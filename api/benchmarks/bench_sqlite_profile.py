@@ -0,0 +1,84 @@
+# --- Benchmark : profil SQLite "default" (réglages d'origine) contre "production" (WAL, PRAGMA, écrivain unique)
+# Lancer depuis le dossier api/ : python -m benchmarks.bench_sqlite_profile --workers 4 --clients 10 --duration 20
+# Pour chaque profil, une base SQLite temporaire est remplie par benchmarks.seed, puis --workers processus benchmarks.load
+# (autant de workers uvicorn) lisent et écrivent en même temps sur ce fichier. Le débit et les erreurs (surtout les 500
+# "database is locked") de chaque processus sont additionnés.
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+
+from benchmarks import load, seed
+
+PROFILES = ("default", "production")
+
+
+def run_profile(profile: str, args) -> dict:
+    """
+    Cette fonction permet de remplir une base neuve avec le profil donné puis de lancer les processus de charge en parallèle
+    @param profile: str
+    @param args: argparse.Namespace
+    @return dict (débit et erreurs par parcours, codes HTTP)
+    """
+    directory = tempfile.mkdtemp()
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{directory}/profile.db", "SQLITE_PROFILE": profile}
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.seed", "--users", str(args.users), "--catalogue", str(args.catalogue)],
+        env=env, capture_output=True, text=True, check=True,
+    ).stdout
+    prefix = re.search(r"préfixe (\S+)\)", output).group(1)
+    mix = ",".join(f"{flow}={weight:g}" for flow, weight in args.mix.items())
+    workers = [
+        subprocess.Popen(
+            [sys.executable, "-m", "benchmarks.load", "--prefix", prefix, "--users", str(args.users),
+             "--catalogue", str(args.catalogue), "--clients", str(args.clients), "--duration", str(args.duration),
+             "--mix", mix, "--seed", str(worker), "--output", f"{directory}/worker-{worker}.json"],
+            env=env, stdout=subprocess.DEVNULL,
+        )
+        for worker in range(args.workers)
+    ]
+    for worker in workers:
+        worker.wait()
+
+    total = {"flows": {}, "statuses": {}}
+    for worker in range(args.workers):
+        with open(f"{directory}/worker-{worker}.json") as file:
+            report = json.load(file)
+        for flow, stats in report["flows"].items():
+            flow_total = total["flows"].setdefault(flow, {"count": 0, "throughput": 0.0, "errors": 0, "p95": 0.0})
+            flow_total["errors"] += stats["errors"]
+            if stats["count"]:
+                flow_total["count"] += stats["count"]
+                flow_total["throughput"] += stats["throughput"]
+                flow_total["p95"] = max(flow_total["p95"], stats["p95"])
+        for code, count in report["statuses"].items():
+            total["statuses"][code] = total["statuses"].get(code, 0) + count
+    return total
+
+
+def main_benchmark(args):
+    for profile in PROFILES:
+        total = run_profile(profile, args)
+        print(f"profil {profile} : {args.workers} processus x {args.clients} clients, {args.duration:g} s")
+        for flow, stats in total["flows"].items():
+            if stats["count"] or stats["errors"]:
+                print(
+                    f"  {flow:<10} {stats['count']:6} parcours {stats['throughput']:8.1f}/s  "
+                    f"p95 (pire processus) {stats['p95']:9.2f} ms  erreurs {stats['errors']}"
+                )
+        print("  codes HTTP : " + ", ".join(f"{code} x{count}" for code, count in sorted(total["statuses"].items())))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark des profils SQLite (lectures et écritures concurrentes de plusieurs processus)")
+    parser.add_argument("--workers", type=int, default=4, help="nombre de processus qui partagent la base")
+    parser.add_argument("--clients", type=int, default=10, help="clients concurrents par processus")
+    parser.add_argument("--duration", type=float, default=20, help="durée de la mesure en secondes")
+    parser.add_argument("--users", type=int, default=100, help="nombre d'utilisateurs")
+    parser.add_argument("--catalogue", type=int, default=100, help="taille du catalogue d'objets")
+    parser.add_argument("--mix", type=load.parse_mix, default=load.parse_mix("sheet=5,waterfall=1,inventory=4"),
+                        help="poids des parcours (lectures : sheet, waterfall ; écritures : inventory)")
+    main_benchmark(parser.parse_args())
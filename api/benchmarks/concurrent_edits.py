@@ -0,0 +1,125 @@
+# --- Vérification des modifications concurrentes de l'inventaire (concurrence optimiste, colonne version)
+# Lancer depuis le dossier api/ : python -m benchmarks.concurrent_edits --clients 20 --increments 10
+# Chaque client lit un emplacement puis écrit quantite + 1 avec la version lue, et recommence sur une erreur 409.
+# Deux scénarios : tous les clients sur le même emplacement (conflits attendus, aucune écriture perdue) puis chaque client
+# sur son propre personnage (aucun conflit). Avec --no-version les écritures ne sont pas conditionnelles : les écritures
+# perdues sont comptées. Le script échoue (code de sortie 1) si la quantité finale ne correspond pas au nombre d'incréments.
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/concurrent_edits.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.makedirs("static", exist_ok=True)
+
+import httpx
+
+import database, models, tasks
+import services.utils as service_utils
+
+
+def seed(nb_personnages: int) -> tuple:
+    """
+    Cette fonction permet de créer un utilisateur, un compte et nb_personnages personnages possédant chacun un objet
+    @param nb_personnages: int
+    @return tuple (login, mot de passe, id utilisateur, id compte, ids des personnages, nom de l'objet)
+    """
+    password = "benchmark"
+    with database.SessionLocal() as db:
+        user = models.Utilisateur(login=uuid.uuid4().hex, email=f"{uuid.uuid4().hex}@bench", password=tasks.get_password_hash(password))
+        compte = models.Compte(nom=uuid.uuid4().hex, utilisateur=user)
+        objet = models.Objet(nom=uuid.uuid4().hex)
+        personnages = [models.Personnage(nom=uuid.uuid4().hex, compte=compte) for _ in range(nb_personnages)]
+        for personnage in personnages:
+            models.Inventaire(objet_catalogue=objet, quantite=0, personnage=personnage)
+        db.add(user)
+        db.commit()
+        return user.login, password, user.id, compte.id, [personnage.id for personnage in personnages], objet.nom
+
+
+async def increment(client: httpx.AsyncClient, url: str, objet: str, increments: int, versioned: bool) -> int:
+    """
+    Cette fonction permet d'incrémenter increments fois la quantité d'un objet par lecture puis écriture
+    @param client: httpx.AsyncClient
+    @param url: str (inventaire du personnage)
+    @param objet: str
+    @param increments: int
+    @param versioned: bool (envoyer la version lue)
+    @return int (nombre de conflits 409)
+    """
+    conflicts = 0
+    done = 0
+    while done < increments:
+        slot = next(slot for slot in (await client.get(url)).json() if slot["objet"] == objet)
+        body = {"objet": objet, "quantite": slot["quantite"] + 1}
+        if versioned:
+            body["version"] = slot["version"]
+        response = await client.put(url, json=body)
+        if response.status_code == 409:
+            conflicts += 1
+            continue
+        response.raise_for_status()
+        done += 1
+    return conflicts
+
+
+async def scenario(client: httpx.AsyncClient, urls: list[str], objet: str, args) -> dict:
+    """
+    Cette fonction permet de lancer les clients concurrents (client i sur urls[i % len(urls)]) et de relire les quantités finales
+    @param client: httpx.AsyncClient
+    @param urls: list[str]
+    @param objet: str
+    @param args: argparse.Namespace
+    @return dict (attendu, obtenu, conflits, durée)
+    """
+    start = time.perf_counter()
+    conflicts = await asyncio.gather(*(
+        increment(client, urls[index % len(urls)], objet, args.increments, not args.no_version) for index in range(args.clients)
+    ))
+    duration = time.perf_counter() - start
+    total = 0
+    for url in urls:
+        total += next(slot["quantite"] for slot in (await client.get(url)).json() if slot["objet"] == objet)
+    return {"expected": args.clients * args.increments, "total": total, "conflicts": sum(conflicts), "duration": duration}
+
+
+async def run(args) -> int:
+    import main
+
+    service_utils.create_database()
+    login, password, user_id, compte_id, personnage_ids, objet = seed(args.clients + 1)
+    base = f"/user/{user_id}/compte/{compte_id}/personnage/{{}}/inventaire/"
+
+    failures = 0
+    # ASGITransport n'envoie pas les évènements de démarrage et d'arrêt : la lifespan est lancée ici
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark", timeout=60) as client:
+            token = (await client.post("/token/", data={"username": login, "password": password})).json()["access_token"]
+            client.headers["Authorization"] = f"Bearer {token}"
+            scenarios = {
+                "même emplacement": [base.format(personnage_ids[0])],
+                "emplacements distincts": [base.format(personnage_id) for personnage_id in personnage_ids[1:]],
+            }
+            for name, urls in scenarios.items():
+                result = await scenario(client, urls, objet, args)
+                lost = result["expected"] - result["total"]
+                status = "OK" if lost == 0 else "ÉCRITURES PERDUES"
+                failures += lost != 0
+                print(
+                    f"{name:<24} attendu {result['expected']:>6}  obtenu {result['total']:>6}  perdues {lost:>5}  "
+                    f"conflits 409 {result['conflicts']:>6}  {result['duration']:.2f}s  {status}"
+                )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vérification des modifications concurrentes de l'inventaire")
+    parser.add_argument("--clients", type=int, default=20, help="nombre de clients concurrents")
+    parser.add_argument("--increments", type=int, default=10, help="nombre d'incréments par client")
+    parser.add_argument("--no-version", action="store_true", help="écritures sans version (dernière écriture gagnante)")
+    sys.exit(asyncio.run(run(parser.parse_args())))
@@ -0,0 +1,165 @@
+# --- Vérification de la synchronisation incrémentale (GET /changes/) contre le rechargement complet de l'arbre
+# Lancer depuis le dossier api/ : python -m benchmarks.delta_sync --comptes 5 --personnages 50 --objets 10 --edits 50
+# Un utilisateur est créé par benchmarks.seed. Le client lit le curseur puis l'arbre complet (/user/me/) et en garde une copie
+# locale à plat ; des modifications aléatoires sont faites (inventaire, lots, noms, créations et suppressions de comptes et
+# de personnages, en une requête ou en arrière-plan), puis la copie est mise à jour par /changes/. Le script échoue (code de
+# sortie 1) si la copie diffère de l'arbre rechargé ; il compare la taille et la durée des deux façons de se synchroniser.
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/delta_sync.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.makedirs("static", exist_ok=True)
+
+from fastapi.testclient import TestClient
+
+import main
+from benchmarks import seed
+
+# type de ligne -> (relation qui contient les lignes filles dans l'arbre, type des lignes filles, colonne vers le parent)
+CHILDREN = {
+    "utilisateur": ("comptes", "compte", "utilisateur_id"),
+    "compte": ("personnages", "personnage", "compte_id"),
+    "personnage": ("inventaire", "inventaire", "personnage_id"),
+}
+
+
+def flatten(tree: dict) -> dict:
+    """
+    Cette fonction permet de mettre à plat l'arbre renvoyé par /user/me/ : (type, id) -> ligne sans ses relations
+    @param tree: dict
+    @return dict
+    """
+    rows = {}
+
+    def visit(kind: str, node: dict):
+        relation, child_kind, _ = CHILDREN.get(kind, (None, None, None))
+        rows[(kind, node["id"])] = {key: value for key, value in node.items() if key != relation}
+        for child in node.get(relation, []) if relation else []:
+            visit(child_kind, child)
+
+    visit("utilisateur", tree)
+    return rows
+
+
+def apply_changes(rows: dict, changes: list[dict]):
+    """
+    Cette fonction permet d'appliquer des changements à la copie locale ; une suppression retire aussi les descendants
+    @param rows: dict
+    @param changes: list[dict]
+    @return None
+    """
+    for change in changes:
+        key = (change["type"], change["id"])
+        if change["operation"] != "delete":
+            rows[key] = change["data"]
+            continue
+        removed = [key]
+        while removed:
+            kind, node_id = removed.pop()
+            rows.pop((kind, node_id), None)
+            if kind in CHILDREN:
+                _, child_kind, parent = CHILDREN[kind]
+                removed.extend(k for k, row in rows.items() if k[0] == child_kind and row[parent] == node_id)
+
+
+def edit(client: TestClient, headers: dict, rows: dict, rng: random.Random, user_id: int, catalogue: list[str]):
+    """
+    Cette fonction permet de faire une modification aléatoire de l'arbre de l'utilisateur, comme le ferait un client
+    @return None
+    """
+    comptes = [row for (kind, _), row in rows.items() if kind == "compte"]
+    personnages = [row for (kind, _), row in rows.items() if kind == "personnage"]
+    compte = rng.choice(comptes)
+    personnage = rng.choice(personnages)
+    base = f"/user/{user_id}/compte/{personnage['compte_id']}/personnage/{personnage['id']}"
+    action = rng.choices(["add", "batch", "rename", "create", "delete"], weights=[6, 2, 1, 1, 1])[0]
+    if action == "add":
+        response = client.post(f"{base}/inventaire/", json={"objet": rng.choice(catalogue), "quantite": rng.randint(1, 5)}, headers=headers)
+    elif action == "batch":
+        slots = [row for (kind, _), row in rows.items() if kind == "inventaire" and row["personnage_id"] == personnage["id"]]
+        operations = [{"action": "add", "objet": rng.choice(catalogue)}]
+        if slots:
+            slot = rng.choice(slots)
+            operations.append({"action": rng.choice(["update", "remove"]), "id": slot["id"], "quantite": rng.randint(0, 9)})
+        response = client.post(f"{base}/inventaire/batch/", json={"operations": operations}, headers=headers)
+    elif action == "rename":
+        response = client.put(f"/user/{user_id}/compte/{compte['id']}", json={"nom": f"{compte['nom']}-{rng.randrange(10**6)}"}, headers=headers)
+    elif action == "create":
+        response = client.post(f"/user/{user_id}/compte/{compte['id']}/personnage/", json={"nom": f"delta-{time.time_ns()}"}, headers=headers)
+    else:
+        response = client.delete(base, params={"mode": rng.choice(["sync", "async"])}, headers=headers)
+    response.raise_for_status()
+
+
+def main_check(args) -> int:
+    seeded = seed.seed(1, args.comptes, args.personnages, args.objets, max(args.objets, 10))
+    catalogue = [f"{seeded['prefix']}-objet-{n}" for n in range(max(args.objets, 10))]
+    rng = random.Random(args.seed)
+    with TestClient(main.app) as client:
+        token = client.post("/token/", data={"username": f"{seeded['logins'][0]}@bench", "password": seed.PASSWORD}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        # le curseur est lu avant l'arbre : un changement fait entre les deux est renvoyé une fois de plus, sans effet
+        cursor = client.get("/changes/", headers=headers).json()["cursor"]
+        tree = client.get("/user/me/", headers=headers).json()
+        local = flatten(tree)
+        for _ in range(args.edits):
+            edit(client, headers, local, rng, tree["id"], catalogue)
+            # la copie locale suit les modifications pour que les suivantes visent des lignes existantes
+            page = client.get("/changes/", params={"since": cursor}, headers=headers).json()
+            apply_changes(local, page["changes"])
+            cursor = page["cursor"]
+
+        # synchronisation mesurée : toutes les modifications de --edits requêtes, rattrapées en une fois
+        remote = flatten(client.get("/user/me/", headers=headers).json())
+        for _ in range(args.edits):
+            edit(client, headers, remote, rng, tree["id"], catalogue)
+            remote = flatten(client.get("/user/me/", headers=headers).json())
+        start = time.perf_counter()
+        delta_bytes, pages = 0, 0
+        while True:
+            response = client.get("/changes/", params={"since": cursor}, headers=headers)
+            page = response.json()
+            delta_bytes += len(response.content)
+            pages += 1
+            apply_changes(local, page["changes"])
+            cursor = page["cursor"]
+            if not page["has_more"]:
+                break
+        delta_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        response = client.get("/user/me/", headers=headers)
+        full_ms = (time.perf_counter() - start) * 1000
+        expected = flatten(response.json())
+
+    # la date de dernière connexion est écrite en différé (LAST_LOGIN_FLUSH_INTERVAL) : elle n'est pas comparée
+    for rows in (local, expected):
+        rows[("utilisateur", tree["id"])].pop("date_derniere_connexion", None)
+    missing = expected.keys() - local.keys()
+    extra = local.keys() - expected.keys()
+    different = [key for key in expected.keys() & local.keys() if expected[key] != local[key]]
+    ok = not (missing or extra or different)
+    print(f"arbre : {len(expected)} lignes, {2 * args.edits} modifications")
+    print(f"rechargement complet (/user/me/) : {len(response.content):>10} octets  {full_ms:8.1f} ms")
+    print(f"changements (/changes/, {pages} page(s)) : {delta_bytes:>10} octets  {delta_ms:8.1f} ms")
+    print(
+        f"{'OK  ' if ok else 'FAIL'} copie locale synchronisée : {len(missing)} lignes manquantes, {len(extra)} en trop, "
+        f"{len(different)} différentes" + (f" (ex : {json.dumps([str(key) for key in (missing or extra or different)][:3])})" if not ok else "")
+    )
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vérification de la synchronisation incrémentale")
+    parser.add_argument("--comptes", type=int, default=5, help="comptes de l'utilisateur")
+    parser.add_argument("--personnages", type=int, default=50, help="personnages par compte")
+    parser.add_argument("--objets", type=int, default=10, help="objets différents par personnage")
+    parser.add_argument("--edits", type=int, default=50, help="modifications de chaque phase")
+    parser.add_argument("--seed", type=int, default=0)
+    sys.exit(main_check(parser.parse_args()))
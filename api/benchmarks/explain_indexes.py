@@ -0,0 +1,64 @@
+# --- Vérification des plans d'exécution des recherches fréquentes
+# Lancer depuis le dossier api/ : python -m benchmarks.explain_indexes
+# Le script applique les migrations puis échoue (code de sortie 1) si une recherche parcourt toute sa table au lieu d'un index.
+# Sur PostgreSQL, enable_seqscan est désactivé : on vérifie qu'un index est utilisable, même sur une table presque vide.
+import os
+import sys
+import tempfile
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/explain_indexes.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import select, text
+
+import database, models
+import services.utils as service_utils
+
+# --- Recherches faites par services/user.py (et chargement des relations)
+HOT_LOOKUPS = {
+    "Utilisateur par email": select(models.Utilisateur).filter(models.Utilisateur.email == "a@a"),
+    "Comptes d'un utilisateur": select(models.Compte).filter(models.Compte.utilisateur_id == 1),
+    "Personnages d'un compte": select(models.Personnage).filter(models.Personnage.compte_id == 1),
+    "Inventaire d'un personnage": select(models.Inventaire).filter(models.Inventaire.personnage_id == 1),
+    "Emplacement (personnage, objet)": select(models.Inventaire).filter(
+        models.Inventaire.personnage_id == 1, models.Inventaire.objet_id == 1
+    ),
+    "Personnages possédant un objet": select(models.Inventaire.personnage_id).filter(models.Inventaire.objet_id == 1),
+    "Objet par nom": select(models.Objet).filter(models.Objet.nom == "epee"),
+    "Changements après un curseur": select(models.Changement).filter(
+        models.Changement.utilisateur_id == 1, models.Changement.id > 100
+    ).order_by(models.Changement.id),
+}
+
+
+def explain(connection, statement) -> tuple[bool, str]:
+    """
+    Cette fonction permet de récupérer le plan d'exécution d'une requête et de savoir s'il utilise un index
+    @param connection: Connection
+    @param statement: Select
+    @return tuple (utilise un index, plan lisible)
+    """
+    sql = str(statement.compile(connection, compile_kwargs={"literal_binds": True}))
+    if connection.dialect.name == "sqlite":
+        plan = [row[3] for row in connection.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+        return all(not line.startswith("SCAN") for line in plan), " / ".join(plan)
+    plan = [row[0] for row in connection.execute(text(f"EXPLAIN {sql}"))]
+    return not any("Seq Scan" in line for line in plan), " / ".join(line.strip() for line in plan)
+
+
+def main_check() -> int:
+    service_utils.create_database()
+    failures = 0
+    with database.engine.connect() as connection:
+        if connection.dialect.name == "postgresql":
+            connection.execute(text("SET enable_seqscan = off"))
+        for name, statement in HOT_LOOKUPS.items():
+            uses_index, plan = explain(connection, statement)
+            failures += not uses_index
+            print(f"{'OK  ' if uses_index else 'FAIL'} {name:<34} {plan}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
@@ -0,0 +1,54 @@
+# --- Vérification : mémoire utilisée par l'export en flux selon le nombre de lignes
+# Lancer depuis le dossier api/ : python -m benchmarks.export_memory --users 200 2000
+# Pour chaque taille, la base est remplie par benchmarks.seed puis l'export complet est lu ; le pic de mémoire Python
+# (tracemalloc) doit rester du même ordre quelle que soit la taille, contrairement à /users/ qui construit toute la liste.
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/export_memory.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from benchmarks import seed
+import services.export as service_export
+
+
+async def consume(format: str) -> tuple:
+    lines = size = 0
+    async for chunk in service_export.EXPORTERS[format]():
+        lines += chunk.count("\n")
+        size += len(chunk)
+    return lines, size
+
+
+def main_benchmark(args):
+    total = 0
+    for users in args.users:
+        # la base grandit à chaque étape : l'export lit toutes les lignes créées jusque-là
+        total += users
+        seed.seed(users, args.comptes, args.personnages, args.objets, args.catalogue)
+        for format in service_export.EXPORTERS:
+            tracemalloc.start()
+            start = time.perf_counter()
+            lines, size = asyncio.run(consume(format))
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(
+                f"{total:6} utilisateurs {format:<6} {lines:8} lignes {size / 1e6:8.1f} Mo en {elapsed:6.2f} s, "
+                f"pic mémoire {peak / 1e6:6.2f} Mo"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mesure le pic de mémoire de l'export en flux selon le nombre de lignes")
+    parser.add_argument("--users", type=int, nargs="+", default=[200, 2000], help="utilisateurs ajoutés à chaque étape")
+    parser.add_argument("--comptes", type=int, default=2)
+    parser.add_argument("--personnages", type=int, default=3)
+    parser.add_argument("--objets", type=int, default=5)
+    parser.add_argument("--catalogue", type=int, default=100)
+    main_benchmark(parser.parse_args())
@@ -0,0 +1,277 @@
+# --- Test de charge : parcours utilisateurs concurrents contre l'application complète
+# Lancer depuis le dossier api/ : python -m benchmarks.load --users 200 --clients 20 --duration 30
+# Par défaut l'application est appelée en mémoire (ASGI) sur une base SQLite temporaire remplie par benchmarks.seed.
+# Avec --base-url, un serveur déjà lancé est ciblé (la base DATABASE_URL de ce serveur doit être remplie par benchmarks.seed
+# avec le même --prefix).
+# Les résultats (débit et percentiles par parcours et par étape) sont écrits en JSON pour être comparés entre commits.
+import argparse
+import asyncio
+import datetime
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.makedirs("static", exist_ok=True)
+
+import httpx
+
+from benchmarks import seed
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+FLOWS = ("login", "sheet", "waterfall", "inventory")
+
+
+class Recorder:
+    """
+    Cette classe permet de mesurer la durée des parcours et de chacune de leurs étapes
+    """
+
+    def __init__(self):
+        self.flows = {flow: [] for flow in FLOWS}
+        self.steps = {}
+        self.errors = {flow: 0 for flow in FLOWS}
+        self.statuses = {}
+
+    async def request(self, client: httpx.AsyncClient, step: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        Cette fonction permet d'envoyer une requête en mesurant sa durée sous le nom step
+        @param client: httpx.AsyncClient
+        @param step: str
+        @param method: str
+        @param url: str
+        @return httpx.Response
+        """
+        start = time.perf_counter()
+        response = await client.request(method, url, **kwargs)
+        self.steps.setdefault(step, []).append((time.perf_counter() - start) * 1000)
+        self.statuses[str(response.status_code)] = self.statuses.get(str(response.status_code), 0) + 1
+        response.raise_for_status()
+        return response
+
+
+def summary(timings: list[float], duration: float) -> dict:
+    """
+    Cette fonction permet de résumer une série de durées (ms)
+    @param timings: list[float]
+    @param duration: float (durée de la mesure en secondes)
+    @return dict
+    """
+    if not timings:
+        return {"count": 0}
+    ordered = sorted(timings)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))], 3)
+
+    return {
+        "count": len(ordered),
+        "throughput": round(len(ordered) / duration, 2),
+        "mean": round(statistics.fmean(ordered), 3),
+        "p50": percentile(50),
+        "p90": percentile(90),
+        "p95": percentile(95),
+        "p99": percentile(99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+# --- Parcours
+
+async def login(client, recorder, session):
+    await recorder.request(client, "POST /token/", "POST", "/token/", data={"username": session["login"], "password": seed.PASSWORD})
+
+
+async def sheet(client, recorder, session):
+    # la lecture faite par InfoPersoContainer.astro : un seul appel
+    await recorder.request(client, "GET /user/me/", "GET", "/user/me/", headers=session["headers"])
+
+
+async def waterfall(client, recorder, session):
+    # la même lecture faite route par route : utilisateur, comptes, personnages puis inventaires
+    headers = session["headers"]
+    user = (await recorder.request(client, "GET /user/me/", "GET", "/user/me/", headers=headers)).json()
+    base = f"/user/{user['id']}"
+    comptes = (await recorder.request(client, "GET comptes", "GET", f"{base}/comptes/", headers=headers)).json()
+    for compte in comptes:
+        personnages = (await recorder.request(
+            client, "GET personnages", "GET", f"{base}/compte/{compte['id']}/personnages/", headers=headers
+        )).json()
+        for personnage in personnages:
+            await recorder.request(
+                client, "GET inventaire", "GET",
+                f"{base}/compte/{compte['id']}/personnage/{personnage['id']}/inventaire/", headers=headers
+            )
+
+
+async def inventory(client, recorder, session):
+    # ajout d'un objet, modification de sa quantité puis lot de quelques ajouts sur un personnage au hasard
+    headers = session["headers"]
+    base = random.choice(session["inventaires"])
+    objet = random.choice(session["catalogue"])
+    await recorder.request(client, "POST inventaire", "POST", base, json={"objet": objet}, headers=headers)
+    await recorder.request(
+        client, "PUT inventaire", "PUT", base, json={"objet": objet, "quantite": random.randint(1, 20)}, headers=headers
+    )
+    operations = [{"action": "add", "objet": nom} for nom in random.sample(session["catalogue"], 5)]
+    await recorder.request(client, "POST inventaire/batch", "POST", f"{base}batch/", json={"operations": operations}, headers=headers)
+
+
+FLOW_FUNCTIONS = {"login": login, "sheet": sheet, "waterfall": waterfall, "inventory": inventory}
+
+
+# --- Exécution
+
+async def open_session(client: httpx.AsyncClient, login_name: str, catalogue: list[str]) -> dict:
+    """
+    Cette fonction permet de connecter un client et de récupérer les chemins de ses inventaires
+    @param client: httpx.AsyncClient
+    @param login_name: str
+    @param catalogue: list[str]
+    @return dict
+    """
+    response = await client.post("/token/", data={"username": login_name, "password": seed.PASSWORD})
+    response.raise_for_status()
+    headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+    response = await client.get("/user/me/", headers=headers)
+    response.raise_for_status()
+    user = response.json()
+    inventaires = [
+        f"/user/{user['id']}/compte/{compte['id']}/personnage/{personnage['id']}/inventaire/"
+        for compte in user["comptes"] for personnage in compte["personnages"]
+    ]
+    return {"login": login_name, "headers": headers, "inventaires": inventaires, "catalogue": catalogue}
+
+
+async def virtual_client(client, recorder, session, mix, deadline, rng):
+    flows, weights = zip(*mix.items())
+    while time.perf_counter() < deadline:
+        flow = rng.choices(flows, weights)[0]
+        start = time.perf_counter()
+        try:
+            await FLOW_FUNCTIONS[flow](client, recorder, session)
+        except httpx.HTTPError:
+            recorder.errors[flow] += 1
+            continue
+        recorder.flows[flow].append((time.perf_counter() - start) * 1000)
+
+
+async def run(args, logins: list[str], catalogue: list[str]) -> dict:
+    if args.base_url:
+        transport, base_url, lifespan = None, args.base_url, None
+    else:
+        import main
+        # une exception de l'application devient une réponse 500, comptée comme une erreur (comme avec un vrai serveur)
+        transport, base_url = httpx.ASGITransport(app=main.app, raise_app_exceptions=False), "http://benchmark"
+        # ASGITransport n'envoie pas les évènements de démarrage et d'arrêt : la lifespan est lancée ici
+        lifespan = main.app.router.lifespan_context(main.app)
+
+    if lifespan is not None:
+        await lifespan.__aenter__()
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url=base_url, timeout=60) as client:
+            rng = random.Random(args.seed)
+            sessions = await asyncio.gather(*(
+                open_session(client, logins[n % len(logins)], catalogue) for n in range(args.clients)
+            ))
+            recorder = Recorder()
+            start = time.perf_counter()
+            deadline = start + args.duration
+            await asyncio.gather(*(
+                virtual_client(client, recorder, session, args.mix, deadline, random.Random(rng.random()))
+                for session in sessions
+            ))
+            duration = time.perf_counter() - start
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+
+    return {
+        "duration": round(duration, 3),
+        "flows": {flow: {**summary(recorder.flows[flow], duration), "errors": recorder.errors[flow]} for flow in FLOWS},
+        "steps": {step: summary(timings, duration) for step, timings in sorted(recorder.steps.items())},
+        "statuses": recorder.statuses,
+    }
+
+
+def git_commit() -> str | None:
+    """
+    Cette fonction permet de récupérer le commit courant pour identifier les résultats
+    @return str | None
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_mix(value: str) -> dict:
+    mix = {}
+    for part in value.split(","):
+        flow, _, weight = part.partition("=")
+        if flow not in FLOWS:
+            raise argparse.ArgumentTypeError(f"parcours inconnu : {flow} (parmi {', '.join(FLOWS)})")
+        mix[flow] = float(weight or 1)
+    return mix
+
+
+def main_benchmark(args):
+    if args.base_url and not args.prefix:
+        raise SystemExit("--prefix est obligatoire avec --base-url (préfixe affiché par benchmarks.seed)")
+    if args.prefix:
+        prefix = args.prefix
+        logins = [f"{prefix}-u{n}" for n in range(args.users)]
+    else:
+        seeded = seed.seed(args.users, args.comptes, args.personnages, args.objets, args.catalogue)
+        prefix, logins = seeded["prefix"], seeded["logins"]
+    catalogue = [f"{prefix}-objet-{n}" for n in range(max(args.catalogue, args.objets))]
+
+    results = asyncio.run(run(args, logins, catalogue))
+    report = {
+        "commit": git_commit(),
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "target": args.base_url or "asgi",
+        "database": os.environ["DATABASE_URL"].split(":", 1)[0] if not args.base_url else None,
+        "config": {
+            "users": args.users, "comptes": args.comptes, "personnages": args.personnages, "objets": args.objets,
+            "catalogue": args.catalogue, "clients": args.clients, "duration": args.duration, "mix": args.mix, "seed": args.seed,
+        },
+        **results,
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{report['commit'] or 'local'}-{int(time.time())}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(report, file, indent=2)
+
+    for flow, stats in report["flows"].items():
+        if stats["count"]:
+            print(
+                f"{flow:<10} {stats['count']:6} parcours {stats['throughput']:8.1f}/s  p50 {stats['p50']:8.2f} ms  "
+                f"p95 {stats['p95']:8.2f} ms  p99 {stats['p99']:8.2f} ms  erreurs {stats['errors']}"
+            )
+    print(f"résultats écrits dans {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test de charge de l'application par parcours utilisateurs concurrents")
+    seed.add_arguments(parser)
+    parser.add_argument("--clients", type=int, default=20, help="nombre de clients concurrents")
+    parser.add_argument("--duration", type=float, default=30, help="durée de la mesure en secondes")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("login=1,sheet=5,waterfall=2,inventory=2"),
+                        help="poids des parcours, ex. login=1,sheet=5,waterfall=2,inventory=2")
+    parser.add_argument("--seed", type=int, default=0, help="graine du tirage des parcours")
+    parser.add_argument("--base-url", help="URL d'un serveur déjà lancé (par défaut l'application est appelée en mémoire)")
+    parser.add_argument("--prefix", help="préfixe d'un jeu de données déjà créé par benchmarks.seed")
+    parser.add_argument("--output", help="fichier JSON des résultats (par défaut benchmarks/results/<commit>-<horodatage>.json)")
+    main_benchmark(parser.parse_args())
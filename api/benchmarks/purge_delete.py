@@ -0,0 +1,187 @@
+# --- Vérification des suppressions en arrière-plan (DELETE ...?mode=async, services.purge)
+# Lancer depuis le dossier api/ : python -m benchmarks.purge_delete --comptes 10 --personnages 500 --objets 5
+# Trois utilisateurs sont créés par benchmarks.seed. Le premier est supprimé en une requête (mode sync), le second en
+# arrière-plan (mode async) ; pendant chaque suppression, le troisième ajoute des objets à son inventaire en boucle et la
+# latence de ces écritures mesure le blocage de l'écrivain. Le script échoue (code de sortie 1) si l'utilisateur supprimé en
+# arrière-plan reste visible après la réponse 202, si son avancement est lisible par un autre utilisateur, si la purge ne se
+# termine pas, s'il reste des lignes orphelines, si le troisième utilisateur a perdu des lignes ou si un index de recherche
+# SQLite (FTS5) n'est plus cohérent.
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/purge_delete.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.makedirs("static", exist_ok=True)
+
+import httpx
+from sqlalchemy import select
+
+import database, models
+import main
+import services.purge as service_purge
+from benchmarks import seed
+from benchmarks.cascade_delete import orphans, tree_counts, search_index_errors
+
+
+async def probe_writes(client: httpx.AsyncClient, url: str, headers: dict, objet: str, stop: asyncio.Event) -> list[float]:
+    """
+    Cette fonction permet d'ajouter un objet à un inventaire en boucle jusqu'à stop, et de mesurer chaque écriture (ms)
+    @param client: httpx.AsyncClient
+    @param url: str (inventaire du personnage)
+    @param headers: dict
+    @param objet: str
+    @param stop: asyncio.Event
+    @return list[float]
+    """
+    timings = []
+    while not stop.is_set():
+        start = time.perf_counter()
+        response = await client.post(url, json={"objet": objet, "quantite": 1}, headers=headers)
+        response.raise_for_status()
+        timings.append((time.perf_counter() - start) * 1000)
+        await asyncio.sleep(0.005)
+    return timings
+
+
+async def timed_delete(client, url: str, headers: dict, probe: tuple, accepted=None) -> tuple:
+    """
+    Cette fonction permet de supprimer une ligne pendant les écritures du troisième utilisateur ; en arrière-plan (réponse 202),
+    accepted est appelé aussitôt puis l'avancement est lu jusqu'à la fin de la purge (en base : la purge d'un utilisateur
+    n'a pas d'URL de suivi, son token n'est plus valide)
+    @return tuple (réponse, durée de la requête en ms, durée totale en ms, latences des écritures, avancements lus)
+    """
+    stop = asyncio.Event()
+    writes = asyncio.create_task(probe_writes(client, *probe, stop))
+    await asyncio.sleep(0.2)
+    start = time.perf_counter()
+    response = await client.delete(url, headers=headers)
+    request_duration = (time.perf_counter() - start) * 1000
+    progress = []
+    if response.status_code == 202:
+        if accepted is not None:
+            await accepted()
+        while True:
+            async with database.AsyncSessionLocal() as db:
+                purge = (await service_purge.get_purge(db, response.json()["id"])).model_dump(mode="json")
+            progress.append(purge)
+            if purge["statut"] == "done":
+                break
+            await asyncio.sleep(0.2)
+    total_duration = (time.perf_counter() - start) * 1000
+    await asyncio.sleep(0.2)
+    stop.set()
+    return response, request_duration, total_duration, await writes, progress
+
+
+def describe(timings: list[float]) -> str:
+    ordered = sorted(timings)
+    p95 = ordered[min(int(len(ordered) * 0.95), len(ordered) - 1)]
+    return f"{len(timings)} écritures, médiane {statistics.median(timings):7.1f} ms, p95 {p95:7.1f} ms, max {ordered[-1]:7.1f} ms"
+
+
+async def run(args, users: list[tuple]) -> int:
+    (sync_id, sync_login), (async_id, async_login), (probe_id, probe_login) = users
+    failures = 0
+
+    def check(label: str, ok: bool, detail: str):
+        nonlocal failures
+        failures += not ok
+        print(f"{'OK  ' if ok else 'FAIL'} {label:<48} {detail}")
+
+    # ASGITransport n'envoie pas les évènements de démarrage et d'arrêt : la lifespan (et donc la purge) est lancée ici
+    lifespan = main.app.router.lifespan_context(main.app)
+    await lifespan.__aenter__()
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://benchmark", timeout=600) as client:
+            async def login_headers(name: str) -> dict:
+                response = await client.post("/token/", data={"username": f"{name}@bench", "password": seed.PASSWORD})
+                return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+            probe_headers = await login_headers(probe_login)
+            compte = (await client.get(f"/user/{probe_id}/comptes/", params={"fields": "id,personnages.id"})).json()[0]
+            probe_url = f"/user/{probe_id}/compte/{compte['id']}/personnage/{compte['personnages'][0]['id']}/inventaire/"
+            probe = (probe_url, probe_headers, f"purge-{time.time_ns()}")
+
+            response, request_ms, _, writes, _ = await timed_delete(client, f"/user/{sync_id}", await login_headers(sync_login), probe)
+            check("suppression en une requête (mode=sync)", response.status_code == 200, f"HTTP {response.status_code} en {request_ms:.1f} ms")
+            print(f"     écritures concurrentes : {describe(writes)}")
+
+            async_headers = await login_headers(async_login)
+            compte_nom = (await client.get(f"/user/{async_id}/comptes/", params={"fields": "nom"})).json()[0]["nom"]
+
+            async def check_hidden():
+                # la purge vient de commencer : l'utilisateur marqué et son arbre ne sont déjà plus lus nulle part
+                users_page = (await client.get("/users/", params={"flat": True, "limit": 1000}, headers=probe_headers)).json()
+                found = (await client.get("/search/", params={"q": compte_nom, "type": "compte"}, headers=probe_headers)).json()
+                check(
+                    "utilisateur caché dès la réponse 202",
+                    all(user["id"] != async_id for user in users_page)
+                    and (await client.get(f"/user/{async_id}/comptes/")).status_code == 404
+                    and (await client.get("/user/me/", headers=async_headers)).status_code == 401
+                    and not found,
+                    "absent de /users/, /search/, /user/{id}/comptes/ et token refusé",
+                )
+
+            response, request_ms, total_ms, writes, progress = await timed_delete(
+                client, f"/user/{async_id}?mode=async", async_headers, probe, accepted=check_hidden
+            )
+            check(
+                "suppression en arrière-plan (mode=async)", response.status_code == 202 and "Location" not in response.headers,
+                f"HTTP {response.status_code} en {request_ms:.1f} ms, purge terminée en {total_ms:.0f} ms "
+                f"({len(progress)} lectures de l'avancement)",
+            )
+            print(f"     écritures concurrentes : {describe(writes)}")
+            purge_url = f"/purges/{response.json()['id']}"
+            statuses = ((await client.get(purge_url)).status_code, (await client.get(purge_url, headers=probe_headers)).status_code)
+            check("avancement réservé au propriétaire", statuses == (401, 404), f"sans token : {statuses[0]}, autre utilisateur : {statuses[1]}")
+            if progress:
+                first, last = progress[0], progress[-1]
+                print(f"     avancement : {first['lignes_supprimees']} lignes, restantes {first['restantes']} -> "
+                      f"{last['lignes_supprimees']} lignes, {last['statut']}")
+                check("purge terminée", last["statut"] == "done" and not last["restantes"], str(last))
+    finally:
+        await lifespan.__aexit__(None, None, None)
+
+    with database.engine.connect() as connection:
+        remaining = {user_id: tree_counts(connection, user_id) for user_id in (sync_id, async_id)}
+        counts = orphans(connection)
+        index_errors = search_index_errors(connection)
+        probe_after = tree_counts(connection, probe_id)
+        users_left = connection.scalars(select(models.Utilisateur.id).filter(models.Utilisateur.id.in_((sync_id, async_id)))).all()
+    check("arbres supprimés", not users_left and not any(any(c.values()) for c in remaining.values()), str(remaining))
+    # le troisième utilisateur garde tout son arbre, plus l'objet ajouté en boucle
+    check("arbre de l'autre utilisateur", probe_after == args.expected_probe, f"{probe_after} (attendu {args.expected_probe})")
+    check("lignes orphelines", not any(counts.values()), str(counts))
+    check("index de recherche", not index_errors, "; ".join(index_errors) or "cohérents")
+    return failures
+
+
+def main_check(args) -> int:
+    service_purge.purge_worker.batch_size = args.batch_size
+    service_purge.purge_worker.rate = args.rate
+    seeded = seed.seed(3, args.comptes, args.personnages, args.objets, max(args.objets, 10) + 1)
+    with database.engine.connect() as connection:
+        users = connection.execute(
+            select(models.Utilisateur.id, models.Utilisateur.login)
+            .filter(models.Utilisateur.login.in_(seeded["logins"])).order_by(models.Utilisateur.id)
+        ).all()
+        expected = tree_counts(connection, users[2].id)
+    args.expected_probe = {**expected, "inventaire": expected["inventaire"] + 1}
+    print(f"purge : lots de {args.batch_size} lignes, {args.rate:g} lots/s au plus")
+    return 1 if asyncio.run(run(args, users)) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vérification des suppressions en arrière-plan")
+    parser.add_argument("--comptes", type=int, default=10, help="comptes par utilisateur")
+    parser.add_argument("--personnages", type=int, default=500, help="personnages par compte")
+    parser.add_argument("--objets", type=int, default=5, help="objets différents par personnage")
+    parser.add_argument("--batch-size", type=int, default=service_purge.PURGE_BATCH_SIZE, help="lignes supprimées par lot")
+    parser.add_argument("--rate", type=float, default=service_purge.PURGE_RATE, help="lots par seconde au plus (0 : sans pause)")
+    sys.exit(main_check(parser.parse_args()))
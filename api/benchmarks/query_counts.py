@@ -0,0 +1,109 @@
+# --- Vérification du nombre de requêtes SQL émises par les routes de lecture
+# Lancer depuis le dossier api/ : python -m benchmarks.query_counts --comptes 5 --personnages 5
+# Le script échoue (code de sortie 1) si une route dépasse son budget : le nombre de requêtes ne doit pas dépendre
+# du nombre de comptes / personnages / inventaires (voir services.utils.loading_plan).
+import argparse
+import os
+import sys
+import tempfile
+import uuid
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/query_counts.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.makedirs("static", exist_ok=True)
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import database, models, tasks
+import services.utils as service_utils
+import main
+
+# --- Budget de requêtes par route, l'utilisateur authentifié étant déjà en cache (aucune requête pour l'authentification)
+# /user/me/ lit la ligne de l'utilisateur pour l'ETag (seule requête si le client a la bonne version), puis charge ses relations
+QUERY_BUDGETS = {
+    "/user/me/": 4,
+    "/users/": 4,
+    "/user/{user_id}/comptes/": 4,
+    "/user/{user_id}/compte/{compte_id}/personnages/": 3,
+    "/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/": 2,
+    # ?fields= : les relations non demandées ne sont pas chargées
+    "/user/me/?fields=id,login": 1,
+    "/user/me/?fields=comptes.nom": 2,
+}
+
+REVALIDATION_BUDGETS = {
+    "/user/me/": 1,
+    "/user/{user_id}/comptes/": 1,
+    "/user/{user_id}/compte/{compte_id}/personnages/": 1,
+    "/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/": 1,
+}
+
+
+def seed(nb_comptes: int, nb_personnages: int) -> tuple:
+    """
+    Cette fonction permet de créer un utilisateur avec nb_comptes comptes de nb_personnages personnages possédant chacun 3 objets
+    @param nb_comptes: int
+    @param nb_personnages: int
+    @return tuple (email, mot de passe, id utilisateur, id compte, id personnage)
+    """
+    password = "benchmark"
+    with database.SessionLocal() as db:
+        user = models.Utilisateur(login=uuid.uuid4().hex, email=f"{uuid.uuid4().hex}@bench", password=tasks.get_password_hash(password))
+        objets = [models.Objet(nom=uuid.uuid4().hex) for _ in range(3)]
+        for _ in range(nb_comptes):
+            compte = models.Compte(nom=uuid.uuid4().hex, utilisateur=user)
+            for _ in range(nb_personnages):
+                personnage = models.Personnage(nom=uuid.uuid4().hex, compte=compte)
+                for objet in objets:
+                    models.Inventaire(objet_catalogue=objet, quantite=2, personnage=personnage)
+        db.add(user)
+        db.commit()
+        return user.email, password, user.id, compte.id, personnage.id
+
+
+def main_check(args) -> int:
+    service_utils.create_database()
+    email, password, user_id, compte_id, personnage_id = seed(args.comptes, args.personnages)
+
+    statements = []
+    # les lectures peuvent passer par le moteur de lecture (réplique ou pool SQLite en lecture seule)
+    for engine in {database.async_engine, database.async_read_engine}:
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    failures = 0
+    with TestClient(main.app) as client:
+        token = client.post("/token/", data={"username": email, "password": password}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        # première requête authentifiée : remplit le cache des utilisateurs authentifiés
+        client.get("/user/me/", headers=headers)
+        for route, budget in QUERY_BUDGETS.items():
+            url = route.format(user_id=user_id, compte_id=compte_id, personnage_id=personnage_id)
+            statements.clear()
+            response = client.get(url, headers=headers)
+            count = len(statements)
+            ok = response.status_code == 200 and count <= budget
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {route:<90} {count:>3} requêtes (budget {budget}, HTTP {response.status_code})")
+            if not ok and args.verbose:
+                for statement in statements:
+                    print("      ", " ".join(statement.split()))
+            # revalidation : les routes dont l'ETag vient de version_arbre répondent 304 après une seule requête
+            if route in REVALIDATION_BUDGETS and "etag" in response.headers:
+                statements.clear()
+                revalidation = client.get(url, headers={**headers, "If-None-Match": response.headers["etag"]})
+                count = len(statements)
+                ok = revalidation.status_code == 304 and count <= REVALIDATION_BUDGETS[route]
+                failures += not ok
+                label = f"{route} (If-None-Match)"
+                print(f"{'OK  ' if ok else 'FAIL'} {label:<90} {count:>3} requêtes (budget {REVALIDATION_BUDGETS[route]}, HTTP {revalidation.status_code})")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vérifie que le nombre de requêtes SQL par route reste dans son budget")
+    parser.add_argument("--comptes", type=int, default=5)
+    parser.add_argument("--personnages", type=int, default=5)
+    parser.add_argument("--verbose", action="store_true", help="affiche les requêtes des routes hors budget")
+    sys.exit(main_check(parser.parse_args()))
@@ -0,0 +1,101 @@
+# --- Vérification du routage des lectures vers la réplique (DATABASE_READ_URL)
+# Lancer depuis le dossier api/ : python -m benchmarks.read_replica
+# Deux bases SQLite temporaires sont utilisées : la réplique est une copie de la base principale faite après le remplissage,
+# elle ne reçoit donc pas les écritures suivantes (comme une réplique en retard). Le script vérifie sur quelle base chaque
+# requête lit et échoue (code de sortie 1) si une lecture part sur la mauvaise base.
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+
+directory = tempfile.mkdtemp()
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{directory}/primary.db")
+os.environ.setdefault("DATABASE_READ_URL", f"sqlite:///{directory}/replica.db")
+os.environ.setdefault("DATABASE_READ_STICKINESS", "1")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+os.makedirs("static", exist_ok=True)
+
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+import database, models, tasks
+import services.utils as service_utils
+import main
+
+
+def seed(nb_users: int) -> list[tuple]:
+    """
+    Cette fonction permet de créer nb_users utilisateurs avec un compte
+    @param nb_users: int
+    @return list[tuple] (login, mot de passe, id utilisateur)
+    """
+    password = "benchmark"
+    with database.SessionLocal() as db:
+        users = [
+            models.Utilisateur(login=uuid.uuid4().hex, email=f"{uuid.uuid4().hex}@bench", password=tasks.get_password_hash(password))
+            for _ in range(nb_users)
+        ]
+        for user in users:
+            models.Compte(nom=uuid.uuid4().hex, utilisateur=user)
+        db.add_all(users)
+        db.commit()
+        return [(user.login, password, user.id) for user in users]
+
+
+def main_check() -> int:
+    if database.async_read_engine is database.async_engine:
+        print("DATABASE_READ_URL n'est pas défini : aucune réplique à vérifier")
+        return 1
+    service_utils.create_database()
+    (login, password, user_id), (other_login, _, other_id) = seed(2)
+    # la réplique est figée à cet instant (journal WAL reporté dans le fichier avant la copie)
+    with database.engine.connect() as connection:
+        connection.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+    shutil.copy(database.engine.url.database, database.async_read_engine.url.database)
+
+    engines = {"principale": database.async_engine, "réplique": database.async_read_engine}
+    statements = {name: 0 for name in engines}
+    for name, engine in engines.items():
+        event.listen(engine.sync_engine, "before_cursor_execute", lambda *a, name=name: statements.__setitem__(name, statements[name] + 1))
+
+    def request(client, method: str, url: str, **kwargs):
+        before = dict(statements)
+        response = client.request(method, url, **kwargs)
+        used = [name for name in engines if statements[name] > before[name]]
+        return response, "+".join(used) or "aucune"
+
+    stickiness = database.DATABASE_READ_STICKINESS
+    failures = 0
+    with TestClient(main.app) as client:
+        def check(label: str, expected: str, method: str, url: str, **kwargs):
+            nonlocal failures
+            response, used = request(client, method, url, **kwargs)
+            ok = used == expected
+            failures += not ok
+            print(f"{'OK  ' if ok else 'FAIL'} {label:<52} {used:<12} (attendu {expected}, HTTP {response.status_code})")
+            return response
+
+        token = check("connexion", "principale", "POST", "/token/", data={"username": login, "password": password}).json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        check("/user/me/ juste après la connexion", "principale", "GET", "/user/me/", headers=headers)
+        time.sleep(stickiness + 0.1)
+        check("/user/me/ après la fenêtre", "réplique", "GET", "/user/me/", headers=headers)
+
+        comptes = f"/user/{user_id}/comptes/"
+        check("ajout d'un compte", "principale", "POST", f"/user/{user_id}/compte/", json={"nom": uuid.uuid4().hex}, headers=headers)
+        response = check("comptes juste après l'écriture", "principale", "GET", comptes, headers=headers)
+        written = len(response.json())
+        # même utilisateur visé sans token : la clé user_id suffit
+        check("comptes juste après l'écriture, sans token", "principale", "GET", comptes)
+        check("comptes d'un autre utilisateur", "réplique", "GET", f"/user/{other_id}/comptes/")
+        time.sleep(stickiness + 0.1)
+        response = check("comptes après la fenêtre", "réplique", "GET", comptes, headers=headers)
+        print(f"     comptes lus : {written} sur la base principale, {len(response.json())} sur la réplique (non répliquée)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_check())
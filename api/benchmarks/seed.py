@@ -0,0 +1,116 @@
+# --- Remplissage d'une base de données pour les benchmarks
+# Lancer depuis le dossier api/ : python -m benchmarks.seed --users 1000 --comptes 2 --personnages 3 --objets 5
+# Tous les utilisateurs ont le mot de passe "benchmark", leur login est "<préfixe>-u<n>".
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{tempfile.mkdtemp()}/benchmark.db")
+os.environ.setdefault("SECRET_KEY", "benchmark")
+os.environ.setdefault("ALGORITHM", "HS256")
+
+from sqlalchemy import insert, select
+
+import database, models, tasks
+import services.utils as service_utils
+
+PASSWORD = "benchmark"
+BATCH_SIZE = 5000
+
+
+def _insert_returning_ids(connection, model, rows: list[dict]) -> list[int]:
+    """
+    Cette fonction permet d'insérer des lignes par lots et de récupérer leurs ids dans l'ordre d'insertion
+    @param connection: Connection
+    @param model: modèle SQLAlchemy
+    @param rows: list[dict]
+    @return list[int]
+    """
+    ids = []
+    for start in range(0, len(rows), BATCH_SIZE):
+        result = connection.execute(
+            insert(model).returning(model.id, sort_by_parameter_order=True), rows[start:start + BATCH_SIZE]
+        )
+        ids.extend(result.scalars())
+    return ids
+
+
+def seed(users: int, comptes: int, personnages: int, objets: int, catalogue: int = 100, prefix: str | None = None) -> dict:
+    """
+    Cette fonction permet de créer users utilisateurs ayant chacun comptes comptes de personnages personnages,
+    chaque personnage possédant objets objets différents tirés d'un catalogue de catalogue objets
+    @param users: int
+    @param comptes: int (par utilisateur)
+    @param personnages: int (par compte)
+    @param objets: int (par personnage)
+    @param catalogue: int (taille du catalogue d'objets)
+    @param prefix: str | None (préfixe des noms, aléatoire par défaut)
+    @return dict (préfixe, logins et nombre de lignes créées)
+    """
+    service_utils.create_database()
+    prefix = prefix or uuid.uuid4().hex[:8]
+    # bcrypt est coûteux : tous les utilisateurs partagent le même hash
+    password = tasks.get_password_hash(PASSWORD)
+    now = tasks.get_current_datetime()
+    rng = random.Random(prefix)
+    catalogue = max(catalogue, objets)
+
+    with database.engine.begin() as connection:
+        logins = [f"{prefix}-u{n}" for n in range(users)]
+        user_ids = _insert_returning_ids(connection, models.Utilisateur, [
+            {"login": login, "email": f"{login}@bench", "password": password, "date_creation": now, "date_derniere_connexion": now}
+            for login in logins
+        ])
+        compte_rows = [
+            {"nom": f"{prefix}-u{u}-c{c}", "utilisateur_id": user_id}
+            for u, user_id in enumerate(user_ids) for c in range(comptes)
+        ]
+        compte_ids = _insert_returning_ids(connection, models.Compte, compte_rows)
+        personnage_rows = [
+            {"nom": f"{compte['nom']}-p{p}", "compte_id": compte_id}
+            for compte, compte_id in zip(compte_rows, compte_ids) for p in range(personnages)
+        ]
+        personnage_ids = _insert_returning_ids(connection, models.Personnage, personnage_rows)
+
+        noms = [f"{prefix}-objet-{n}" for n in range(catalogue)]
+        existing = set(connection.scalars(select(models.Objet.nom).filter(models.Objet.nom.in_(noms))))
+        _insert_returning_ids(connection, models.Objet, [{"nom": nom} for nom in noms if nom not in existing])
+        objet_ids = list(connection.scalars(select(models.Objet.id).filter(models.Objet.nom.in_(noms))))
+        inventaire_rows = [
+            {"personnage_id": personnage_id, "objet_id": objet_id, "quantite": rng.randint(1, 20)}
+            for personnage_id in personnage_ids for objet_id in rng.sample(objet_ids, objets)
+        ]
+        for start in range(0, len(inventaire_rows), BATCH_SIZE):
+            connection.execute(insert(models.Inventaire), inventaire_rows[start:start + BATCH_SIZE])
+
+    return {
+        "prefix": prefix,
+        "logins": logins,
+        "utilisateurs": len(user_ids),
+        "comptes": len(compte_ids),
+        "personnages": len(personnage_ids),
+        "inventaire": len(inventaire_rows),
+    }
+
+
+def add_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--users", type=int, default=100, help="nombre d'utilisateurs")
+    parser.add_argument("--comptes", type=int, default=2, help="comptes par utilisateur")
+    parser.add_argument("--personnages", type=int, default=3, help="personnages par compte")
+    parser.add_argument("--objets", type=int, default=5, help="objets différents par personnage")
+    parser.add_argument("--catalogue", type=int, default=100, help="taille du catalogue d'objets")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Remplit la base de données (DATABASE_URL) pour les benchmarks")
+    add_arguments(parser)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    result = seed(args.users, args.comptes, args.personnages, args.objets, args.catalogue)
+    print(
+        f"{result['utilisateurs']} utilisateurs, {result['comptes']} comptes, {result['personnages']} personnages, "
+        f"{result['inventaire']} emplacements d'inventaire (préfixe {result['prefix']}) en {time.perf_counter() - start:.1f} s"
+    )
@@ -0,0 +1,80 @@
+# --- Importation des modules
+# OrderedDict est utilisé pour garder l'ordre d'utilisation des entrées (éviction LRU)
+from collections import OrderedDict
+# time.monotonic est utilisé pour l'expiration des entrées (insensible aux changements d'heure système)
+import time
+
+
+class TTLCache:
+    """
+    Cette classe permet de garder en mémoire un nombre borné de valeurs pendant une durée limitée :
+    l'entrée la moins récemment utilisée est supprimée quand le cache est plein, et une entrée expirée n'est jamais renvoyée
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: OrderedDict = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        """
+        Cette fonction permet de récupérer une valeur du cache
+        @param key: clé
+        @param default: valeur renvoyée si la clé est absente ou expirée
+        @return la valeur ou default
+        """
+        entry = self._data.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl: float | None = None):
+        """
+        Cette fonction permet d'ajouter une valeur au cache
+        @param key: clé
+        @param value: valeur
+        @param ttl: float | None (durée de vie en secondes, celle du cache par défaut)
+        @return None
+        """
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0 or self.maxsize <= 0:
+            return
+        self._data[key] = (time.monotonic() + ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        """
+        Cette fonction permet de supprimer une clé du cache
+        @param key: clé
+        @return None
+        """
+        self._data.pop(key, None)
+
+    def clear(self):
+        """
+        Cette fonction permet de vider le cache
+        @return None
+        """
+        self._data.clear()
+
+    def stats(self) -> dict:
+        """
+        Cette fonction permet de récupérer les compteurs du cache
+        @return dict
+        """
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
@@ -1,6 +1,9 @@
 # --- Importation des modules
 # sqlalchemy est utilisé pour la gestion de la base de données, cela permet de créer des modèles de données, de les manipuler, etc.
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+# sqlalchemy.ext.asyncio est utilisé pour le moteur et les sessions asynchrones, cela évite de bloquer la boucle d'événements de FastAPI
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
 # sqlalchemy.ext.declarative est utilisé pour la déclaration de la base de données
 from sqlalchemy.ext.declarative import declarative_base
 # sqlalchemy.orm est utilisé pour la session de la base de données, cela permet d'accéder à la base de données, de la lire et de l'écrire, etc.
@@ -13,9 +16,201 @@ load_dotenv()
 
 # --- Variables d'environnement
 DATABASE_URL = os.getenv("DATABASE_URL")
+# réplique en lecture seule (optionnelle) : les routes GET y lisent, sauf juste après une écriture du même utilisateur
+DATABASE_READ_URL = os.getenv("DATABASE_READ_URL")
+DATABASE_READ_STICKINESS = float(os.getenv("DATABASE_READ_STICKINESS", 5))  # lectures sur la base principale après une écriture (secondes)
+# pool de connexions de l'API (par worker uvicorn : le nombre maximum de connexions est workers * (taille + débordement))
+DATABASE_POOL_SIZE = int(os.getenv("DATABASE_POOL_SIZE", 5))  # connexions gardées ouvertes
+DATABASE_MAX_OVERFLOW = int(os.getenv("DATABASE_MAX_OVERFLOW", 10))  # connexions supplémentaires ouvertes en cas de pic
+DATABASE_POOL_TIMEOUT = float(os.getenv("DATABASE_POOL_TIMEOUT", 30))  # attente maximale d'une connexion libre (secondes)
+DATABASE_POOL_RECYCLE = int(os.getenv("DATABASE_POOL_RECYCLE", -1))  # durée de vie d'une connexion (secondes, -1 : illimitée)
+DATABASE_POOL_PRE_PING = os.getenv("DATABASE_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")  # teste la connexion avant usage
+
+# --- Profil SQLite (fichier uniquement) : "default" (par défaut, réglages d'origine de SQLite) ou "production", à choisir
+# au déploiement
+# production : journal WAL (les lectures ne bloquent plus les écritures et inversement), synchronous=NORMAL (sûr en WAL),
+# attente du verrou (busy_timeout) au lieu de "database is locked", lectures par mmap et cache de pages plus grand.
+# Les écritures passent par une seule connexion (BEGIN IMMEDIATE, les requêtes attendent leur tour dans le pool) et les
+# lectures par un pool de connexions en lecture seule (PRAGMA query_only)
+SQLITE_PROFILE = os.getenv("SQLITE_PROFILE", "default")
+SQLITE_BUSY_TIMEOUT = int(os.getenv("SQLITE_BUSY_TIMEOUT", 5000))  # attente maximale du verrou d'écriture (millisecondes)
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", 256 * 1024 * 1024))  # taille lue par mmap (octets)
+SQLITE_CACHE_SIZE = int(os.getenv("SQLITE_CACHE_SIZE", 64 * 1024))  # cache de pages par connexion (Kio)
+
+# --- Pilotes asynchrones utilisés pour chaque type de base de données
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+def get_async_url(url: str) -> str:
+    """
+    Cette fonction permet de convertir une URL de base de données synchrone en URL utilisant un pilote asynchrone
+    @param url: str
+    @return str
+    """
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    return url.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+def is_sqlite_file(url: str) -> bool:
+    """
+    Cette fonction permet de savoir si une URL désigne une base SQLite stockée dans un fichier (le profil ne s'applique pas en mémoire)
+    @param url: str
+    @return bool
+    """
+    url = make_url(url)
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:") and url.query.get("mode") != "memory"
+
+def sqlite_pragmas(read_only: bool = False) -> list[str]:
+    """
+    Cette fonction permet de récupérer les PRAGMA du profil SQLite "production", exécutés à l'ouverture de chaque connexion
+    @param read_only: bool (connexion du pool de lecture)
+    @return list[str]
+    """
+    pragmas = [
+        "PRAGMA journal_mode=WAL",
+        "PRAGMA synchronous=NORMAL",
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE}",
+        "PRAGMA temp_store=MEMORY",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+def configure_sqlite(engine, read_only: bool = False, immediate: bool = False):
+    """
+    Cette fonction permet d'appliquer le profil SQLite "production" aux connexions d'un moteur
+    (pour un moteur asynchrone, passer engine.sync_engine)
+    @param engine: Engine
+    @param read_only: bool (connexions en lecture seule)
+    @param immediate: bool (les transactions prennent le verrou d'écriture dès leur début : BEGIN IMMEDIATE)
+    @return None
+    """
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        if immediate:
+            # le pilote n'ouvre plus les transactions lui-même : BEGIN IMMEDIATE est envoyé par on_begin
+            dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        for pragma in sqlite_pragmas(read_only):
+            cursor.execute(pragma)
+        cursor.close()
+
+    if immediate:
+        @event.listens_for(engine, "begin")
+        def on_begin(connection):
+            # sans IMMEDIATE, une transaction commencée en lecture échoue (SQLITE_BUSY) si elle doit écrire pendant
+            # qu'un autre processus écrit ; avec, elle attend le verrou (busy_timeout) avant de commencer
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+
+def enable_sqlite_foreign_keys(engine):
+    """
+    Cette fonction permet de faire vérifier les clés étrangères par SQLite (désactivées par défaut) sur les connexions d'un moteur,
+    ce qui applique aussi les suppressions en cascade (ON DELETE CASCADE)
+    @param engine: Engine (pour un moteur asynchrone, passer engine.sync_engine)
+    @return None
+    """
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
+SQLITE_PRODUCTION = SQLITE_PROFILE == "production" and is_sqlite_file(DATABASE_URL)
 
 # --- Connexion à la base de données
+# le moteur synchrone est conservé pour la création des tables et les scripts hors de l'application
 engine = create_engine(DATABASE_URL)  # création du moteur de la base de données
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)  # création de la session
+if SQLITE_PRODUCTION:
+    configure_sqlite(engine)
+
+def create_api_engine(url: str, **pool_options):
+    """
+    Cette fonction permet de créer un moteur asynchrone avec le pool de connexions configuré pour l'API
+    @param url: str
+    @param pool_options: options du pool qui remplacent la configuration (ex : pool_size)
+    @return AsyncEngine
+    """
+    options = {
+        "pool_size": DATABASE_POOL_SIZE,
+        "max_overflow": DATABASE_MAX_OVERFLOW,
+        "pool_timeout": DATABASE_POOL_TIMEOUT,
+        "pool_recycle": DATABASE_POOL_RECYCLE,
+        "pool_pre_ping": DATABASE_POOL_PRE_PING,
+        **pool_options,
+    }
+    return create_async_engine(get_async_url(url), **options)
+
+# le moteur asynchrone est utilisé par les routes de l'API ; avec le profil SQLite "production", il n'a qu'une connexion :
+# les écritures attendent leur tour dans le pool (DATABASE_POOL_TIMEOUT) au lieu de se disputer le verrou du fichier
+async_engine = create_api_engine(DATABASE_URL, **({"pool_size": 1, "max_overflow": 0} if SQLITE_PRODUCTION else {}))  # création du moteur asynchrone
+if SQLITE_PRODUCTION:
+    configure_sqlite(async_engine.sync_engine, immediate=True)
+# les clés étrangères ne sont vérifiées que par le moteur de l'API : le moteur synchrone applique les migrations, qui recréent
+# les tables SQLite (DROP TABLE puis copie) et videraient sinon leurs tables filles par cascade
+if make_url(DATABASE_URL).get_backend_name() == "sqlite":
+    enable_sqlite_foreign_keys(async_engine.sync_engine)
+# expire_on_commit=False permet de renvoyer les objets après un commit sans recharger leurs attributs (impossible hors de la boucle asynchrone)
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)  # création de la session asynchrone
+
+# moteur des lectures : la réplique (DATABASE_READ_URL), le pool en lecture seule du profil SQLite "production",
+# ou à défaut le moteur principal
+if DATABASE_READ_URL:
+    async_read_engine = create_api_engine(DATABASE_READ_URL)
+    if SQLITE_PROFILE == "production" and is_sqlite_file(DATABASE_READ_URL):
+        configure_sqlite(async_read_engine.sync_engine, read_only=True)
+elif SQLITE_PRODUCTION:
+    async_read_engine = create_api_engine(DATABASE_URL)
+    configure_sqlite(async_read_engine.sync_engine, read_only=True)
+else:
+    async_read_engine = async_engine
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
 Base = declarative_base()  # création de la base
 
+
+class PoolTelemetry:
+    """
+    Cette classe permet de mesurer le temps d'attente d'une connexion du pool d'un moteur par les requêtes de l'API
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.pool_size = engine.pool.size()
+        self.max_overflow = getattr(engine.pool, "_max_overflow", 0)
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait: float):
+        self.checkouts += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+
+    def stats(self) -> dict:
+        """
+        Cette fonction permet de récupérer l'état du pool de connexions et les temps d'attente mesurés
+        @return dict
+        """
+        pool = self.engine.pool
+        return {
+            "pool_size": self.pool_size,
+            "max_overflow": self.max_overflow,
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "avg_wait_ms": self.total_wait / self.checkouts * 1000 if self.checkouts else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+
+pool_telemetry = PoolTelemetry(async_engine)
+read_pool_telemetry = PoolTelemetry(async_read_engine) if async_read_engine is not async_engine else pool_telemetry
@@ -1,22 +1,35 @@
 # --- Importation des modules
 # -- Fast API
-from fastapi import FastAPI, Depends
+from fastapi import FastAPI, Depends, Query, Request, Response
 # OAuth2PasswordBearer est utilisé pour la gestion de l'authentification, OAuth2PasswordRequestForm est utilisé pour la gestion de la requête d'authentification
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 # CORS est utilisé pour la gestion des requêtes CORS
 from fastapi.middleware.cors import CORSMiddleware
-# --- SQLAlchemy
-from sqlalchemy.orm import Session
+# --- SQLAlchemy (session asynchrone)
+from sqlalchemy.ext.asyncio import AsyncSession
 # datetime est utilisé pour la gestion des dates
 from datetime import datetime
 # typing.Annotated est utilisé pour la gestion des annotations
-from typing import Annotated
+from typing import Annotated, Literal
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, StreamingResponse
+# contextlib.asynccontextmanager est utilisé pour le cycle de vie de l'application (démarrage / arrêt)
+from contextlib import asynccontextmanager
+# asyncio est utilisé pour les tâches de fond lancées au démarrage
+import asyncio
 
 import schemas 
+import models
+import tasks
+import database
+import metrics
+import compression
 import services.utils as service_utils
 import services.user as service_user
+import services.export as service_export
+import services.imports as service_imports
+import services.search as service_search
+import services.purge as service_purge
 
 
 # --- Catégories des endpoints (voir documentations Swagger/redocs)
@@ -39,20 +52,40 @@ tags_metadata = [
     },
 ]
 
+# --- Cycle de vie de l'application
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # démarrage : écriture périodique des dates de dernière connexion
+    last_login_task = asyncio.create_task(service_user.last_login_buffer.run())
+    # démarrage : purge en arrière-plan des suppressions ?mode=async (y compris celles interrompues par un arrêt)
+    purge_task = asyncio.create_task(service_purge.purge_worker.run())
+    yield
+    # arrêt : on écrit les dernières dates de connexion puis on attend la fin des hashages en cours
+    # (une purge interrompue reprend au démarrage suivant, ses lots déjà supprimés sont validés)
+    purge_task.cancel()
+    last_login_task.cancel()
+    await service_user.last_login_buffer.flush()
+    tasks.hashing_pool.shutdown()
+
 # --- FastAPI app
 app = FastAPI(
     title="API FastAPI",
     description="This is the API documentation for the API FastAPI",
+    lifespan=lifespan,
+    # JSON_RESPONSE=orjson : réponses encodées par orjson (voir services.utils.default_response_class)
+    default_response_class=service_utils.default_response_class(),
 )
+# paramètre ?fields= des routes de lecture : seuls les champs demandés sont renvoyés et seules les relations demandées sont chargées
+FIELDS_QUERY = Query(default=None, description="Sparse fieldset, e.g. id,login,comptes.nom (relations not listed are not loaded)")
+# paramètre ?mode= des routes de suppression : async cache aussitôt la ligne et ses descendants puis les supprime par lots
+DELETE_MODE_QUERY = Query(default="sync", description="sync: delete the whole tree in the request; async: hide it now and purge it in the background (202, progress at the Location URL)")
+DELETE_RESPONSES = {202: {"model": schemas.Purge, "description": "Hidden now, purged in the background (mode=async)"}}
 # Servir les fichiers statiques du dossier 'static'
 app.mount("/static", StaticFiles(directory="static"), name="static")
 
 # Migration de la base de données
 service_utils.create_database()
 
-# Instance de la base de données
-service_utils.get_db()
-
 # --- Configuration CORS
 # il est possible de passer un tableau avec les origines autorisées, les méthodes autorisées, les en-têtes autorisés, etc.
 # ici, on autorise toutes les origines, les méthodes, les en-têtes, etc car on est en développement, en production, il faudra restreindre ces valeurs
@@ -64,6 +97,16 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# --- Compression brotli / gzip des réponses, ajoutée avant les mesures pour que celles-ci comptent les octets envoyés
+app.add_middleware(compression.CompressionMiddleware)
+
+# --- Mesures (latence, requêtes SQL, taille des réponses) par route, exposées sur /metrics
+metrics.instrument_engine(database.engine)
+metrics.instrument_engine(database.async_engine.sync_engine)
+if database.async_read_engine is not database.async_engine:
+    metrics.instrument_engine(database.async_read_engine.sync_engine)
+app.add_middleware(metrics.MetricsMiddleware)
+
 
 # Créer une instance de OAuth2PasswordBearer avec l'URL personnalisée
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
@@ -84,17 +127,59 @@ async def read_item():
     unix_timestamp = datetime.now().timestamp()
     return {"unixTime": unix_timestamp}
 
+@app.get("/metrics", response_class=PlainTextResponse, tags=["Server"])
+async def read_metrics():
+    """
+    Cette route permet de récupérer les mesures de l'API au format Prometheus (latence, requêtes SQL, taille des réponses par route)
+    """
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/health/", tags=["Server"])
+async def read_health(response: Response):
+    """
+    Cette route permet de vérifier l'état du serveur et des pools de connexions à la base de données et à sa réplique en lecture
+    (le même pool sans DATABASE_READ_URL) : connexions utilisées / libres, temps d'attente d'une connexion, attentes expirées,
+    ainsi que les dates de dernière connexion en attente d'écriture et l'avancement des purges en arrière-plan
+    """
+    database_ok = await service_utils.check_database()
+    if not database_ok:
+        response.status_code = 503
+    return {
+        "status": "ok" if database_ok else "unavailable",
+        "database": database.pool_telemetry.stats(),
+        "read_database": database.read_pool_telemetry.stats(),
+        "last_login": service_user.last_login_buffer.stats(),
+        "purge": service_purge.purge_worker.stats(),
+    }
+
+@app.get("/hashing/", tags=["Server"])
+async def read_hashing_stats():
+    """
+    Cette route permet de récupérer les métriques du pool de hashage des mots de passe (file d'attente, attente, refus)
+    """
+    return tasks.hashing_pool.stats()
+
+@app.get("/auth/cache/", tags=["Server"])
+async def read_auth_cache_stats():
+    """
+    Cette route permet de récupérer les compteurs (succès / échecs) des caches d'authentification
+    """
+    return {
+        "tokens": tasks.claims_cache.stats(),
+        "principals": service_user.principal_cache.stats(),
+    }
+
 # --- Authentification
 # On ne peut pas changer le nom de la route, c'est une route prédéfinie par FastAPI
 @app.post("/token/", response_model=schemas.Token, tags=["Auth"])
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(service_utils.get_db)
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Token:
     """
     Cette route permet de se connecter et de récupérer un token d'accès, à noter qu'ici : username = email
     @param form_data: OAuth2PasswordRequestForm
-    @param db: Session
+    @param db: AsyncSession
     @return schemas.Token
     """
     return await service_user.authenticate_user(db, form_data.username, form_data.password)
@@ -103,12 +188,12 @@ async def login_for_access_token(
 @app.post("/user/", response_model=schemas.Utilisateur, tags=["Utilisateur"])
 async def add_user(
     user: schemas.UtilisateurCreate,
-    db: Session = Depends(service_utils.get_db)
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Utilisateur:
     """
     Cette route permet d'ajouter un utilisateur
     @param user: schemas.UtilisateurCreate
-    @param db: Session
+    @param db: AsyncSession
     @return schemas.Utilisateur
     """
     return await service_user.add_user(db, user)
@@ -118,96 +203,247 @@ async def add_user(
 async def update_user(
     user_id: int,
     user: schemas.UtilisateurCreate,
-    current_user: Annotated[schemas.Utilisateur, Depends(service_user.get_current_user)],
-    db: Session = Depends(service_utils.get_db)
+    current_user: Annotated[schemas.UtilisateurSimple, Depends(service_user.get_current_user)],
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Utilisateur:
     """
     Cette route permet de modifier les informations d'un utilisateur
     @param user_id: int
     @param user: schemas.UtilisateurCreate
-    @param db: Session
+    @param db: AsyncSession
     @return schemas.Utilisateur
     """
     return await service_user.update_user(db, user_id, user,current_user )
 
 # route qui supprime un utilisateur
-@app.delete("/user/{user_id}", response_model=schemas.Utilisateur, tags=["Utilisateur"])
+@app.delete("/user/{user_id}", response_model=schemas.Utilisateur, responses=DELETE_RESPONSES, tags=["Utilisateur"])
 async def delete_user(
     user_id: int,
-    current_user: Annotated[schemas.Utilisateur, Depends(service_user.get_current_user)],
-    db: Session = Depends(service_utils.get_db)
+    current_user: Annotated[schemas.UtilisateurSimple, Depends(service_user.get_current_user)],
+    mode: Literal["sync", "async"] = DELETE_MODE_QUERY,
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Utilisateur:
     """
-    Cette route permet de supprimer un utilisateur
+    Cette route permet de supprimer un utilisateur (mode=async : caché aussitôt, supprimé en arrière-plan, réponse 202)
     @param user_id: int
-    @param db: Session
+    @param mode: str ("sync" ou "async")
+    @param db: AsyncSession
     @return schemas.Utilisateur
     """
+    if mode == "async":
+        return service_purge.accepted_response(await service_user.delete_user(db, user_id, current_user, background=True))
     return await service_user.delete_user(db, user_id, current_user)
 
 @app.get("/user/me/", response_model=schemas.Utilisateur, tags=["Utilisateur"])
 async def read_users_me(
-    current_user: Annotated[schemas.Utilisateur, Depends(service_user.get_current_user)]
+    request: Request,
+    current_user: Annotated[schemas.UtilisateurSimple, Depends(service_user.get_current_user)],
+    fields: str | None = FIELDS_QUERY,
+    db: AsyncSession = Depends(service_utils.get_read_db)
 ):
-    return current_user
+    """
+    Cette route permet de récupérer en une seule réponse l'utilisateur connecté avec tous ses comptes, personnages et inventaires
+    (4 requêtes SQL quelle que soit la taille de l'arbre). La réponse porte un ETag tiré de la version de l'arbre : si l'en-tête
+    If-None-Match correspond, une réponse 304 sans contenu est renvoyée après une seule requête ; sinon la ligne lue pour
+    l'ETag n'est pas relue, seuls ses comptes, personnages et inventaires sont chargés.
+    @param fields: str | None (champs demandés, ex : id,login,comptes.nom)
+    @param db: AsyncSession
+    @return schemas.Utilisateur
+    """
+    fields = service_utils.parse_fields(schemas.Utilisateur, fields)
+    node = await service_user.get_tree_node(db, models.Utilisateur, current_user.id)
+    etag = service_utils.version_etag(schemas.Utilisateur, current_user.id, node.version_arbre, fields)
+    if service_utils.if_none_match(request, etag):
+        return service_utils.not_modified(etag)
+    user = await service_user.get_user(db, current_user.id, fields, user=node)
+    return service_utils.json_response(user, schemas.Utilisateur, fields, service_utils.etag_headers(etag))
 
 
-@app.get("/users/", response_model=list[schemas.Utilisateur], tags=["Utilisateur"])
+@app.get("/users/", response_model=list[schemas.Utilisateur | schemas.UtilisateurSimple], tags=["Utilisateur"])
 async def read_users(
-    current_user: Annotated[schemas.Utilisateur, Depends(service_user.get_current_user)],
-    db: Session = Depends(service_utils.get_db)
-)-> list[schemas.Utilisateur]:
-    """
-    Cette route permet de récupérer tous les utilisateurs
-    @param db: Session
-    @return list[schemas.Utilisateur]
+    request: Request,
+    response: Response,
+    current_user: Annotated[schemas.UtilisateurSimple, Depends(service_user.get_current_user)],
+    after: int | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
+    flat: bool = False,
+    fields: str | None = FIELDS_QUERY,
+    db: AsyncSession = Depends(service_utils.get_read_db)
+)-> list[schemas.Utilisateur | schemas.UtilisateurSimple]:
+    """
+    Cette route permet de récupérer les utilisateurs page par page, l'URL de la page suivante est renvoyée dans l'en-tête Link
+    (la réponse porte un ETag calculé sur son contenu)
+    @param after: int | None (id du dernier utilisateur de la page précédente)
+    @param limit: int (taille de la page, 1000 au maximum)
+    @param flat: bool (si vrai, les utilisateurs sont renvoyés sans leurs comptes)
+    @param fields: str | None (champs demandés, ex : id,login,comptes.nom)
+    @param db: AsyncSession
+    @return list[schemas.Utilisateur | schemas.UtilisateurSimple]
+    """
+    schema = schemas.UtilisateurSimple if flat else schemas.Utilisateur
+    fields = service_utils.parse_fields(schema, fields)
+    users = await service_user.get_all_users(db, after, limit, flat, fields)
+    response = service_utils.etag_response(request, users, schema, fields)
+    if len(users) == limit:
+        response.headers["Link"] = f'<{request.url.include_query_params(after=users[-1].id)}>; rel="next"'
+    return response
+
+@app.get("/export/", response_class=StreamingResponse, tags=["Utilisateur"])
+async def export_users(
+    current_user: Annotated[schemas.UtilisateurSimple, Depends(service_user.get_current_user)],
+    format: Literal["ndjson", "csv"] = "ndjson",
+):
     """
-    return await service_user.get_all_users(db)
+    Cette route permet d'exporter l'utilisateur connecté avec ses comptes, personnages et inventaires, une ligne par
+    emplacement d'inventaire. La réponse est envoyée au fur et à mesure de la lecture de la base : la mémoire utilisée
+    ne dépend pas du nombre de lignes.
+    @param format: str ("ndjson" ou "csv")
+    @return StreamingResponse
+    """
+    filename = f"export-{current_user.id}.{format}"
+    return StreamingResponse(
+        service_export.EXPORTERS[format](current_user.id),
+        media_type=service_export.EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/search/", response_model=list[schemas.SearchResult], tags=["Utilisateur"])
+async def search(
+    request: Request,
+    current_user: Annotated[schemas.UtilisateurSimple, Depends(service_user.get_current_user)],
+    q: str = Query(min_length=service_search.SEARCH_MIN_LENGTH, max_length=100),
+    types: list[Literal["personnage", "compte", "objet"]] | None = Query(default=None, alias="type"),
+    mode: Literal["prefix", "contains", "fuzzy"] = "prefix",
+    limit: int = Query(default=20, ge=1, le=100),
+    offset: int = Query(default=0, ge=0),
+    db: AsyncSession = Depends(service_utils.get_read_db)
+)-> list[schemas.SearchResult]:
+    """
+    Cette route permet de rechercher des personnages, des comptes et des objets du catalogue par leur nom (index trigramme),
+    les meilleurs résultats d'abord ; l'URL de la page suivante est renvoyée dans l'en-tête Link
+    @param q: str (au moins 3 caractères)
+    @param types: list[str] | None (types de résultats, ex : ?type=personnage&type=objet, tous par défaut)
+    @param mode: str ("prefix" : le nom commence par q, "contains" : le nom contient q, "fuzzy" : noms proches de q)
+    @param limit: int (taille de la page, 100 au maximum)
+    @param offset: int (nombre de résultats déjà lus)
+    @param db: AsyncSession
+    @return list[schemas.SearchResult]
+    """
+    results = await service_search.search(db, q, types, mode, limit, offset)
+    response = service_utils.json_response(results, schemas.SearchResult)
+    if len(results) == limit:
+        response.headers["Link"] = f'<{request.url.include_query_params(offset=offset + limit)}>; rel="next"'
+    return response
+
+@app.get("/changes/", response_model=schemas.ChangesPage, tags=["Utilisateur"])
+async def read_changes(
+    current_user: Annotated[schemas.UtilisateurSimple, Depends(service_user.get_current_user)],
+    since: int | None = Query(default=None, ge=0, description="Cursor returned by the previous sync (omit it to get the current cursor)"),
+    limit: int = Query(default=500, ge=1, le=1000),
+    db: AsyncSession = Depends(service_utils.get_read_db)
+)-> schemas.ChangesPage:
+    """
+    Cette route permet de synchroniser une copie locale de l'arbre de l'utilisateur connecté : seules les lignes (utilisateur,
+    comptes, personnages, inventaires) créées, modifiées ou supprimées depuis le curseur since sont renvoyées, avec leur état
+    actuel et le curseur de la synchronisation suivante. La suppression d'un compte ou d'un personnage vaut pour ses descendants.
+    Sans since, seul le curseur actuel est renvoyé : le lire, puis charger l'arbre complet (/user/me/)
+    @param since: int | None (curseur de la synchronisation précédente)
+    @param limit: int (changements lus dans le journal, 1000 au maximum ; has_more indique qu'il en reste)
+    @param db: AsyncSession
+    @return schemas.ChangesPage
+    """
+    page = await service_user.get_changes(db, current_user.id, since, limit)
+    return service_utils.json_response(page, schemas.ChangesPage)
+
+@app.get("/purges/{purge_id}", response_model=schemas.Purge, tags=["Utilisateur"])
+async def read_purge(
+    purge_id: int,
+    current_user: Annotated[schemas.UtilisateurSimple, Depends(service_user.get_current_user)],
+    db: AsyncSession = Depends(service_utils.get_read_db)
+)-> schemas.Purge:
+    """
+    Cette route permet de suivre une suppression en arrière-plan (DELETE ...?mode=async) d'un compte ou d'un personnage de
+    l'utilisateur connecté : lignes supprimées et restantes par table (404 pour la purge d'un autre arbre)
+    @param purge_id: int
+    @param db: AsyncSession
+    @return schemas.Purge
+    """
+    return await service_purge.get_purge(db, purge_id, current_user.id)
+
+@app.post("/import/", response_model=schemas.ImportReport, dependencies=[Depends(service_imports.require_import_token)], tags=["Utilisateur"])
+async def import_users(
+    request: Request,
+    batch_size: int = Query(default=service_imports.IMPORT_BATCH_SIZE, ge=1, le=10000),
+)-> schemas.ImportReport:
+    """
+    Cette route permet d'importer des utilisateurs avec leurs comptes, personnages et inventaires. Le corps est un flux NDJSON
+    (Content-Type: application/x-ndjson), une ligne par utilisateur au format schemas.UtilisateurImport. Le flux est lu au fur
+    et à mesure et inséré par lots de batch_size utilisateurs (un commit par lot, progression journalisée après chaque lot) ;
+    une ligne invalide ou dont un nom existe déjà est rejetée sans interrompre l'import. Réservée à l'opérateur du serveur :
+    en-tête X-Import-Token égal à IMPORT_TOKEN (route désactivée sans IMPORT_TOKEN)
+    @param batch_size: int
+    @return schemas.ImportReport
+    """
+    return await service_imports.import_ndjson(request.stream(), batch_size)
 
 # route qui permet de récupérer les comptes d'un utilisateur 
 @app.get("/user/{user_id}/comptes/", response_model=list[schemas.Compte], tags=["Utilisateur"])
 async def read_user_comptes(
+    request: Request,
     user_id: int,
-    db: Session = Depends(service_utils.get_db)
+    fields: str | None = FIELDS_QUERY,
+    db: AsyncSession = Depends(service_utils.get_read_db)
 )-> list[schemas.Compte]:
     """
-    Cette route permet de récupérer les comptes d'un utilisateur
+    Cette route permet de récupérer les comptes d'un utilisateur (ETag tiré de la version de l'arbre de l'utilisateur,
+    304 sans charger les comptes si If-None-Match correspond)
     @param user_id: int
-    @param db: Session
+    @param fields: str | None (champs demandés, ex : id,nom,personnages.nom)
+    @param db: AsyncSession
     @return list[schemas.Compte]
     """
-    return await service_user.get_user_comptes(db, user_id)
+    fields = service_utils.parse_fields(schemas.Compte, fields)
+    node = await service_user.get_tree_node(db, models.Utilisateur, user_id)
+    etag = service_utils.version_etag(schemas.Compte, user_id, node.version_arbre, fields)
+    if service_utils.if_none_match(request, etag):
+        return service_utils.not_modified(etag)
+    comptes = await service_user.get_user_comptes(db, user_id, fields)
+    return service_utils.json_response(comptes, schemas.Compte, fields, service_utils.etag_headers(etag))
 
 # route qui permet de créer un compte pour un utilisateur
 @app.post("/user/{user_id}/compte/", response_model=schemas.Compte, tags=["Utilisateur"])
 async def add_user_compte(
     user_id: int,
     compte: schemas.CompteCreate,
-    db: Session = Depends(service_utils.get_db)
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Compte:
     """
     Cette route permet de créer un compte pour un utilisateur
     @param user_id: int
     @param compte: schemas.CompteCreate
-    @param db: Session
+    @param db: AsyncSession
     @return schemas.Compte
     """
     return await service_user.add_user_compte(db, user_id, compte)
 
 # route qui permet de de supprimer un compte pour un utilisateur
-@app.delete("/user/{user_id}/compte/{compte_id}", response_model=schemas.Compte, tags=["Utilisateur"])
+@app.delete("/user/{user_id}/compte/{compte_id}", response_model=schemas.Compte, responses=DELETE_RESPONSES, tags=["Utilisateur"])
 async def delete_user_compte(
     user_id: int,
     compte_id: int,
-    db: Session = Depends(service_utils.get_db)
+    mode: Literal["sync", "async"] = DELETE_MODE_QUERY,
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Compte:
     """
-    Cette route permet de supprimer un compte pour un utilisateur
+    Cette route permet de supprimer un compte pour un utilisateur (mode=async : caché aussitôt, supprimé en arrière-plan, réponse 202)
     @param user_id: int
     @param compte_id: int
-    @param db: Session
+    @param mode: str ("sync" ou "async")
+    @param db: AsyncSession
     @return schemas.Compte
     """
+    if mode == "async":
+        return service_purge.accepted_response(await service_user.delete_user_compte(db, user_id, compte_id, background=True))
     return await service_user.delete_user_compte(db, user_id, compte_id)
 
 # route qui permet de modifier un compte pour un utilisateur
@@ -215,15 +451,15 @@ async def delete_user_compte(
 async def update_user_compte(
     user_id: int,
     compte_id: int,
-    compte: schemas.CompteCreate,
-    db: Session = Depends(service_utils.get_db)
+    compte: schemas.CompteUpdate,
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Compte:
     """
     Cette route permet de modifier un compte pour un utilisateur
     @param user_id: int
     @param compte_id: int
-    @param compte: schemas.CompteCreate
-    @param db: Session
+    @param compte: schemas.CompteUpdate
+    @param db: AsyncSession
     @return schemas.Compte
     """
     return await service_user.update_user_compte(db, user_id, compte_id, compte)
@@ -234,14 +470,14 @@ async def add_user_personnage(
     user_id: int,
     compte_id: int,
     personnage: schemas.PersonnageCreate,
-    db: Session = Depends(service_utils.get_db)
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Personnage:
     """
     Cette route permet d'ajouter un personnage pour un compte
     @param user_id: int
     @param compte_id: int
     @param personnage: schemas.PersonnageCreate
-    @param db: Session
+    @param db: AsyncSession
     @return schemas.Personnage
     """
     return await service_user.add_user_personnage(db, user_id, compte_id, personnage)
@@ -249,35 +485,49 @@ async def add_user_personnage(
 # route qui permet de récupérer les personnages d'un compte
 @app.get("/user/{user_id}/compte/{compte_id}/personnages/", response_model=list[schemas.Personnage], tags=["Utilisateur"])
 async def read_user_personnages(
+    request: Request,
     user_id: int,
     compte_id: int,
-    db: Session = Depends(service_utils.get_db)
+    fields: str | None = FIELDS_QUERY,
+    db: AsyncSession = Depends(service_utils.get_read_db)
 )-> list[schemas.Personnage]:
     """
-    Cette route permet de récupérer les personnages d'un compte
+    Cette route permet de récupérer les personnages d'un compte (ETag tiré de la version de l'arbre du compte,
+    304 sans charger les personnages si If-None-Match correspond)
     @param user_id: int
     @param compte_id: int
-    @param db: Session
+    @param fields: str | None (champs demandés, ex : id,nom,inventaire.objet)
+    @param db: AsyncSession
     @return list[schemas.Personnage]
     """
-    return await service_user.get_user_personnages(db, user_id, compte_id)
+    fields = service_utils.parse_fields(schemas.Personnage, fields)
+    node = await service_user.get_tree_node(db, models.Compte, compte_id)
+    etag = service_utils.version_etag(schemas.Personnage, compte_id, node.version_arbre, fields)
+    if service_utils.if_none_match(request, etag):
+        return service_utils.not_modified(etag)
+    personnages = await service_user.get_user_personnages(db, user_id, compte_id, fields)
+    return service_utils.json_response(personnages, schemas.Personnage, fields, service_utils.etag_headers(etag))
 
 # route qui permet de supprimer un personnage d'un compte
-@app.delete("/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}", response_model=schemas.Personnage, tags=["Utilisateur"])
+@app.delete("/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}", response_model=schemas.Personnage, responses=DELETE_RESPONSES, tags=["Utilisateur"])
 async def delete_user_personnage(
     user_id: int,
     compte_id: int,
     personnage_id: int,
-    db: Session = Depends(service_utils.get_db)
+    mode: Literal["sync", "async"] = DELETE_MODE_QUERY,
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Personnage:
     """
-    Cette route permet de supprimer un personnage d'un compte
+    Cette route permet de supprimer un personnage d'un compte (mode=async : caché aussitôt, supprimé en arrière-plan, réponse 202)
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
-    @param db: Session
+    @param mode: str ("sync" ou "async")
+    @param db: AsyncSession
     @return schemas.Personnage
     """
+    if mode == "async":
+        return service_purge.accepted_response(await service_user.delete_user_personnage(db, user_id, compte_id, personnage_id, background=True))
     return await service_user.delete_user_personnage(db, user_id, compte_id, personnage_id)
 
 # route qui permet de modifier un personnage d'un compte
@@ -286,37 +536,47 @@ async def update_user_personnage(
     user_id: int,
     compte_id: int,
     personnage_id: int,
-    personnage: schemas.PersonnageCreate,
-    db: Session = Depends(service_utils.get_db)
+    personnage: schemas.PersonnageUpdate,
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Personnage:
     """
     Cette route permet de modifier un personnage d'un compte
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
-    @param personnage: schemas.PersonnageCreate
-    @param db: Session
+    @param personnage: schemas.PersonnageUpdate
+    @param db: AsyncSession
     @return schemas.Personnage
     """
     return await service_user.update_user_personnage(db, user_id, compte_id, personnage_id, personnage)
 
 # route qui permet de récupérer l'inventaire d'un personnage
-@app.get("/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/", response_model=schemas.Inventaire, tags=["Utilisateur"])
+@app.get("/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/", response_model=list[schemas.Inventaire], tags=["Utilisateur"])
 async def read_user_inventaire(
+    request: Request,
     user_id: int,
     compte_id: int,
     personnage_id: int,
-    db: Session = Depends(service_utils.get_db)
-)-> schemas.Inventaire:
+    fields: str | None = FIELDS_QUERY,
+    db: AsyncSession = Depends(service_utils.get_read_db)
+)-> list[schemas.Inventaire]:
     """
-    Cette route permet de récupérer l'inventaire d'un personnage
+    Cette route permet de récupérer l'inventaire d'un personnage, un emplacement par objet avec sa quantité (ETag tiré de la
+    version de l'arbre du personnage, 304 sans charger l'inventaire si If-None-Match correspond)
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
-    @param db: Session
-    @return schemas.Inventaire
-    """
-    return await service_user.get_user_inventaire(db, user_id, compte_id, personnage_id)
+    @param fields: str | None (champs demandés, ex : objet,quantite)
+    @param db: AsyncSession
+    @return list[schemas.Inventaire]
+    """
+    fields = service_utils.parse_fields(schemas.Inventaire, fields)
+    node = await service_user.get_tree_node(db, models.Personnage, personnage_id)
+    etag = service_utils.version_etag(schemas.Inventaire, personnage_id, node.version_arbre, fields)
+    if service_utils.if_none_match(request, etag):
+        return service_utils.not_modified(etag)
+    inventaire = await service_user.get_user_inventaire(db, user_id, compte_id, personnage_id)
+    return service_utils.json_response(inventaire, schemas.Inventaire, fields, service_utils.etag_headers(etag))
 
 # route qui permet de modifier l'inventaire d'un personnage
 @app.put("/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/", response_model=schemas.Inventaire, tags=["Utilisateur"])
@@ -324,36 +584,36 @@ async def update_user_inventaire(
     user_id: int,
     compte_id: int,
     personnage_id: int,
-    inventaire: schemas.InventaireCreate,
-    db: Session = Depends(service_utils.get_db)
+    inventaire: schemas.InventaireUpdate,
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Inventaire:
     """
-    Cette route permet de modifier l'inventaire d'un personnage
+    Cette route permet de modifier la quantité d'un objet de l'inventaire d'un personnage (une quantité de 0 retire l'objet)
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
-    @param inventaire: schemas.InventaireCreate
-    @param db: Session
+    @param inventaire: schemas.InventaireUpdate
+    @param db: AsyncSession
     @return schemas.Inventaire
     """
     return await service_user.update_user_inventaire(db, user_id, compte_id, personnage_id, inventaire)
 
 # route qui permet de supprimer l'inventaire d'un personnage
-@app.delete("/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/", response_model=schemas.Inventaire, tags=["Utilisateur"])
+@app.delete("/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/", response_model=list[schemas.Inventaire], tags=["Utilisateur"])
 
 async def delete_user_inventaire(
     user_id: int,
     compte_id: int,
     personnage_id: int,
-    db: Session = Depends(service_utils.get_db)
-)-> schemas.Inventaire:
+    db: AsyncSession = Depends(service_utils.get_db)
+)-> list[schemas.Inventaire]:
     """
-    Cette route permet de supprimer l'inventaire d'un personnage
+    Cette route permet de vider l'inventaire d'un personnage
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
-    @param db: Session
-    @return schemas.Inventaire
+    @param db: AsyncSession
+    @return list[schemas.Inventaire] (les emplacements supprimés)
     """
     return await service_user.delete_user_inventaire(db, user_id, compte_id, personnage_id)
 
@@ -365,20 +625,36 @@ async def add_user_inventaire(
     compte_id: int,
     personnage_id: int,
     inventaire: schemas.InventaireCreate,
-    db: Session = Depends(service_utils.get_db)
+    db: AsyncSession = Depends(service_utils.get_db)
 )-> schemas.Inventaire:
     """
-    Cette route permet d'ajouter un objet à l'inventaire d'un personnage
+    Cette route permet d'ajouter un objet à l'inventaire d'un personnage, la quantité s'ajoute à celle déjà possédée
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
     @param inventaire: schemas.InventaireCreate
-    @param db: Session
+    @param db: AsyncSession
     @return schemas.Inventaire
     """
     return await service_user.add_user_inventaire(db, user_id, compte_id, personnage_id, inventaire)
 
-
-
-
-
+# route qui permet d'appliquer un lot d'opérations à l'inventaire d'un personnage
+@app.post("/user/{user_id}/compte/{compte_id}/personnage/{personnage_id}/inventaire/batch/", response_model=list[schemas.InventaireOperationResult], tags=["Utilisateur"])
+async def batch_user_inventaire(
+    user_id: int,
+    compte_id: int,
+    personnage_id: int,
+    batch: schemas.InventaireBatch,
+    db: AsyncSession = Depends(service_utils.get_db)
+)-> list[schemas.InventaireOperationResult]:
+    """
+    Cette route permet d'ajouter, modifier et supprimer plusieurs objets de l'inventaire d'un personnage en une seule transaction,
+    les ajouts sont appliqués après les modifications et suppressions
+    @param user_id: int
+    @param compte_id: int
+    @param personnage_id: int
+    @param batch: schemas.InventaireBatch
+    @param db: AsyncSession
+    @return list[schemas.InventaireOperationResult]
+    """
+    return await service_user.batch_user_inventaire(db, user_id, compte_id, personnage_id, batch)
@@ -0,0 +1,207 @@
+# --- Importation des modules
+# contextvars est utilisé pour rattacher les requêtes SQL à la requête HTTP en cours (chaque requête a son propre contexte)
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+# bisect est utilisé pour trouver l'intervalle d'un histogramme
+import bisect
+import logging
+import os
+import time
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# --- Variables d'environnement
+# durée (ms) au-delà de laquelle une requête est journalisée avec ses requêtes SQL, 0 désactive le journal
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", 0))
+
+logger = logging.getLogger("api.slow_requests")
+
+# --- Intervalles des histogrammes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+SQL_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+@dataclass
+class RequestStats:
+    """
+    Mesures d'une requête HTTP : nombre et durée des requêtes SQL, et requêtes elles-mêmes si le journal des requêtes lentes est actif
+    """
+    sql_count: int = 0
+    sql_time: float = 0.0
+    statements: list = field(default_factory=list)
+
+
+_current_request: ContextVar[RequestStats | None] = ContextVar("current_request", default=None)
+
+
+class Histogram:
+    """
+    Cette classe permet de compter des observations par intervalle (format des histogrammes Prometheus)
+    """
+
+    def __init__(self, buckets: tuple):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> list[str]:
+        """
+        Cette fonction permet de produire les lignes Prometheus de l'histogramme
+        @param name: str
+        @param labels: str (ex : 'method="GET",route="/users/"')
+        @return list[str]
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class RouteMetrics:
+    """
+    Mesures cumulées d'une route (méthode + modèle de chemin)
+    """
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.sql_statements = Histogram(SQL_COUNT_BUCKETS)
+        self.sql_seconds = 0.0
+        self.statuses: dict[int, int] = {}
+
+
+routes: dict[tuple[str, str], RouteMetrics] = {}
+
+
+# --- Événements SQLAlchemy
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    duration = time.perf_counter() - conn.info["query_start"].pop()
+    stats = _current_request.get()
+    if stats is None:
+        return
+    stats.sql_count += 1
+    stats.sql_time += duration
+    if SLOW_REQUEST_MS:
+        stats.statements.append((duration, statement))
+
+def instrument_engine(engine: Engine):
+    """
+    Cette fonction permet de compter les requêtes SQL d'un moteur (pour un moteur asynchrone, passer engine.sync_engine)
+    @param engine: Engine
+    @return None
+    """
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+# --- Middleware
+class MetricsMiddleware:
+    """
+    Middleware ASGI qui mesure pour chaque route la latence, le nombre et la durée des requêtes SQL et la taille de la réponse
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = RequestStats()
+        token = _current_request.set(stats)
+        status_code = 500
+        size = 0
+
+        async def send_wrapper(message):
+            nonlocal status_code, size
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            latency = time.perf_counter() - start
+            _current_request.reset(token)
+            # le modèle de chemin (ex : /user/{user_id}/comptes/) plutôt que le chemin réel, pour borner le nombre de séries
+            route = scope.get("route")
+            template = getattr(route, "path", "<unmatched>")
+            metrics = routes.setdefault((scope["method"], template), RouteMetrics())
+            metrics.latency.observe(latency)
+            metrics.response_size.observe(size)
+            metrics.sql_statements.observe(stats.sql_count)
+            metrics.sql_seconds += stats.sql_time
+            metrics.statuses[status_code] = metrics.statuses.get(status_code, 0) + 1
+            if SLOW_REQUEST_MS and latency * 1000 >= SLOW_REQUEST_MS:
+                log_slow_request(scope["method"], scope["path"], template, latency, stats)
+
+
+def log_slow_request(method: str, path: str, template: str, latency: float, stats: RequestStats):
+    """
+    Cette fonction permet de journaliser une requête lente avec ses requêtes SQL, de la plus lente à la plus rapide
+    @return None
+    """
+    lines = [
+        f"Slow request {method} {path} ({template}): {latency * 1000:.1f} ms, "
+        f"{stats.sql_count} SQL statements in {stats.sql_time * 1000:.1f} ms"
+    ]
+    for duration, statement in sorted(stats.statements, key=lambda item: item[0], reverse=True):
+        lines.append(f"  {duration * 1000:8.2f} ms  {' '.join(statement.split())}")
+    logger.warning("\n".join(lines))
+
+
+def render_prometheus() -> str:
+    """
+    Cette fonction permet de produire toutes les mesures au format texte de Prometheus
+    @return str
+    """
+    lines = [
+        "# HELP http_request_duration_seconds Request latency per route template.",
+        "# TYPE http_request_duration_seconds histogram",
+    ]
+    for (method, template), metrics in routes.items():
+        lines += metrics.latency.render("http_request_duration_seconds", f'method="{method}",route="{template}"')
+    lines += [
+        "# HELP http_response_size_bytes Response body size per route template.",
+        "# TYPE http_response_size_bytes histogram",
+    ]
+    for (method, template), metrics in routes.items():
+        lines += metrics.response_size.render("http_response_size_bytes", f'method="{method}",route="{template}"')
+    lines += [
+        "# HELP http_request_sql_statements SQL statements executed per request.",
+        "# TYPE http_request_sql_statements histogram",
+    ]
+    for (method, template), metrics in routes.items():
+        lines += metrics.sql_statements.render("http_request_sql_statements", f'method="{method}",route="{template}"')
+    lines += [
+        "# HELP http_request_sql_seconds_total Total time spent in SQL statements per route template.",
+        "# TYPE http_request_sql_seconds_total counter",
+    ]
+    for (method, template), metrics in routes.items():
+        lines.append(f'http_request_sql_seconds_total{{method="{method}",route="{template}"}} {metrics.sql_seconds}')
+    lines += [
+        "# HELP http_requests_total Requests per route template and status code.",
+        "# TYPE http_requests_total counter",
+    ]
+    for (method, template), metrics in routes.items():
+        for status_code, count in sorted(metrics.statuses.items()):
+            lines.append(f'http_requests_total{{method="{method}",route="{template}",status="{status_code}"}} {count}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,67 @@
+# --- Environnement des migrations Alembic
+from logging.config import fileConfig
+from alembic import context
+
+import database
+import models  # enregistre les modèles dans database.Base.metadata
+
+config = context.config
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name, disable_existing_loggers=False)
+
+target_metadata = database.Base.metadata
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """
+    Cette fonction permet d'écarter de la comparaison avec les modèles les index de recherche créés par la migration 0006,
+    qui n'ont pas d'équivalent dans les modèles : tables FTS5 de SQLite (et leurs tables internes), index pg_trgm
+    @return bool
+    """
+    if type_ == "table" and "_fts" in name:
+        return False
+    if type_ == "index" and name.endswith("_trgm"):
+        return False
+    return True
+
+
+def run_migrations_offline():
+    """
+    Cette fonction permet de générer le SQL des migrations sans connexion à la base (alembic upgrade head --sql)
+    @return None
+    """
+    context.configure(
+        url=database.DATABASE_URL,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        render_as_batch=True,
+        include_object=include_object,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    """
+    Cette fonction permet d'appliquer les migrations sur la base de données
+    @return None
+    """
+    connection = config.attributes.get("connection")
+    if connection is None:
+        with database.engine.connect() as connection:
+            _run(connection)
+    else:
+        _run(connection)
+
+
+def _run(connection):
+    # render_as_batch : SQLite ne sait pas modifier une table existante, Alembic la recrée
+    context.configure(connection=connection, target_metadata=target_metadata, render_as_batch=True, include_object=include_object)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
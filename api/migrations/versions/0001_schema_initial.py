@@ -0,0 +1,59 @@
+"""Schéma initial (tables créées auparavant par create_all)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "Utilisateur",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("login", sa.String()),
+        sa.Column("email", sa.String()),
+        sa.Column("password", sa.String()),
+        sa.Column("date_creation", sa.DateTime()),
+        sa.Column("date_derniere_connexion", sa.DateTime()),
+    )
+    op.create_index("ix_Utilisateur_id", "Utilisateur", ["id"])
+    op.create_index("ix_Utilisateur_login", "Utilisateur", ["login"], unique=True)
+    op.create_index("ix_Utilisateur_email", "Utilisateur", ["email"], unique=True)
+
+    op.create_table(
+        "Compte",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nom", sa.String(), unique=True),
+        sa.Column("utilisateur_id", sa.Integer(), sa.ForeignKey("Utilisateur.id")),
+    )
+    op.create_index("ix_Compte_id", "Compte", ["id"])
+
+    op.create_table(
+        "Personnage",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nom", sa.String(), unique=True),
+        sa.Column("compte_id", sa.Integer(), sa.ForeignKey("Compte.id")),
+    )
+    op.create_index("ix_Personnage_id", "Personnage", ["id"])
+
+    op.create_table(
+        "Inventaire",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("objet", sa.String()),
+        sa.Column("personnage_id", sa.Integer(), sa.ForeignKey("Personnage.id")),
+    )
+    op.create_index("ix_Inventaire_id", "Inventaire", ["id"])
+
+
+def downgrade():
+    op.drop_table("Inventaire")
+    op.drop_table("Personnage")
+    op.drop_table("Compte")
+    op.drop_table("Utilisateur")
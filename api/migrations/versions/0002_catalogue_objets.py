@@ -0,0 +1,74 @@
+"""Catalogue des objets et inventaire en emplacements empilables
+
+Les anciennes lignes (personnage_id, objet) sont regroupées en un emplacement par objet et par personnage,
+la quantité étant le nombre de lignes identiques.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-17
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "Objet",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("nom", sa.String(), nullable=False),
+    )
+    op.create_index("ix_Objet_id", "Objet", ["id"])
+    op.create_index("ix_Objet_nom", "Objet", ["nom"], unique=True)
+
+    op.drop_index("ix_Inventaire_id", table_name="Inventaire")
+    op.rename_table("Inventaire", "Inventaire_ancien")
+    op.create_table(
+        "Inventaire",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        # clés nommées (convention fk_<table>_<colonne>_<table référencée>) : PostgreSQL nommerait sinon la première
+        # Inventaire_personnage_id_fkey1, Inventaire_ancien ayant encore Inventaire_personnage_id_fkey
+        sa.Column("personnage_id", sa.Integer(), sa.ForeignKey("Personnage.id", name="fk_Inventaire_personnage_id_Personnage"), nullable=False),
+        sa.Column("objet_id", sa.Integer(), sa.ForeignKey("Objet.id", name="fk_Inventaire_objet_id_Objet"), nullable=False),
+        sa.Column("quantite", sa.Integer(), nullable=False),
+        sa.UniqueConstraint("personnage_id", "objet_id", name="uq_Inventaire_personnage_objet"),
+    )
+    op.create_index("ix_Inventaire_id", "Inventaire", ["id"])
+    op.create_index("ix_Inventaire_objet_personnage", "Inventaire", ["objet_id", "personnage_id"])
+
+    op.execute(
+        'INSERT INTO "Objet" (nom) '
+        'SELECT DISTINCT objet FROM "Inventaire_ancien" WHERE objet IS NOT NULL'
+    )
+    op.execute(
+        'INSERT INTO "Inventaire" (personnage_id, objet_id, quantite) '
+        'SELECT ancien.personnage_id, o.id, COUNT(*) FROM "Inventaire_ancien" ancien '
+        'JOIN "Objet" o ON o.nom = ancien.objet '
+        'WHERE ancien.personnage_id IS NOT NULL '
+        'GROUP BY ancien.personnage_id, o.id'
+    )
+    op.drop_table("Inventaire_ancien")
+
+
+def downgrade():
+    op.drop_index("ix_Inventaire_objet_personnage", table_name="Inventaire")
+    op.drop_index("ix_Inventaire_id", table_name="Inventaire")
+    op.rename_table("Inventaire", "Inventaire_emplacements")
+    op.create_table(
+        "Inventaire",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("objet", sa.String()),
+        sa.Column("personnage_id", sa.Integer(), sa.ForeignKey("Personnage.id")),
+    )
+    op.create_index("ix_Inventaire_id", "Inventaire", ["id"])
+    # les quantités sont perdues : une ligne par emplacement
+    op.execute(
+        'INSERT INTO "Inventaire" (objet, personnage_id) '
+        'SELECT o.nom, e.personnage_id FROM "Inventaire_emplacements" e JOIN "Objet" o ON o.id = e.objet_id'
+    )
+    op.drop_table("Inventaire_emplacements")
+    op.drop_table("Objet")
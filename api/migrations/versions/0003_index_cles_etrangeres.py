@@ -0,0 +1,24 @@
+"""Index sur les clés étrangères de la hiérarchie utilisateur → compte → personnage
+
+Inventaire.personnage_id est déjà couvert par la contrainte unique (personnage_id, objet_id).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index("ix_Compte_utilisateur_id", "Compte", ["utilisateur_id"])
+    op.create_index("ix_Personnage_compte_id", "Personnage", ["compte_id"])
+
+
+def downgrade():
+    op.drop_index("ix_Personnage_compte_id", table_name="Personnage")
+    op.drop_index("ix_Compte_utilisateur_id", table_name="Compte")
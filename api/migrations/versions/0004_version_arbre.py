@@ -0,0 +1,29 @@
+"""Version de l'arbre (version_arbre) sur Utilisateur, Compte et Personnage
+
+Incrémentée à chaque modification de la ligne ou de l'un de ses descendants, elle sert d'ETag aux routes de lecture.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+TABLES = ("Utilisateur", "Compte", "Personnage")
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column("version_arbre", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade():
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("version_arbre")
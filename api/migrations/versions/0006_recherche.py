@@ -0,0 +1,63 @@
+"""Index de recherche par nom (trigrammes) sur Compte, Personnage et Objet
+
+SQLite : une table FTS5 (tokenizer trigram) à contenu externe par table, tenue à jour par des triggers.
+PostgreSQL : extension pg_trgm et index GIN sur les colonnes nom.
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2026-10-17
+"""
+from alembic import op
+
+revision = "0006"
+down_revision = "0005"
+branch_labels = None
+depends_on = None
+
+TABLES = ("Compte", "Personnage", "Objet")
+
+
+def sqlite_triggers(table: str) -> list[str]:
+    """
+    Cette fonction permet de construire les triggers qui reportent les écritures d'une table dans sa table FTS5
+    (la modification d'une autre colonne que nom ne touche pas l'index)
+    @param table: str
+    @return list[str]
+    """
+    fts = f"{table}_fts"
+    insert = f'INSERT INTO "{fts}"(rowid, nom) VALUES (new.id, new.nom);'
+    delete = f'INSERT INTO "{fts}"("{fts}", rowid, nom) VALUES (\'delete\', old.id, old.nom);'
+    return [
+        f'CREATE TRIGGER "{fts}_ai" AFTER INSERT ON "{table}" BEGIN {insert} END',
+        f'CREATE TRIGGER "{fts}_ad" AFTER DELETE ON "{table}" BEGIN {delete} END',
+        f'CREATE TRIGGER "{fts}_au" AFTER UPDATE OF nom ON "{table}" BEGIN {delete} {insert} END',
+    ]
+
+
+def upgrade():
+    if op.get_bind().dialect.name == "sqlite":
+        for table in TABLES:
+            fts = f"{table}_fts"
+            op.execute(f'CREATE VIRTUAL TABLE "{fts}" USING fts5(nom, content=\'{table}\', content_rowid=\'id\', tokenize=\'trigram\')')
+            for trigger in sqlite_triggers(table):
+                op.execute(trigger)
+            # indexation des lignes existantes
+            op.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+    else:
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        for table in TABLES:
+            op.create_index(
+                f"ix_{table}_nom_trgm", table, ["nom"], postgresql_using="gin", postgresql_ops={"nom": "gin_trgm_ops"}
+            )
+
+
+def downgrade():
+    if op.get_bind().dialect.name == "sqlite":
+        for table in reversed(TABLES):
+            fts = f"{table}_fts"
+            for suffix in ("ai", "ad", "au"):
+                op.execute(f'DROP TRIGGER IF EXISTS "{fts}_{suffix}"')
+            op.execute(f'DROP TABLE "{fts}"')
+    else:
+        for table in reversed(TABLES):
+            op.drop_index(f"ix_{table}_nom_trgm", table_name=table)
@@ -0,0 +1,89 @@
+"""Suppressions en cascade (ON DELETE CASCADE) de l'arbre Utilisateur -> Compte -> Personnage -> Inventaire
+
+Supprimer une ligne de l'arbre devient un seul DELETE : la base supprime ses descendants.
+SQLite ne sait pas modifier une clé étrangère : les tables sont recréées (batch), ce qui supprime les triggers de
+recherche de la migration 0006 sur Compte et Personnage ; ils sont recréés et les index FTS5 reconstruits.
+
+Revision ID: 0007
+Revises: 0006
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0007"
+down_revision = "0006"
+branch_labels = None
+depends_on = None
+
+# (table, colonne, table référencée)
+FOREIGN_KEYS = (
+    ("Compte", "utilisateur_id", "Utilisateur"),
+    ("Personnage", "compte_id", "Compte"),
+    ("Inventaire", "personnage_id", "Personnage"),
+)
+# SQLite : les clés étrangères créées par les migrations précédentes n'ont pas de nom, la convention leur en donne un
+NAMING_CONVENTION = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+# tables indexées pour la recherche (migration 0006) parmi celles qui sont recréées
+SEARCH_TABLES = ("Compte", "Personnage")
+
+
+def foreign_key_name(table: str, column: str, referred: str) -> str:
+    """
+    Cette fonction permet de récupérer le nom d'une clé étrangère tel qu'il est en base (PostgreSQL a pu le suffixer,
+    ex : Inventaire_personnage_id_fkey1), ou celui de la convention si elle n'en a pas (SQLite, clé créée sans nom)
+    @param table: str
+    @param column: str
+    @param referred: str
+    @return str
+    """
+    for foreign_key in sa.inspect(op.get_bind()).get_foreign_keys(table):
+        if foreign_key["constrained_columns"] == [column] and foreign_key["referred_table"] == referred and foreign_key["name"]:
+            return foreign_key["name"]
+    return NAMING_CONVENTION["fk"] % {"table_name": table, "column_0_name": column, "referred_table_name": referred}
+
+
+def sqlite_triggers(table: str) -> list[str]:
+    """
+    Cette fonction permet de construire les triggers qui reportent les écritures d'une table dans sa table FTS5
+    (les mêmes que la migration 0006)
+    @param table: str
+    @return list[str]
+    """
+    fts = f"{table}_fts"
+    insert = f'INSERT INTO "{fts}"(rowid, nom) VALUES (new.id, new.nom);'
+    delete = f'INSERT INTO "{fts}"("{fts}", rowid, nom) VALUES (\'delete\', old.id, old.nom);'
+    return [
+        f'CREATE TRIGGER "{fts}_ai" AFTER INSERT ON "{table}" BEGIN {insert} END',
+        f'CREATE TRIGGER "{fts}_ad" AFTER DELETE ON "{table}" BEGIN {delete} END',
+        f'CREATE TRIGGER "{fts}_au" AFTER UPDATE OF nom ON "{table}" BEGIN {delete} {insert} END',
+    ]
+
+
+def set_ondelete(ondelete: str | None):
+    """
+    Cette fonction permet de recréer les clés étrangères de l'arbre avec l'action ON DELETE donnée
+    @param ondelete: str | None ("CASCADE", ou None pour l'action par défaut)
+    @return None
+    """
+    for table, column, referred in FOREIGN_KEYS:
+        name = foreign_key_name(table, column, referred)
+        with op.batch_alter_table(table, naming_convention=NAMING_CONVENTION) as batch_op:
+            batch_op.drop_constraint(name, type_="foreignkey")
+            batch_op.create_foreign_key(name, referred, [column], ["id"], ondelete=ondelete)
+    if op.get_bind().dialect.name == "sqlite":
+        for table in SEARCH_TABLES:
+            fts = f"{table}_fts"
+            for suffix in ("ai", "ad", "au"):
+                op.execute(f'DROP TRIGGER IF EXISTS "{fts}_{suffix}"')
+            for trigger in sqlite_triggers(table):
+                op.execute(trigger)
+            op.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
+
+
+def upgrade():
+    set_ondelete("CASCADE")
+
+
+def downgrade():
+    set_ondelete(None)
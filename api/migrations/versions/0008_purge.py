@@ -0,0 +1,70 @@
+"""Suppressions en arrière-plan : marque date_suppression (Utilisateur, Compte, Personnage) et table Purge
+
+Sous SQLite, ajouter une colonne ne recrée pas les tables ; la retirer (downgrade) les recrée (batch), ce qui supprime
+les triggers de recherche de la migration 0006 sur Compte et Personnage : ils sont alors recréés et les index FTS5 reconstruits.
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0008"
+down_revision = "0007"
+branch_labels = None
+depends_on = None
+
+TABLES = ("Utilisateur", "Compte", "Personnage")
+# tables indexées pour la recherche (migration 0006) parmi celles qui sont recréées
+SEARCH_TABLES = ("Compte", "Personnage")
+
+
+def sqlite_triggers(table: str) -> list[str]:
+    """
+    Cette fonction permet de construire les triggers qui reportent les écritures d'une table dans sa table FTS5
+    (les mêmes que la migration 0006)
+    @param table: str
+    @return list[str]
+    """
+    fts = f"{table}_fts"
+    insert = f'INSERT INTO "{fts}"(rowid, nom) VALUES (new.id, new.nom);'
+    delete = f'INSERT INTO "{fts}"("{fts}", rowid, nom) VALUES (\'delete\', old.id, old.nom);'
+    return [
+        f'CREATE TRIGGER "{fts}_ai" AFTER INSERT ON "{table}" BEGIN {insert} END',
+        f'CREATE TRIGGER "{fts}_ad" AFTER DELETE ON "{table}" BEGIN {delete} END',
+        f'CREATE TRIGGER "{fts}_au" AFTER UPDATE OF nom ON "{table}" BEGIN {delete} {insert} END',
+    ]
+
+
+def upgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.add_column(sa.Column("date_suppression", sa.DateTime(), nullable=True))
+    op.create_table(
+        "Purge",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("cible_id", sa.Integer(), nullable=False),
+        sa.Column("utilisateur_id", sa.Integer(), nullable=True),
+        sa.Column("lignes_supprimees", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("date_demande", sa.DateTime(), nullable=False),
+        sa.Column("date_fin", sa.DateTime(), nullable=True),
+    )
+    op.create_index("ix_Purge_id", "Purge", ["id"])
+
+
+def downgrade():
+    op.drop_index("ix_Purge_id", table_name="Purge")
+    op.drop_table("Purge")
+    for table in reversed(TABLES):
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column("date_suppression")
+    if op.get_bind().dialect.name == "sqlite":
+        for table in SEARCH_TABLES:
+            fts = f"{table}_fts"
+            for suffix in ("ai", "ad", "au"):
+                op.execute(f'DROP TRIGGER IF EXISTS "{fts}_{suffix}"')
+            for trigger in sqlite_triggers(table):
+                op.execute(trigger)
+            op.execute(f'INSERT INTO "{fts}"("{fts}") VALUES (\'rebuild\')')
@@ -0,0 +1,32 @@
+"""Journal des modifications (table Changement) pour la synchronisation incrémentale (GET /changes/)
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2026-10-17
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = "0009"
+down_revision = "0008"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "Changement",
+        sa.Column("id", sa.Integer(), primary_key=True),
+        sa.Column("utilisateur_id", sa.Integer(), sa.ForeignKey("Utilisateur.id", ondelete="CASCADE"), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("cible_id", sa.Integer(), nullable=False),
+        sa.Column("operation", sa.String(), nullable=False),
+        sa.Column("date", sa.DateTime(), nullable=False),
+        sqlite_autoincrement=True,
+    )
+    op.create_index("ix_Changement_utilisateur_curseur", "Changement", ["utilisateur_id", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_Changement_utilisateur_curseur", table_name="Changement")
+    op.drop_table("Changement")
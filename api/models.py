@@ -1,8 +1,24 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, ForeignKey, DateTime, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
+from sqlalchemy.ext.associationproxy import association_proxy
 from database import Base
 from tasks import get_current_datetime
 
+# version_arbre (Utilisateur, Compte, Personnage) est incrémentée à chaque modification de la ligne ou de l'un de ses descendants
+# (services.user.touch_tree) : les routes de lecture en tirent leur ETag sans charger l'arbre
+
+# version (Compte, Personnage, Inventaire) est incrémentée à chaque modification de la ligne elle-même : les modifications
+# sont des UPDATE conditionnels (WHERE version = version lue), une écriture concurrente est refusée au lieu d'être écrasée
+
+# Les clés étrangères de l'arbre (Utilisateur -> Compte -> Personnage -> Inventaire) sont en ON DELETE CASCADE : supprimer
+# une ligne est un seul DELETE, la base supprime ses descendants sans qu'ils soient chargés (passive_deletes=True)
+
+# date_suppression (Utilisateur, Compte, Personnage) marque une ligne supprimée en arrière-plan (DELETE ...?mode=async) :
+# elle est cachée avec ses descendants de toutes les requêtes ORM, puis supprimée par lots par services.purge
+
+# Les relations ne sont jamais chargées à la volée (lazy="raise_on_sql") : les services déclarent les relations à charger
+# avec services.utils.loading_plan, ce qui évite une requête par compte / personnage / inventaire lors de la sérialisation
+
 # --- Modèle Utilisateur
 class Utilisateur(Base):
     __tablename__ = "Utilisateur"
@@ -12,42 +28,102 @@ class Utilisateur(Base):
     password = Column(String)
     date_creation = Column(DateTime, default=get_current_datetime)
     date_derniere_connexion = Column(DateTime, default=get_current_datetime)
+    version_arbre = Column(Integer, nullable=False, default=1, server_default="1")
+    date_suppression = Column(DateTime, nullable=True)
 
     # Relation : un utilisateur peut avoir plusieurs comptes
-    comptes = relationship("Compte", back_populates="utilisateur")
+    comptes = relationship("Compte", back_populates="utilisateur", lazy="raise_on_sql", cascade="all", passive_deletes=True)
 
 # --- Modèle Compte
 class Compte(Base):
     __tablename__ = "Compte"
     id = Column(Integer, primary_key=True, index=True)
     nom = Column(String, unique=True)
-    utilisateur_id = Column(Integer, ForeignKey("Utilisateur.id"))
+    utilisateur_id = Column(Integer, ForeignKey("Utilisateur.id", ondelete="CASCADE"), index=True)
+    version_arbre = Column(Integer, nullable=False, default=1, server_default="1")
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    date_suppression = Column(DateTime, nullable=True)
 
     # Relation : un compte est associé à un utilisateur
-    utilisateur = relationship("Utilisateur", back_populates="comptes")
+    utilisateur = relationship("Utilisateur", back_populates="comptes", lazy="raise_on_sql")
 
     # Relation : un compte peut avoir plusieurs personnages
-    personnages = relationship("Personnage", back_populates="compte")
+    personnages = relationship("Personnage", back_populates="compte", lazy="raise_on_sql", cascade="all", passive_deletes=True)
 
 # --- Modèle Personnage
 class Personnage(Base):
     __tablename__ = "Personnage"
     id = Column(Integer, primary_key=True, index=True)
     nom = Column(String, unique=True)
-    compte_id = Column(Integer, ForeignKey("Compte.id"))
+    compte_id = Column(Integer, ForeignKey("Compte.id", ondelete="CASCADE"), index=True)
+    version_arbre = Column(Integer, nullable=False, default=1, server_default="1")
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+    date_suppression = Column(DateTime, nullable=True)
 
     # Relation : un personnage est associé à un compte
-    compte = relationship("Compte", back_populates="personnages")
+    compte = relationship("Compte", back_populates="personnages", lazy="raise_on_sql")
+
+    # Relation : un personnage a un inventaire composé de plusieurs emplacements (un par objet)
+    inventaire = relationship(
+        "Inventaire", back_populates="personnage", order_by="Inventaire.id", lazy="raise_on_sql", cascade="all", passive_deletes=True
+    )
 
-    # Relation : un personnage a un seul inventaire
-    inventaire = relationship("Inventaire", uselist=False, back_populates="personnage")
+# --- Modèle Objet (catalogue des objets du jeu)
+class Objet(Base):
+    __tablename__ = "Objet"
+    id = Column(Integer, primary_key=True, index=True)
+    nom = Column(String, unique=True, index=True, nullable=False)
 
-# --- Modèle Inventaire
+# --- Modèle Inventaire (un emplacement : un objet du catalogue et sa quantité pour un personnage)
 class Inventaire(Base):
     __tablename__ = "Inventaire"
     id = Column(Integer, primary_key=True, index=True)
-    objet = Column(String)
-    personnage_id = Column(Integer, ForeignKey("Personnage.id"))
+    personnage_id = Column(Integer, ForeignKey("Personnage.id", ondelete="CASCADE"), nullable=False)
+    objet_id = Column(Integer, ForeignKey("Objet.id"), nullable=False)
+    quantite = Column(Integer, nullable=False, default=1)
+    version = Column(Integer, nullable=False, default=1, server_default="1")
+
+    __table_args__ = (
+        # un seul emplacement par objet et par personnage : les quantités s'empilent (et index de l'inventaire d'un personnage)
+        UniqueConstraint("personnage_id", "objet_id", name="uq_Inventaire_personnage_objet"),
+        # index pour retrouver les personnages qui possèdent un objet
+        Index("ix_Inventaire_objet_personnage", "objet_id", "personnage_id"),
+    )
+
+    # Relation : un emplacement est associé à un seul personnage
+    personnage = relationship("Personnage", back_populates="inventaire", lazy="raise_on_sql")
+
+    # Relation : un emplacement contient un objet du catalogue, toujours chargé avec l'emplacement (jointure)
+    objet_catalogue = relationship("Objet", lazy="joined", innerjoin=True)
+    # nom de l'objet, exposé directement sur l'emplacement
+    objet = association_proxy("objet_catalogue", "nom")
+
+# --- Modèle Purge (suppression en arrière-plan d'un utilisateur, d'un compte ou d'un personnage marqué, voir services.purge)
+class Purge(Base):
+    __tablename__ = "Purge"
+    id = Column(Integer, primary_key=True, index=True)
+    type = Column(String, nullable=False)  # "utilisateur", "compte" ou "personnage"
+    cible_id = Column(Integer, nullable=False)
+    # propriétaire de l'arbre, seul à suivre la purge (sans clé étrangère : la purge d'un utilisateur lui survit)
+    utilisateur_id = Column(Integer, nullable=True)
+    lignes_supprimees = Column(Integer, nullable=False, default=0, server_default="0")
+    date_demande = Column(DateTime, nullable=False, default=get_current_datetime)
+    date_fin = Column(DateTime, nullable=True)
+
+# --- Modèle Changement (journal des modifications de l'arbre d'un utilisateur, lu par GET /changes/)
+# journal en ajout seul, écrit dans la transaction de chaque modification (services.user.record_changes) ; l'id croissant sert
+# de curseur (AUTOINCREMENT sous SQLite : un id n'est jamais réutilisé). Le journal d'un utilisateur est supprimé avec lui
+class Changement(Base):
+    __tablename__ = "Changement"
+    id = Column(Integer, primary_key=True)
+    utilisateur_id = Column(Integer, ForeignKey("Utilisateur.id", ondelete="CASCADE"), nullable=False)
+    type = Column(String, nullable=False)  # "utilisateur", "compte", "personnage" ou "inventaire"
+    cible_id = Column(Integer, nullable=False)
+    operation = Column(String, nullable=False)  # "create", "update" ou "delete"
+    date = Column(DateTime, nullable=False, default=get_current_datetime)
 
-    # Relation : un inventaire est associé à un seul personnage
-    personnage = relationship("Personnage", back_populates="inventaire")
+    __table_args__ = (
+        # index des changements d'un utilisateur après un curseur
+        Index("ix_Changement_utilisateur_curseur", "utilisateur_id", "id"),
+        {"sqlite_autoincrement": True},
+    )
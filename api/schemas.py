@@ -1,6 +1,6 @@
 from pydantic import BaseModel, Field
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Literal, Optional
 from tasks import get_current_datetime
 
 # --- Schémas pour Token
@@ -28,6 +28,15 @@ class Utilisateur(UtilisateurBase):
     class Config:
         from_attributes = True
 
+class UtilisateurSimple(UtilisateurBase):
+    """
+    Utilisateur sans ses comptes (lignes plates, ex : GET /users/?flat=true)
+    """
+    id: int
+
+    class Config:
+        from_attributes = True
+
 # --- Schémas Compte
 class CompteBase(BaseModel):
     nom: str
@@ -35,9 +44,14 @@ class CompteBase(BaseModel):
 class CompteCreate(CompteBase):
     pass
 
+class CompteUpdate(CompteCreate):
+    # version lue par le client : la modification est refusée (409) si le compte a été modifié depuis
+    version: Optional[int] = None
+
 class Compte(CompteBase):
     id: int
     utilisateur_id: int
+    version: int
     personnages: Optional[List['Personnage']] = []
 
     class Config:
@@ -50,26 +64,149 @@ class PersonnageBase(BaseModel):
 class PersonnageCreate(PersonnageBase):
     pass
 
+class PersonnageUpdate(PersonnageCreate):
+    # version lue par le client : la modification est refusée (409) si le personnage a été modifié depuis
+    version: Optional[int] = None
+
 class Personnage(PersonnageBase):
     id: int
     compte_id: int
-    inventaire: Optional['Inventaire'] = None
+    version: int
+    inventaire: List['Inventaire'] = []
 
     class Config:
         from_attributes = True
 
-# --- Schémas Inventaire
+# --- Schémas Inventaire (un emplacement : un objet et sa quantité)
 class InventaireBase(BaseModel):
     objet : str
-    pass
 
 class InventaireCreate(InventaireBase):
-    pass
+    # quantité ajoutée à celle déjà possédée
+    quantite: int = Field(default=1, ge=1)
+
+class InventaireUpdate(InventaireBase):
+    # nouvelle quantité, 0 retire l'objet de l'inventaire
+    quantite: int = Field(ge=0)
+    # version lue par le client : la modification est refusée (409) si l'emplacement a été modifié depuis
+    version: Optional[int] = None
 
 class Inventaire(InventaireBase):
     id: int
     personnage_id: int
+    objet_id: int
+    quantite: int
+    version: int
+
+    class Config:
+        from_attributes = True
 
+class InventaireOperation(BaseModel):
+    """
+    Opération d'un lot d'inventaire : "add" (objet requis, quantité empilée), "update" (id et quantite requis) ou "remove" (id requis).
+    version (update / remove) : l'opération est refusée ("conflict") si l'emplacement a été modifié depuis ;
+    une opération suivie dans le lot d'une autre sur le même emplacement n'est pas appliquée ("superseded")
+    """
+    action: Literal["add", "update", "remove"]
+    id: Optional[int] = None
+    objet: Optional[str] = None
+    quantite: Optional[int] = Field(default=None, ge=0)
+    version: Optional[int] = None
+
+class InventaireBatch(BaseModel):
+    operations: List[InventaireOperation] = Field(max_length=1000)
+
+class InventaireOperationResult(BaseModel):
+    index: int
+    action: str
+    status: Literal["ok", "not_found", "invalid", "conflict", "superseded"]
+    id: Optional[int] = None
+    objet: Optional[str] = None
+    quantite: Optional[int] = None
+    version: Optional[int] = None
+    detail: Optional[str] = None
+
+# --- Recherche par nom (GET /search/) : compte_id et utilisateur_id situent le résultat dans l'arbre
+class SearchResult(BaseModel):
+    type: Literal["personnage", "compte", "objet"]
+    id: int
+    nom: str
+    compte_id: Optional[int] = None
+    utilisateur_id: Optional[int] = None
+    # plus petit = meilleur : -similarity sous PostgreSQL ; sous SQLite, bm25 (fuzzy) ou -part du nom couverte par q
+    score: float
+
+# --- Import en masse (POST /import/) : une ligne NDJSON par utilisateur avec ses comptes, personnages et inventaires
+class PersonnageImport(PersonnageCreate):
+    inventaire: List[InventaireCreate] = []
+
+class CompteImport(CompteCreate):
+    personnages: List[PersonnageImport] = []
+
+class UtilisateurImport(UtilisateurCreate):
+    comptes: List[CompteImport] = []
+
+class ImportLineError(BaseModel):
+    line: int
+    detail: str
+
+class ImportReport(BaseModel):
+    lines: int = 0
+    utilisateurs: int = 0
+    comptes: int = 0
+    personnages: int = 0
+    inventaire: int = 0
+    rejected: int = 0
+    # seules les IMPORT_MAX_ERRORS premières erreurs sont détaillées, rejected les compte toutes
+    errors: List[ImportLineError] = []
+
+# --- Suppressions en arrière-plan (DELETE ...?mode=async, suivies par GET /purges/{purge_id})
+class Purge(BaseModel):
+    id: int
+    type: Literal["utilisateur", "compte", "personnage"]
+    cible_id: int
+    statut: Literal["pending", "running", "done"]
+    lignes_supprimees: int = 0
+    # lignes qui restent à supprimer par table, la cible comprise
+    restantes: dict[str, int] = {}
+    date_demande: datetime
+    date_fin: Optional[datetime] = None
+
+# --- Synchronisation incrémentale (GET /changes/?since=<curseur>)
+class CompteSimple(CompteBase):
+    """
+    Compte sans ses personnages
+    """
+    id: int
+    utilisateur_id: int
+    version: int
 
     class Config:
         from_attributes = True
+
+class PersonnageSimple(PersonnageBase):
+    """
+    Personnage sans son inventaire
+    """
+    id: int
+    compte_id: int
+    version: int
+
+    class Config:
+        from_attributes = True
+
+class Change(BaseModel):
+    # curseur du changement : la synchronisation suivante reprend après lui
+    cursor: int
+    type: Literal["utilisateur", "compte", "personnage", "inventaire"]
+    id: int
+    operation: Literal["create", "update", "delete"]
+    # état actuel de la ligne, sans ses relations ; absent pour une suppression, qui vaut aussi pour les descendants de la ligne
+    data: Optional[UtilisateurSimple | CompteSimple | PersonnageSimple | Inventaire] = None
+
+class ChangesPage(BaseModel):
+    # à renvoyer dans ?since= à la synchronisation suivante
+    cursor: int
+    changes: List[Change] = []
+    # d'autres changements suivent : relancer aussitôt avec le nouveau curseur
+    has_more: bool = False
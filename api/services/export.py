@@ -0,0 +1,89 @@
+# --- Importation des modules
+# l'export parcourt la base avec un curseur côté serveur (yield_per) : seules EXPORT_BATCH_SIZE lignes sont en mémoire à la fois
+import csv
+import io
+import json
+import os
+from typing import AsyncIterator
+from sqlalchemy import select
+import database, models
+
+# --- Configuration de l'export
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+# une ligne par emplacement d'inventaire ; un compte sans personnage ou un personnage sans inventaire donne une ligne
+# dont les colonnes suivantes sont vides
+EXPORT_COLUMNS = {
+    "utilisateur_id": models.Utilisateur.id,
+    "login": models.Utilisateur.login,
+    "email": models.Utilisateur.email,
+    "compte_id": models.Compte.id,
+    "compte": models.Compte.nom,
+    "personnage_id": models.Personnage.id,
+    "personnage": models.Personnage.nom,
+    "inventaire_id": models.Inventaire.id,
+    "objet_id": models.Objet.id,
+    "objet": models.Objet.nom,
+    "quantite": models.Inventaire.quantite,
+}
+
+def export_statement(user_id: int | None = None):
+    """
+    Cette fonction permet de construire la requête de l'export (colonnes seules, aucun objet ORM n'est construit)
+    @param user_id: int | None (si défini, seul l'arbre de cet utilisateur est exporté)
+    @return Select
+    """
+    statement = (
+        select(*(column.label(name) for name, column in EXPORT_COLUMNS.items()))
+        .outerjoin(models.Compte, models.Compte.utilisateur_id == models.Utilisateur.id)
+        .outerjoin(models.Personnage, models.Personnage.compte_id == models.Compte.id)
+        .outerjoin(models.Inventaire, models.Inventaire.personnage_id == models.Personnage.id)
+        .outerjoin(models.Objet, models.Objet.id == models.Inventaire.objet_id)
+        .order_by(models.Utilisateur.id, models.Compte.id, models.Personnage.id, models.Inventaire.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+    if user_id is not None:
+        statement = statement.filter(models.Utilisateur.id == user_id)
+    return statement
+
+async def export_rows(user_id: int | None = None) -> AsyncIterator[list]:
+    """
+    Cette fonction permet de parcourir les lignes de l'export par lots de EXPORT_BATCH_SIZE
+    La session est ouverte ici et non par get_db : elle doit rester ouverte pendant tout l'envoi de la réponse.
+    L'export lit sur la réplique (DATABASE_READ_URL) si elle est configurée
+    @param user_id: int | None
+    @return AsyncIterator[list] (lots de lignes)
+    """
+    async with database.AsyncReadSessionLocal() as db:
+        result = await db.stream(export_statement(user_id))
+        async for partition in result.partitions():
+            yield partition
+
+async def export_ndjson(user_id: int | None = None) -> AsyncIterator[str]:
+    """
+    Cette fonction permet de produire l'export au format NDJSON (un objet JSON par ligne)
+    @param user_id: int | None
+    @return AsyncIterator[str]
+    """
+    keys = list(EXPORT_COLUMNS)
+    async for partition in export_rows(user_id):
+        yield "".join(json.dumps(dict(zip(keys, row)), separators=(",", ":")) + "\n" for row in partition)
+
+async def export_csv(user_id: int | None = None) -> AsyncIterator[str]:
+    """
+    Cette fonction permet de produire l'export au format CSV (en-tête puis une ligne par emplacement)
+    @param user_id: int | None
+    @return AsyncIterator[str]
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    async for partition in export_rows(user_id):
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(partition)
+        yield buffer.getvalue()
+
+EXPORTERS = {"ndjson": export_ndjson, "csv": export_csv}
@@ -0,0 +1,297 @@
+# --- Importation des modules
+# l'import lit un flux NDJSON (un utilisateur par ligne avec son arbre), le valide avec les schémas *Create et l'insère par lots :
+# un INSERT groupé par table et un commit par lot, les mots de passe d'un lot sont hashés en parallèle dans le pool de hashage
+import asyncio
+import hmac
+import logging
+import os
+import sys
+from typing import AsyncIterable, AsyncIterator
+from fastapi import Header, HTTPException, status
+from pydantic import ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+import database, models, schemas, tasks
+import services.utils as service_utils
+from services.user import get_objet_ids
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration de l'import
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE", 1000))
+IMPORT_MAX_ERRORS = 100
+# jeton de l'opérateur pour POST /import/ (en-tête X-Import-Token) : la route est désactivée s'il n'est pas défini,
+# un token d'utilisateur ne suffit pas (l'import crée des utilisateurs avec les mots de passe du fichier)
+IMPORT_TOKEN = os.getenv("IMPORT_TOKEN", "")
+
+def require_import_token(x_import_token: str | None = Header(default=None)):
+    """
+    Cette fonction permet de réserver l'import par l'API à l'opérateur du serveur : 403 si IMPORT_TOKEN n'est pas défini,
+    401 si l'en-tête X-Import-Token ne lui correspond pas
+    @param x_import_token: str | None
+    @return None
+    """
+    if not IMPORT_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Import is disabled on this server",
+        )
+    if x_import_token is None or not hmac.compare_digest(x_import_token.encode(), IMPORT_TOKEN.encode()):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid import token",
+        )
+
+async def hash_passwords(passwords: list[str]) -> list[str]:
+    """
+    Cette fonction permet de hasher des mots de passe en parallèle sans occuper plus de max_workers places du pool de hashage
+    (les connexions restent servies pendant un import)
+    @param passwords: list[str]
+    @return list[str]
+    """
+    limit = asyncio.Semaphore(tasks.hashing_pool.max_workers)
+
+    async def hash_one(password: str) -> str:
+        async with limit:
+            while True:
+                try:
+                    return await tasks.get_password_hash_async(password)
+                except tasks.HashingPoolFull:
+                    await asyncio.sleep(0.1)
+
+    return await asyncio.gather(*(hash_one(password) for password in passwords))
+
+async def _insert_returning_ids(db: AsyncSession, model, rows: list[dict]) -> list[int]:
+    if not rows:
+        return []
+    result = await db.execute(insert(model).returning(model.id, sort_by_parameter_order=True), rows)
+    return list(result.scalars())
+
+class Importer:
+    """
+    Cette classe permet d'importer des utilisateurs par lots et de compter les lignes importées et rejetées
+    """
+
+    def __init__(self, batch_size: int = IMPORT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.report = schemas.ImportReport()
+        # noms déjà vus pendant l'import : deux lignes ne peuvent pas créer le même login, email, compte ou personnage
+        self.seen: dict[str, set] = {"login": set(), "email": set(), "compte": set(), "personnage": set()}
+
+    def reject(self, line: int, detail: str):
+        self.report.rejected += 1
+        if len(self.report.errors) < IMPORT_MAX_ERRORS:
+            self.report.errors.append(schemas.ImportLineError(line=line, detail=detail))
+
+    def parse(self, line: int, raw: str | bytes) -> schemas.UtilisateurImport | None:
+        """
+        Cette fonction permet de valider une ligne NDJSON
+        @param line: int (numéro de la ligne, à partir de 1)
+        @param raw: str | bytes
+        @return schemas.UtilisateurImport | None (None si la ligne est rejetée)
+        """
+        try:
+            return schemas.UtilisateurImport.model_validate_json(raw)
+        except ValidationError as exc:
+            error = exc.errors()[0]
+            location = ".".join(str(part) for part in error["loc"])
+            self.reject(line, f"{location}: {error['msg']}" if location else error["msg"])
+            return None
+
+    async def filter_conflicts(self, db: AsyncSession, batch: list[tuple[int, schemas.UtilisateurImport]]) -> list:
+        """
+        Cette fonction permet d'écarter les utilisateurs dont un nom unique existe déjà en base ou plus tôt dans l'import
+        (un utilisateur est importé entièrement ou pas du tout)
+        @param db: AsyncSession
+        @param batch: list[tuple[int, schemas.UtilisateurImport]]
+        @return list[tuple[int, schemas.UtilisateurImport]]
+        """
+        def names(user):
+            comptes = [compte.nom for compte in user.comptes]
+            personnages = [personnage.nom for compte in user.comptes for personnage in compte.personnages]
+            return {"login": [user.login], "email": [user.email], "compte": comptes, "personnage": personnages}
+
+        columns = {
+            "login": models.Utilisateur.login,
+            "email": models.Utilisateur.email,
+            "compte": models.Compte.nom,
+            "personnage": models.Personnage.nom,
+        }
+        wanted = {kind: set() for kind in columns}
+        for _, user in batch:
+            for kind, values in names(user).items():
+                wanted[kind].update(values)
+        # les noms des lignes en cours de purge (cachées) sont encore pris : la contrainte d'unicité les voit
+        existing = {
+            kind: set(await db.scalars(
+                select(column).filter(column.in_(wanted[kind])).execution_options(include_deleted=True)
+            )) if wanted[kind] else set()
+            for kind, column in columns.items()
+        }
+
+        accepted = []
+        for line, user in batch:
+            user_names = names(user)
+            conflict = next((
+                (kind, value) for kind, values in user_names.items() for value in values
+                if value in existing[kind] or value in self.seen[kind]
+            ), None)
+            duplicate = next((kind for kind, values in user_names.items() if len(values) != len(set(values))), None)
+            if conflict:
+                self.reject(line, f"{conflict[0]} {conflict[1]!r} already exists")
+            elif duplicate:
+                self.reject(line, f"duplicate {duplicate} name in the same line")
+            else:
+                for kind, values in user_names.items():
+                    self.seen[kind].update(values)
+                accepted.append((line, user))
+        return accepted
+
+    async def insert_batch(self, batch: list[tuple[int, schemas.UtilisateurImport]]):
+        """
+        Cette fonction permet d'insérer un lot d'utilisateurs avec leurs arbres : un INSERT groupé par table et un commit
+        @param batch: list[tuple[int, schemas.UtilisateurImport]]
+        @return None
+        """
+        async with database.AsyncSessionLocal() as db:
+            batch = await self.filter_conflicts(db, batch)
+            # la connexion est rendue au pool pendant le hashage, qui est bien plus long que les insertions
+            await db.rollback()
+            if not batch:
+                return
+            users = [user for _, user in batch]
+            passwords = await hash_passwords([user.password for user in users])
+            try:
+                user_ids, compte_ids, personnage_ids, inventaire = await self.insert_trees(db, users, passwords)
+            except IntegrityError as exc:
+                # un nom a été pris par une autre requête depuis la vérification : le lot entier est rejeté
+                await db.rollback()
+                for line, _ in batch:
+                    self.reject(line, f"batch rejected by the database: {exc.orig}")
+                return
+
+        self.report.utilisateurs += len(user_ids)
+        self.report.comptes += len(compte_ids)
+        self.report.personnages += len(personnage_ids)
+        self.report.inventaire += len(inventaire)
+
+    async def insert_trees(self, db: AsyncSession, users: list[schemas.UtilisateurImport], passwords: list[str]) -> tuple:
+        """
+        Cette fonction permet d'insérer les utilisateurs et leurs arbres, table par table, puis de valider la transaction
+        @param db: AsyncSession
+        @param users: list[schemas.UtilisateurImport]
+        @param passwords: list[str] (mots de passe hashés, dans l'ordre des utilisateurs)
+        @return tuple (ids des utilisateurs, des comptes, des personnages, lignes d'inventaire)
+        """
+        user_ids = await _insert_returning_ids(db, models.Utilisateur, [
+            {**user.model_dump(include={"login", "email", "date_creation", "date_derniere_connexion"}), "password": password}
+            for user, password in zip(users, passwords)
+        ])
+        comptes = [(compte, user_id) for user, user_id in zip(users, user_ids) for compte in user.comptes]
+        compte_ids = await _insert_returning_ids(db, models.Compte, [
+            {"nom": compte.nom, "utilisateur_id": user_id} for compte, user_id in comptes
+        ])
+        personnages = [(personnage, compte_id) for (compte, _), compte_id in zip(comptes, compte_ids) for personnage in compte.personnages]
+        personnage_ids = await _insert_returning_ids(db, models.Personnage, [
+            {"nom": personnage.nom, "compte_id": compte_id} for personnage, compte_id in personnages
+        ])
+        noms = {item.objet for personnage, _ in personnages for item in personnage.inventaire}
+        objet_ids = await get_objet_ids(db, noms) if noms else {}
+        inventaire = []
+        for (personnage, _), personnage_id in zip(personnages, personnage_ids):
+            # un emplacement par objet : les quantités d'un même objet sont additionnées
+            quantites: dict[int, int] = {}
+            for item in personnage.inventaire:
+                objet_id = objet_ids[item.objet]
+                quantites[objet_id] = quantites.get(objet_id, 0) + item.quantite
+            inventaire.extend(
+                {"personnage_id": personnage_id, "objet_id": objet_id, "quantite": quantite}
+                for objet_id, quantite in quantites.items()
+            )
+        if inventaire:
+            await db.execute(insert(models.Inventaire), inventaire)
+        await db.commit()
+        return user_ids, compte_ids, personnage_ids, inventaire
+
+    async def run(self, lines: AsyncIterable[str | bytes]) -> AsyncIterator[schemas.ImportReport]:
+        """
+        Cette fonction permet d'importer un flux NDJSON, le rapport est renvoyé après chaque lot (progression)
+        @param lines: AsyncIterable[str | bytes] (lignes du flux, les lignes vides sont ignorées)
+        @return AsyncIterator[schemas.ImportReport]
+        """
+        batch = []
+        async for raw in lines:
+            self.report.lines += 1
+            if not raw.strip():
+                continue
+            user = self.parse(self.report.lines, raw)
+            if user is not None:
+                batch.append((self.report.lines, user))
+            if len(batch) >= self.batch_size:
+                await self.insert_batch(batch)
+                batch = []
+                yield self.report
+        if batch:
+            await self.insert_batch(batch)
+            yield self.report
+
+async def split_lines(chunks: AsyncIterable[bytes]) -> AsyncIterator[bytes]:
+    """
+    Cette fonction permet de découper un flux d'octets (ex : corps d'une requête) en lignes
+    @param chunks: AsyncIterable[bytes]
+    @return AsyncIterator[bytes]
+    """
+    pending = b""
+    async for chunk in chunks:
+        pending += chunk
+        *lines, pending = pending.split(b"\n")
+        for line in lines:
+            yield line
+    if pending:
+        yield pending
+
+async def import_ndjson(chunks: AsyncIterable[bytes], batch_size: int = IMPORT_BATCH_SIZE) -> schemas.ImportReport:
+    """
+    Cette fonction permet d'importer un flux NDJSON en journalisant la progression après chaque lot
+    @param chunks: AsyncIterable[bytes]
+    @param batch_size: int
+    @return schemas.ImportReport
+    """
+    importer = Importer(batch_size)
+    async for report in importer.run(split_lines(chunks)):
+        logger.info(
+            "Import: %d lines read, %d users imported, %d rejected",
+            report.lines, report.utilisateurs, report.rejected,
+        )
+    return importer.report
+
+# --- Ligne de commande
+# Lancer depuis le dossier api/ : python -m services.imports saison.ndjson [--batch-size 1000]
+async def _main(path: str, batch_size: int):
+    async def read_chunks():
+        with open(path, "rb") as file:
+            while chunk := file.read(1 << 20):
+                yield chunk
+
+    service_utils.create_database()
+    importer = Importer(batch_size)
+    try:
+        async for report in importer.run(split_lines(read_chunks())):
+            print(
+                f"{report.lines} lignes lues : {report.utilisateurs} utilisateurs, {report.comptes} comptes, "
+                f"{report.personnages} personnages, {report.inventaire} emplacements importés, {report.rejected} lignes rejetées",
+                file=sys.stderr,
+            )
+    finally:
+        tasks.hashing_pool.shutdown()
+    print(importer.report.model_dump_json(indent=2))
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Importe des utilisateurs avec leurs comptes, personnages et inventaires depuis un fichier NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--batch-size", type=int, default=IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+    asyncio.run(_main(args.path, args.batch_size))
@@ -0,0 +1,265 @@
+# --- Importation des modules
+# suppressions en arrière-plan (DELETE ...?mode=async) : la ligne est marquée (date_suppression) dans la requête, ce qui la
+# cache aussitôt avec ses descendants, puis PurgeWorker supprime ses descendants par petits lots, des feuilles vers la ligne
+# elle-même. Chaque lot est une transaction courte : l'écrivain (unique sous SQLite) n'est jamais bloqué longtemps
+import asyncio
+import logging
+import os
+from fastapi import HTTPException, Response, status
+from sqlalchemy import select, update, delete, func, event, exists, and_, or_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, with_loader_criteria
+import database, models, schemas, tasks
+import services.utils as service_utils
+
+logger = logging.getLogger(__name__)
+
+# --- Configuration de la purge
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", 1000))  # lignes supprimées par transaction
+PURGE_RATE = float(os.getenv("PURGE_RATE", 10))  # lots par seconde au plus (0 : sans pause entre les lots)
+PURGE_POLL_INTERVAL = float(os.getenv("PURGE_POLL_INTERVAL", 5))  # recherche des purges demandées par les autres workers
+
+# type de purge -> modèle de la ligne supprimée
+PURGE_TYPES = {
+    "utilisateur": models.Utilisateur,
+    "compte": models.Compte,
+    "personnage": models.Personnage,
+}
+# l'arbre de la racine aux feuilles : (table, colonne vers la table parente)
+TREE = (
+    (models.Utilisateur.__table__, None),
+    (models.Compte.__table__, models.Compte.__table__.c.utilisateur_id),
+    (models.Personnage.__table__, models.Personnage.__table__.c.compte_id),
+    (models.Inventaire.__table__, models.Inventaire.__table__.c.personnage_id),
+)
+
+# --- Lignes cachées
+# une ligne marquée est cachée, ainsi que les comptes et personnages d'un utilisateur marqué et les personnages d'un compte
+# marqué ; les sous-requêtes portent sur des alias des tables (tables Core : le critère ne s'y applique pas lui-même)
+_utilisateur = models.Utilisateur.__table__.alias("utilisateur_supprime")
+_compte = models.Compte.__table__.alias("compte_supprime")
+VISIBLE = {
+    models.Utilisateur: models.Utilisateur.date_suppression.is_(None),
+    models.Compte: and_(
+        models.Compte.date_suppression.is_(None),
+        ~exists().where(_utilisateur.c.id == models.Compte.utilisateur_id, _utilisateur.c.date_suppression.is_not(None)),
+    ),
+    models.Personnage: and_(
+        models.Personnage.date_suppression.is_(None),
+        ~exists()
+        .select_from(_compte.outerjoin(_utilisateur, _utilisateur.c.id == _compte.c.utilisateur_id))
+        .where(
+            _compte.c.id == models.Personnage.compte_id,
+            or_(_compte.c.date_suppression.is_not(None), _utilisateur.c.date_suppression.is_not(None)),
+        ),
+    ),
+}
+
+@event.listens_for(Session, "do_orm_execute")
+def hide_deleted(execute_state):
+    """
+    Cette fonction permet d'ajouter à chaque requête ORM (SELECT, UPDATE, DELETE, Session.get) le critère qui cache les lignes
+    marquées : une ligne en cours de purge n'est plus lue, et la modifier ou la supprimer renvoie une erreur 404.
+    Les chargements de relations (selectinload) reprennent le critère de la requête qui les déclenche ;
+    l'option d'exécution include_deleted=True lit aussi les lignes cachées
+    @param execute_state: ORMExecuteState
+    @return None
+    """
+    if execute_state.is_column_load or execute_state.is_relationship_load:
+        return
+    if execute_state.execution_options.get("include_deleted", False):
+        return
+    if execute_state.is_select or execute_state.is_update or execute_state.is_delete:
+        execute_state.statement = execute_state.statement.options(
+            *(with_loader_criteria(model, criteria, include_aliases=True) for model, criteria in VISIBLE.items())
+        )
+
+# --- Demande de purge
+def purge_levels(kind: str, cible_id: int) -> list[tuple]:
+    """
+    Cette fonction permet de construire, des feuilles vers la cible, la requête des identifiants à supprimer de chaque table
+    @param kind: str (clé de PURGE_TYPES)
+    @param cible_id: int
+    @return list[tuple] (table, Select des identifiants)
+    """
+    start = next(index for index, (table, _) in enumerate(TREE) if table is PURGE_TYPES[kind].__table__)
+    table = TREE[start][0]
+    # la cible doit être encore marquée : son identifiant a pu être réutilisé par SQLite après une suppression par un autre chemin
+    ids = select(table.c.id).where(table.c.id == cible_id, table.c.date_suppression.is_not(None))
+    levels = [(table, ids)]
+    for table, parent in TREE[start + 1:]:
+        ids = select(table.c.id).where(parent.in_(ids))
+        levels.append((table, ids))
+    return levels[::-1]
+
+async def mark_tree_node(db: AsyncSession, model, node_id: int) -> tuple:
+    """
+    Cette fonction permet de marquer un utilisateur, un compte ou un personnage comme supprimé et de demander sa purge,
+    dans la transaction de l'appelant. 404 si la ligne n'existe pas ou si elle est déjà cachée
+    @param db: AsyncSession
+    @param model: models.Utilisateur, models.Compte ou models.Personnage
+    @param node_id: int
+    @return tuple (Row : colonnes de la ligne marquée, models.Purge)
+    """
+    statement = update(model).filter(model.id == node_id).values(date_suppression=tasks.get_current_datetime())
+    statement = statement.returning(*model.__table__.columns).execution_options(synchronize_session=False)
+    row = (await db.execute(statement)).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{model.__name__} not found",
+        )
+    kind = next(kind for kind, purged in PURGE_TYPES.items() if purged is model)
+    purge = models.Purge(type=kind, cible_id=node_id)
+    db.add(purge)
+    await db.flush()
+    return row, purge
+
+async def get_purge(db: AsyncSession, purge_id: int, utilisateur_id: int | None = None) -> schemas.Purge:
+    """
+    Cette fonction permet de suivre une purge : lignes déjà supprimées et, tant qu'elle n'est pas terminée, lignes restantes par table
+    @param db: AsyncSession
+    @param purge_id: int
+    @param utilisateur_id: int | None (si défini, 404 si la purge ne porte pas sur l'arbre de cet utilisateur)
+    @return schemas.Purge
+    """
+    purges = models.Purge.__table__
+    row = (await db.execute(select(purges).where(purges.c.id == purge_id))).first()
+    if row is None or (utilisateur_id is not None and row.utilisateur_id != utilisateur_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Purge not found",
+        )
+    remaining = {}
+    if row.date_fin is None:
+        for table, ids in purge_levels(row.type, row.cible_id):
+            remaining[table.name] = await db.scalar(select(func.count()).select_from(ids.subquery()))
+    statut = "done" if row.date_fin is not None else "running" if row.lignes_supprimees else "pending"
+    return schemas.Purge(**row._asdict(), statut=statut, restantes=remaining)
+
+def accepted_response(purge: schemas.Purge) -> Response:
+    """
+    Cette fonction permet de répondre à une suppression en arrière-plan : 202, l'avancement est suivi sur l'URL de Location.
+    Un utilisateur qui se supprime n'a plus de token valide : sa purge n'a pas d'URL de suivi
+    @param purge: schemas.Purge
+    @return Response
+    """
+    headers = {"Location": f"/purges/{purge.id}"} if purge.type != "utilisateur" else None
+    return service_utils.json_response(purge, schemas.Purge, headers=headers, status_code=status.HTTP_202_ACCEPTED)
+
+# --- Purge par lots en tâche de fond
+class PurgeWorker:
+    """
+    Cette classe permet de supprimer les lignes marquées par lots de batch_size lignes, rate lots par seconde au plus
+    """
+
+    def __init__(self, batch_size: int, rate: float, interval: float):
+        self.batch_size = batch_size
+        self.rate = rate
+        self.interval = interval
+        self.wake: asyncio.Event | None = None
+        self.current: int | None = None
+        self.purges = 0
+        self.batches = 0
+        self.deleted = 0
+        self.failures = 0
+
+    def notify(self):
+        """
+        Cette fonction permet de réveiller la tâche de fond après une demande de purge (sans attendre interval)
+        @return None
+        """
+        if self.wake is not None:
+            self.wake.set()
+
+    async def purge(self, purge_id: int, kind: str, cible_id: int) -> int:
+        """
+        Cette fonction permet de terminer une purge : chaque lot supprime au plus batch_size lignes du niveau le plus bas
+        qui en a encore, dans une transaction qui met aussi à jour l'avancement ; la cible est supprimée en dernier
+        @param purge_id: int
+        @param kind: str (clé de PURGE_TYPES)
+        @param cible_id: int
+        @return int (nombre de lignes supprimées)
+        """
+        purges = models.Purge.__table__
+        levels = purge_levels(kind, cible_id)
+        level, deleted = 0, 0
+        self.current = purge_id
+        try:
+            while True:
+                table, ids = levels[level]
+                last = level == len(levels) - 1
+                async with database.AsyncSessionLocal() as db:
+                    count = (await db.execute(delete(table).where(table.c.id.in_(ids.limit(self.batch_size))))).rowcount
+                    if not count and not last:
+                        # les niveaux inférieurs sont vides : les lignes cachées ne reçoivent plus d'écritures
+                        level += 1
+                        continue
+                    values = {"lignes_supprimees": purges.c.lignes_supprimees + count}
+                    if last:
+                        values["date_fin"] = tasks.get_current_datetime()
+                    await db.execute(update(purges).where(purges.c.id == purge_id).values(**values))
+                    await db.commit()
+                self.batches += 1
+                self.deleted += count
+                deleted += count
+                if last:
+                    self.purges += 1
+                    return deleted
+                if self.rate > 0:
+                    await asyncio.sleep(1 / self.rate)
+        finally:
+            self.current = None
+
+    async def run_pending(self) -> int:
+        """
+        Cette fonction permet de terminer les purges en attente, les plus anciennes d'abord (y compris celles interrompues
+        par un arrêt du serveur)
+        @return int (nombre de purges traitées)
+        """
+        purges = models.Purge.__table__
+        async with database.AsyncSessionLocal() as db:
+            pending = (await db.execute(
+                select(purges.c.id, purges.c.type, purges.c.cible_id).where(purges.c.date_fin.is_(None)).order_by(purges.c.id)
+            )).all()
+        for row in pending:
+            await self.purge(row.id, row.type, row.cible_id)
+        return len(pending)
+
+    async def run(self):
+        """
+        Cette fonction permet de traiter les purges dès qu'elles sont demandées, et toutes les interval secondes pour celles
+        demandées à un autre worker (tâche de fond lancée au démarrage)
+        @return None
+        """
+        # l'évènement est lié à la boucle qui l'attend : il est créé par la tâche de fond
+        self.wake = asyncio.Event()
+        while True:
+            try:
+                while await self.run_pending():
+                    pass
+            except Exception:
+                self.failures += 1
+                logger.exception("Purge failed, retried in %g s", self.interval)
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+
+    def stats(self) -> dict:
+        """
+        Cette fonction permet de récupérer les compteurs de la purge en arrière-plan
+        @return dict
+        """
+        return {
+            "batch_size": self.batch_size,
+            "rate": self.rate,
+            "current": self.current,
+            "purges": self.purges,
+            "batches": self.batches,
+            "deleted": self.deleted,
+            "failures": self.failures,
+        }
+
+purge_worker = PurgeWorker(PURGE_BATCH_SIZE, PURGE_RATE, PURGE_POLL_INTERVAL)
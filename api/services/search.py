@@ -0,0 +1,140 @@
+# --- Importation des modules
+# la recherche par nom s'appuie sur un index trigramme, créé par la migration 0006 :
+# - SQLite : une table FTS5 (tokenizer trigram) à contenu externe par table, tenue à jour par des triggers à chaque écriture
+# - PostgreSQL : extension pg_trgm et index GIN (gin_trgm_ops) sur les colonnes nom
+from sqlalchemy import select, literal, literal_column, null, func, union_all, table, column
+from sqlalchemy.ext.asyncio import AsyncSession
+import models, schemas
+
+# --- Configuration de la recherche
+# type de résultat -> modèle dont la colonne nom est indexée
+SEARCH_TYPES = {
+    "personnage": models.Personnage,
+    "compte": models.Compte,
+    "objet": models.Objet,
+}
+# prefix : le nom commence par q ; contains : le nom contient q ; fuzzy : le nom partage des trigrammes avec q
+SEARCH_MODES = ("prefix", "contains", "fuzzy")
+# un trigramme fait 3 caractères : en dessous, l'index ne peut pas être utilisé
+SEARCH_MIN_LENGTH = 3
+# fuzzy (SQLite) : q est découpé en morceaux d'environ FUZZY_PART_LENGTH caractères, une faute de frappe par morceau au plus
+FUZZY_PART_LENGTH = 4
+
+def escape_like(value: str) -> str:
+    """
+    Cette fonction permet d'échapper les caractères spéciaux d'un motif LIKE (%, _ et le caractère d'échappement \\)
+    @param value: str
+    @return str
+    """
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+def fts_phrase(value: str) -> str:
+    """
+    Cette fonction permet de construire une requête FTS5 qui trouve value n'importe où dans le nom (suite de trigrammes)
+    @param value: str
+    @return str
+    """
+    return '"' + value.replace('"', '""') + '"'
+
+def fts_trigrams(value: str) -> str:
+    """
+    Cette fonction permet de construire une requête FTS5 qui trouve les noms partageant au moins un trigramme avec value,
+    le classement (bm25) place en tête ceux qui en partagent le plus
+    @param value: str
+    @return str
+    """
+    value = value.lower()
+    trigrams = dict.fromkeys(value[index:index + 3] for index in range(len(value) - 2))
+    return " OR ".join(fts_phrase(trigram) for trigram in trigrams)
+
+def fts_fuzzy(value: str) -> str:
+    """
+    Cette fonction permet de construire la requête FTS5 de la recherche fuzzy. value est découpé en morceaux d'au moins
+    3 caractères : avec moins de fautes que de morceaux, l'un d'eux reste intact dans le nom cherché. Seuls les noms qui
+    contiennent un morceau sont retenus (peu nombreux, contrairement à ceux qui partagent un seul trigramme), puis classés
+    par le nombre de trigrammes partagés avec value (bm25). En dessous de 6 caractères, un trigramme commun suffit
+    @param value: str
+    @return str
+    """
+    if len(value) < 2 * SEARCH_MIN_LENGTH:
+        return fts_trigrams(value)
+    parts = max(2, len(value) // FUZZY_PART_LENGTH)
+    bounds = [round(index * len(value) / parts) for index in range(parts + 1)]
+    pieces = " OR ".join(fts_phrase(value[start:end]) for start, end in zip(bounds, bounds[1:]))
+    return f"({pieces}) AND ({fts_trigrams(value)})"
+
+def parent_columns(model) -> tuple:
+    """
+    Cette fonction permet de récupérer les colonnes qui situent un résultat dans l'arbre (compte_id, utilisateur_id)
+    et les jointures nécessaires
+    @param model: models.Personnage, models.Compte ou models.Objet
+    @return tuple (compte_id, utilisateur_id, jointures)
+    """
+    if model is models.Personnage:
+        return models.Personnage.compte_id, models.Compte.utilisateur_id, ((models.Compte, models.Compte.id == models.Personnage.compte_id),)
+    if model is models.Compte:
+        return null(), models.Compte.utilisateur_id, ()
+    return null(), null(), ()
+
+def search_statement(dialect: str, kind: str, q: str, mode: str, window: int):
+    """
+    Cette fonction permet de construire la recherche d'un type de résultat ; score : plus il est petit, meilleur est le résultat
+    @param dialect: str ("sqlite" ou "postgresql")
+    @param kind: str (clé de SEARCH_TYPES)
+    @param q: str
+    @param mode: str (voir SEARCH_MODES)
+    @param window: int (offset + limit : seuls les window meilleurs résultats du type peuvent figurer dans la page)
+    @return Select
+    """
+    model = SEARCH_TYPES[kind]
+    compte_id, utilisateur_id, joins = parent_columns(model)
+    if dialect == "sqlite":
+        fts = table(f"{model.__tablename__}_fts", column("rowid"), column("rank"))
+        match = literal_column(f'"{fts.name}"').op("MATCH")(fts_fuzzy(q) if mode == "fuzzy" else fts_phrase(q))
+        if mode == "fuzzy":
+            # classement bm25 dans la table FTS5 seule : seuls les window meilleurs noms sont joints à leur table
+            ranked = select(fts.c.rowid, fts.c.rank).filter(match).order_by(fts.c.rank).limit(window).subquery()
+            source, rowid, score = ranked, ranked.c.rowid, ranked.c.rank
+        else:
+            # part du nom couverte par q : les noms les plus courts d'abord, comparable d'une table à l'autre
+            source, rowid, score = fts, fts.c.rowid, -literal(len(q)) / func.length(model.nom)
+        statement = select(
+            literal(kind).label("type"), model.id, model.nom, compte_id.label("compte_id"),
+            utilisateur_id.label("utilisateur_id"), score.label("score"),
+        ).select_from(source).join(model, model.id == rowid)
+        if mode != "fuzzy":
+            statement = statement.filter(match)
+    else:
+        if mode == "fuzzy":
+            condition = model.nom.op("%")(q)
+        else:
+            condition = model.nom.ilike(("" if mode == "prefix" else "%") + escape_like(q) + "%", escape="\\")
+        statement = select(
+            literal(kind).label("type"), model.id, model.nom, compte_id.label("compte_id"),
+            utilisateur_id.label("utilisateur_id"), (-func.similarity(model.nom, q)).label("score"),
+        ).filter(condition)
+    if mode == "prefix" and dialect == "sqlite":
+        # la phrase FTS5 trouve q n'importe où dans le nom, le LIKE (sur les seules lignes trouvées) garde les préfixes
+        statement = statement.filter(model.nom.like(escape_like(q) + "%", escape="\\"))
+    for target, onclause in joins:
+        statement = statement.join(target, onclause)
+    return statement
+
+async def search(db: AsyncSession, q: str, types: list[str] | None = None, mode: str = "prefix", limit: int = 20, offset: int = 0) -> list[schemas.SearchResult]:
+    """
+    Cette fonction permet de rechercher des personnages, des comptes et des objets du catalogue par leur nom,
+    les meilleurs résultats d'abord (une seule requête : UNION ALL des recherches de chaque type)
+    @param db: AsyncSession
+    @param q: str (au moins SEARCH_MIN_LENGTH caractères)
+    @param types: list[str] | None (types de résultats, tous par défaut)
+    @param mode: str (voir SEARCH_MODES)
+    @param limit: int
+    @param offset: int
+    @return list[schemas.SearchResult]
+    """
+    dialect = db.bind.dialect.name
+    statements = [search_statement(dialect, kind, q, mode, offset + limit) for kind in (types or SEARCH_TYPES)]
+    results = union_all(*statements).subquery()
+    statement = select(results).order_by(results.c.score, results.c.type, results.c.id).limit(limit).offset(offset)
+    rows = await db.execute(statement)
+    return [schemas.SearchResult.model_validate(row._asdict()) for row in rows]
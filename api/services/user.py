@@ -1,95 +1,391 @@
 # --- Importation des modules
-# sqlalchemy.orm est utilisé pour la session de la base de données, cela permet d'accéder à la base de données, de la lire et de l'écrire, etc.
-from datetime import timedelta
-from services.utils import get_db
-from sqlalchemy.orm import Session
+# sqlalchemy.ext.asyncio est utilisé pour la session asynchrone de la base de données, cela permet d'accéder à la base de données sans bloquer la boucle d'événements
+from datetime import datetime, timedelta
+import asyncio
+import logging
+import os
+from services.utils import get_read_db, loading_plan, load_relationships, dialect_insert, stick_to_primary
+from services.purge import mark_tree_node, get_purge, purge_worker
+from sqlalchemy import select, insert, update, delete, bindparam, case, tuple_, literal, func, DateTime
+from sqlalchemy.ext.asyncio import AsyncSession
 # fastapi.HTTPException est utilisé pour lever des exceptions HTTP
 from fastapi import HTTPException, status, Depends
 # OAuth2PasswordBearer est utilisé pour la gestion de l'authentification
 from fastapi.security import OAuth2PasswordBearer
 # typing.Annotated est utilisé pour les annotations
 from typing import Annotated
-# jose.JWTError est utilisé pour gérer les erreurs liées au JWT, jose.jwt est utilisé pour la gestion des JWT
-from jose import JWTError
-import models, schemas, tasks
+import database, models, schemas, tasks
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
 
 # --- Configuration de l'authentification
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
-async def add_user(db: Session, user: schemas.UtilisateurCreate) -> models.Utilisateur:
+# --- Cache des utilisateurs authentifiés (email -> utilisateur), les tokens vérifiés sont gardés par tasks.verify_access_token
+# chaque worker a son propre cache : la durée de vie borne le délai avant qu'une modification faite par un autre worker soit vue
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", 60))
+principal_cache = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)
+
+def invalidate_principal(*emails: str):
+    """
+    Cette fonction permet de retirer des utilisateurs du cache d'authentification (après une modification ou une suppression)
+    @param emails: str
+    @return None
+    """
+    for email in emails:
+        principal_cache.delete(email)
+
+# --- Dates de dernière connexion
+# la connexion n'écrit pas en base : les dates sont gardées en mémoire et écrites par lots toutes les LAST_LOGIN_FLUSH_INTERVAL
+# secondes (et à l'arrêt du serveur), une seule transaction remplace ainsi un UPDATE par connexion
+LAST_LOGIN_FLUSH_INTERVAL = float(os.getenv("LAST_LOGIN_FLUSH_INTERVAL", 10))
+
+class LastLoginBuffer:
+    """
+    Cette classe permet de regrouper les dates de dernière connexion en attente d'écriture (id utilisateur -> date)
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.pending: dict[int, datetime] = {}
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+
+    def record(self, user_id: int, when: datetime):
+        """
+        Cette fonction permet d'enregistrer une connexion, seule la plus récente par utilisateur est gardée
+        @param user_id: int
+        @param when: datetime
+        @return None
+        """
+        self.pending[user_id] = when
+
+    async def flush(self) -> int:
+        """
+        Cette fonction permet d'écrire les dates en attente en un seul UPDATE groupé, puis de retirer les utilisateurs écrits
+        du cache d'authentification
+        @return int (nombre d'utilisateurs écrits)
+        """
+        if not self.pending:
+            return 0
+        # on détache le lot : les connexions suivantes alimentent un nouveau dictionnaire pendant l'écriture
+        batch, self.pending = self.pending, {}
+        table = models.Utilisateur.__table__
+        # la date fait partie de /user/me/ : la version de l'arbre change avec elle
+        statement = update(table).where(table.c.id == bindparam("user_id")).values(
+            date_derniere_connexion=bindparam("date"), version_arbre=table.c.version_arbre + 1
+        )
+        # et le journal des modifications : INSERT ... SELECT, rien n'est noté pour un utilisateur supprimé entre-temps
+        changes = models.Changement.__table__
+        log = insert(changes).from_select(
+            ["utilisateur_id", "type", "cible_id", "operation", "date"],
+            select(table.c.id, literal("utilisateur"), table.c.id, literal("update"), bindparam("date", type_=DateTime))
+            .where(table.c.id == bindparam("user_id")),
+        )
+        try:
+            async with database.AsyncSessionLocal() as db:
+                rows = [{"user_id": user_id, "date": date} for user_id, date in batch.items()]
+                await db.execute(statement, rows)
+                await db.execute(log, rows)
+                # les utilisateurs en cache (clé : email) gardent sinon l'ancienne date et l'ancienne version jusqu'à expiration
+                emails = (await db.scalars(select(table.c.email).where(table.c.id.in_(batch)))).all()
+                await db.commit()
+        except Exception:
+            # le lot est remis en attente sans écraser une connexion plus récente
+            self.failures += 1
+            self.pending = {**batch, **self.pending}
+            raise
+        invalidate_principal(*emails)
+        self.flushes += 1
+        self.written += len(batch)
+        return len(batch)
+
+    async def run(self):
+        """
+        Cette fonction permet d'écrire périodiquement les dates en attente (tâche de fond lancée au démarrage)
+        @return None
+        """
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Last login flush failed, %d users kept pending", len(self.pending))
+
+    def stats(self) -> dict:
+        """
+        Cette fonction permet de récupérer les compteurs des écritures groupées
+        @return dict
+        """
+        return {
+            "interval": self.interval,
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "written": self.written,
+            "failures": self.failures,
+        }
+
+last_login_buffer = LastLoginBuffer(LAST_LOGIN_FLUSH_INTERVAL)
+
+def hashing_unavailable_exception() -> HTTPException:
+    """
+    Cette fonction permet de construire l'erreur renvoyée lorsque le pool de hashage est saturé
+    @return HTTPException
+    """
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Too many password operations in progress, retry later",
+        headers={"Retry-After": "1"},
+    )
+
+def version_conflict_exception(name: str) -> HTTPException:
+    """
+    Cette fonction permet de construire l'erreur renvoyée lorsqu'une ligne a été modifiée depuis sa lecture par le client
+    @param name: str (nom du modèle)
+    @return HTTPException
+    """
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail=f"{name} was modified by another request, reload it and retry",
+    )
+
+# --- Plans de chargement des relations, un par schéma de réponse
+# les relations des modèles ne se chargent jamais à la volée (lazy="raise_on_sql") : chaque route charge l'arbre renvoyé par son
+# schéma en une requête par niveau (Utilisateur : 4 requêtes, Compte : 3, Personnage : 2) quel que soit le nombre de lignes
+utilisateur_options = loading_plan(schemas.Utilisateur)
+compte_options = loading_plan(schemas.Compte)
+personnage_options = loading_plan(schemas.Personnage)
+
+# --- Versions des arbres (ETag des routes de lecture)
+async def touch_tree(db: AsyncSession, utilisateur_id: int | None = None, compte_id: int | None = None, personnage_id: int | None = None):
+    """
+    Cette fonction permet d'incrémenter version_arbre d'une ligne et de tous ses ancêtres (une requête UPDATE par niveau),
+    dans la transaction de la modification : un seul des identifiants est à donner, celui du nœud modifié
+    @param db: AsyncSession
+    @param utilisateur_id: int | None
+    @param compte_id: int | None
+    @param personnage_id: int | None
+    @return int | None (l'utilisateur propriétaire du nœud, None s'il n'existe pas)
+    """
+    # chaque niveau renvoie l'id de son parent (RETURNING), l'utilisateur le sien ; les lignes déjà chargées dans la session
+    # ne sont pas synchronisées
+    levels = (
+        (models.Personnage, models.Personnage.compte_id),
+        (models.Compte, models.Compte.utilisateur_id),
+        (models.Utilisateur, None),
+    )
+    node_id, start = next(
+        ((node_id, level) for level, node_id in enumerate((personnage_id, compte_id, utilisateur_id)) if node_id is not None),
+        (None, len(levels)),
+    )
+    for model, parent in levels[start:]:
+        if node_id is None:
+            return None
+        statement = update(model).filter(model.id == node_id).values(version_arbre=model.version_arbre + 1)
+        statement = statement.execution_options(synchronize_session=False)
+        node_id = await db.scalar(statement.returning(parent if parent is not None else model.id))
+    return node_id
+
+# --- Journal des modifications (GET /changes/)
+async def record_changes(db: AsyncSession, utilisateur_id: int | None, kind: str, operation: str, *ids: int):
+    """
+    Cette fonction permet d'ajouter au journal une ligne par ligne créée, modifiée ou supprimée, dans la transaction de la
+    modification. Elle est appelée après touch_tree : la ligne de l'utilisateur est alors verrouillée jusqu'au commit, les
+    changements d'un même utilisateur prennent donc leurs ids (curseurs) dans l'ordre des commits
+    @param db: AsyncSession
+    @param utilisateur_id: int | None (propriétaire de l'arbre, rien n'est écrit sans lui)
+    @param kind: str ("utilisateur", "compte", "personnage" ou "inventaire")
+    @param operation: str ("create", "update" ou "delete")
+    @param ids: int (lignes concernées)
+    @return None
+    """
+    if utilisateur_id is None or not ids:
+        return
+    await db.execute(insert(models.Changement), [
+        {"utilisateur_id": utilisateur_id, "type": kind, "cible_id": node_id, "operation": operation} for node_id in ids
+    ])
+
+async def get_tree_node(db: AsyncSession, model, node_id: int):
+    """
+    Cette fonction permet de récupérer un utilisateur, un compte ou un personnage pour lire sa version de l'arbre (404 s'il n'existe pas)
+    Tant que la ligne renvoyée est gardée, elle reste dans la session : le service de lecture appelé ensuite ne la recharge pas
+    @param db: AsyncSession
+    @param model: models.Utilisateur, models.Compte ou models.Personnage
+    @param node_id: int
+    @return models.Utilisateur | models.Compte | models.Personnage
+    """
+    node = await db.get(model, node_id)
+    if node is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{model.__name__} not found",
+        )
+    return node
+
+async def delete_tree_node(db: AsyncSession, model, node_id: int):
+    """
+    Cette fonction permet de supprimer un utilisateur, un compte ou un personnage en une seule requête DELETE : la base supprime
+    ses descendants (ON DELETE CASCADE), aucun n'est chargé. 404 si la ligne n'existe pas
+    @param db: AsyncSession
+    @param model: models.Utilisateur, models.Compte ou models.Personnage
+    @param node_id: int
+    @return Row (colonnes de la ligne supprimée)
+    """
+    statement = delete(model).filter(model.id == node_id).returning(*model.__table__.columns)
+    row = (await db.execute(statement.execution_options(synchronize_session=False))).first()
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"{model.__name__} not found",
+        )
+    return row
+
+async def compare_and_swap(db: AsyncSession, model, node_id: int, version: int | None, **values) -> int:
+    """
+    Cette fonction permet de modifier une ligne versionnée (Compte, Personnage) en une seule requête sans verrou :
+    UPDATE ... SET version = version + 1 WHERE id = ? AND version = ? ; sans version attendue la modification reste atomique
+    mais la dernière écriture l'emporte. 404 si la ligne n'existe pas, 409 si elle a été modifiée depuis la version attendue
+    @param db: AsyncSession
+    @param model: models.Compte ou models.Personnage
+    @param node_id: int
+    @param version: int | None (version lue par le client)
+    @param values: colonnes modifiées
+    @return int (la nouvelle version)
+    """
+    statement = update(model).filter(model.id == node_id).values(**values, version=model.version + 1)
+    if version is not None:
+        statement = statement.filter(model.version == version)
+    new_version = await db.scalar(statement.returning(model.version).execution_options(synchronize_session=False))
+    if new_version is None:
+        await get_tree_node(db, model, node_id)
+        raise version_conflict_exception(model.__name__)
+    return new_version
+
+async def add_user(db: AsyncSession, user: schemas.UtilisateurCreate) -> models.Utilisateur:
     """
     Cette fonction permet d'ajouter un utilisateur
-    @param db: Session
+    @param db: AsyncSession
     @param user: schemas.UtilisateurCreate
     @return models.Utilisateur
     """
-    existing_user = db.query(models.Utilisateur).filter(
+    # un utilisateur en cours de purge garde son login et son email jusqu'à sa suppression
+    existing_user = await db.scalar(select(models.Utilisateur).filter(
         (models.Utilisateur.login == user.login) | (models.Utilisateur.email == user.email)
-    ).first()
+    ).execution_options(include_deleted=True))
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Utilisateur already registered",
         )
+    # la connexion est rendue au pool pendant le hachage (avec le profil SQLite "production", c'est l'unique connexion d'écriture)
+    await db.rollback()
 
-    hashed_password = tasks.get_password_hash(user.password)
+    try:
+        hashed_password = await tasks.get_password_hash_async(user.password)
+    except tasks.HashingPoolFull:
+        raise hashing_unavailable_exception()
     db_user = models.Utilisateur(
         login=user.login,
         email=user.email,
         password=hashed_password,
         date_creation=user.date_creation,
         date_derniere_connexion=user.date_derniere_connexion,
+        comptes=[],
     )
     db.add(db_user)
-    db.commit()
-    db.refresh(db_user)
+    await db.flush()
+    await record_changes(db, db_user.id, "utilisateur", "create", db_user.id)
+    await db.commit()
     return db_user
 
 
-async def get_all_users(db: Session) -> list:
+async def get_user(db: AsyncSession, user_id: int, fields: frozenset[str] | None = None, user: models.Utilisateur | None = None) -> schemas.Utilisateur:
     """
-    Cette fonction permet de récupérer tous les utilisateurs
-    @param db: Session
-    @return list
-    """
-    return db.query(models.Utilisateur).all()
+    Cette fonction permet de récupérer un utilisateur avec ses comptes, personnages et inventaires
+    @param db: AsyncSession
+    @param user_id: int
+    @param fields: frozenset[str] | None (champs demandés, les relations absentes ne sont pas chargées)
+    @param user: models.Utilisateur | None (ligne déjà lue par get_tree_node : seules ses relations sont chargées)
+    @return schemas.Utilisateur
+    """
+    if user is not None:
+        await load_relationships(db, user, schemas.Utilisateur, fields)
+    else:
+        user = await db.scalar(
+            select(models.Utilisateur).filter(models.Utilisateur.id == user_id).options(*loading_plan(schemas.Utilisateur, fields=fields))
+        )
+    if user:
+        return schemas.Utilisateur.model_validate(user)
+    raise HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail="Utilisateur not found",
+    )
+
+async def get_all_users(db: AsyncSession, after: int | None = None, limit: int = 100, flat: bool = False, fields: frozenset[str] | None = None) -> list:
+    """
+    Cette fonction permet de récupérer les utilisateurs page par page (pagination par curseur sur l'id)
+    @param db: AsyncSession
+    @param after: int | None (id du dernier utilisateur de la page précédente)
+    @param limit: int (taille de la page)
+    @param flat: bool (si vrai, les comptes ne sont pas chargés)
+    @param fields: frozenset[str] | None (champs demandés, les relations absentes ne sont pas chargées)
+    @return list[schemas.Utilisateur] ou list[schemas.UtilisateurSimple] si flat
+    """
+    schema = schemas.UtilisateurSimple if flat else schemas.Utilisateur
+    query = select(models.Utilisateur).order_by(models.Utilisateur.id).limit(limit)
+    if after is not None:
+        query = query.filter(models.Utilisateur.id > after)
+    if not flat:
+        query = query.options(*loading_plan(schemas.Utilisateur, fields=fields))
+    result = await db.scalars(query)
+    return [schema.model_validate(user) for user in result]
 
-async def authenticate_user(db: Session, username: str, password: str):
+async def authenticate_user(db: AsyncSession, username: str, password: str):
     """
     Cette fonction permet d'authentifier un utilisateur par son email ou son login.
-    @param db: Session
+    @param db: AsyncSession
     @param login: str (peut être un email ou un nom d'utilisateur)
     @param password: str
     @return dict
     """
     # Rechercher l'utilisateur par email ou nom d'utilisateur
-    user = db.query(models.Utilisateur).filter(
+    user = await db.scalar(select(models.Utilisateur).filter(
         (models.Utilisateur.login == username) | (models.Utilisateur.email == username)
-    ).first()
+    ))
+    # la connexion est rendue au pool pendant la vérification du mot de passe (le rollback expire user : ses valeurs sont lues avant)
+    user_id, email, hashed_password = (user.id, user.email, user.password) if user is not None else (None, None, None)
+    await db.rollback()
     
-    if not user or not tasks.verify_password(password, user.password):
+    try:
+        password_ok = user_id is not None and await tasks.verify_password_async(password, hashed_password)
+    except tasks.HashingPoolFull:
+        raise hashing_unavailable_exception()
+    if not password_ok:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect login or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # modifie date_derniere_connexion
-    user.date_derniere_connexion = tasks.get_current_datetime()
-    db.commit()
+    # date_derniere_connexion est écrite plus tard, par lot
+    last_login_buffer.record(user_id, tasks.get_current_datetime())
 
-    
-    access_token = tasks.create_access_token(data={"sub": user.email},expires_delta=timedelta(minutes=300))
+    access_token = tasks.create_access_token(data={"sub": email},expires_delta=timedelta(minutes=300))
+    # le nouvel utilisateur peut ne pas encore être sur la réplique : ses premières lectures se font sur la base principale
+    stick_to_primary(f"token:{access_token}")
     return {"access_token": access_token, "token_type": "bearer"}
 
 async def get_current_user(
-    db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)
-) -> models.Utilisateur:
+    db: AsyncSession = Depends(get_read_db), token: str = Depends(oauth2_scheme)
+) -> schemas.UtilisateurSimple:
     """
-    Cette fonction permet de récupérer l'utilisateur actuel
-    @param db: Session
+    Cette fonction permet de récupérer l'utilisateur actuel, sans requête SQL si le token et l'utilisateur sont en cache
+    @param db: AsyncSession
     @param token: str
-    @return models.Utilisateur
+    @return schemas.UtilisateurSimple
     """
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -97,296 +393,559 @@ async def get_current_user(
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = tasks.jwt.decode(token, tasks.SECRET_KEY, algorithms=[tasks.ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-        token_data = schemas.TokenData(email=email)
-    except JWTError:
+        payload = tasks.verify_access_token(token)
+    except tasks.TokenError:
         raise credentials_exception
-    user = db.query(models.Utilisateur).filter(models.Utilisateur.email == token_data.email).first()
-    if user is None:
+    email = payload.get("sub")
+    if not isinstance(email, str):
         raise credentials_exception
+    token_data = schemas.TokenData(email=email)
+    user = principal_cache.get(token_data.email)
+    if user is None:
+        # seul l'utilisateur est chargé : les routes qui renvoient ses comptes les chargent avec get_user
+        db_user = await db.scalar(select(models.Utilisateur).filter(models.Utilisateur.email == token_data.email))
+        if db_user is None:
+            raise credentials_exception
+        user = schemas.UtilisateurSimple.model_validate(db_user)
+        principal_cache.set(token_data.email, user)
     return user
 
-async def update_user(db: Session, user_id: int, user: schemas.UtilisateurCreate, current_user: models.Utilisateur) -> models.Utilisateur:
+async def update_user(db: AsyncSession, user_id: int, user: schemas.UtilisateurCreate, current_user: schemas.UtilisateurSimple) -> models.Utilisateur:
     """
     Cette fonction permet de modifier les informations d'un utilisateur
-    @param db: Session
+    @param db: AsyncSession
     @param user_id: int
     @param user: schemas.UtilisateurCreate
-    @param current_user: models.Utilisateur
+    @param current_user: schemas.UtilisateurSimple
     @return models.Utilisateur
     """
-    db_user = db.query(models.Utilisateur).filter(models.Utilisateur.id == user_id).first()
+    db_user = await db.scalar(
+        select(models.Utilisateur).filter(models.Utilisateur.id == user_id).options(*utilisateur_options)
+    )
     if db_user:
         if db_user.id != current_user.id:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="You don't have enough permissions",
             )
+        old_email = db_user.email
         db_user.login = user.login
         db_user.email = user.email
         db_user.date_creation = user.date_creation
         db_user.date_derniere_connexion = user.date_derniere_connexion
-        db.commit()
-        db.refresh(db_user)
+        await touch_tree(db, utilisateur_id=db_user.id)
+        await record_changes(db, db_user.id, "utilisateur", "update", db_user.id)
+        await db.commit()
+        invalidate_principal(old_email, user.email)
         return db_user
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Utilisateur not found",
     )
 
-async def delete_user(db: Session, user_id: int, current_user: models.Utilisateur) -> models.Utilisateur:
+async def purge_tree_node(db: AsyncSession, model, node_id: int) -> tuple:
+    """
+    Cette fonction permet de marquer un utilisateur, un compte ou un personnage comme supprimé : il disparaît aussitôt de
+    toutes les lectures avec ses descendants, que services.purge supprime ensuite par lots en tâche de fond
+    @param db: AsyncSession
+    @param model: models.Utilisateur, models.Compte ou models.Personnage
+    @param node_id: int
+    @return tuple (Row : colonnes de la ligne marquée, schemas.Purge)
+    """
+    row, purge = await mark_tree_node(db, model, node_id)
+    # le journal d'un utilisateur est supprimé avec lui : seuls les comptes et personnages y notent leur suppression
+    if model is models.Compte:
+        purge.utilisateur_id = await touch_tree(db, utilisateur_id=row.utilisateur_id)
+        await record_changes(db, purge.utilisateur_id, "compte", "delete", node_id)
+    elif model is models.Personnage:
+        purge.utilisateur_id = await touch_tree(db, compte_id=row.compte_id)
+        await record_changes(db, purge.utilisateur_id, "personnage", "delete", node_id)
+    else:
+        purge.utilisateur_id = node_id
+    await db.commit()
+    purge_worker.notify()
+    return row, await get_purge(db, purge.id)
+
+async def delete_user(db: AsyncSession, user_id: int, current_user: schemas.UtilisateurSimple, background: bool = False) -> schemas.Utilisateur | schemas.Purge:
     """
-    Cette fonction permet de supprimer un utilisateur
-    @param db: Session
+    Cette fonction permet de supprimer un utilisateur avec ses comptes, ses personnages et leurs inventaires (en cascade),
+    ou en arrière-plan pour un très grand arbre (background)
+    @param db: AsyncSession
     @param user_id: int
-    @param current_user: models.Utilisateur
-    @return models.Utilisateur
+    @param current_user: schemas.UtilisateurSimple
+    @param background: bool
+    @return schemas.Utilisateur (l'utilisateur supprimé, sans ses comptes) | schemas.Purge (en arrière-plan)
     """
-    db_user = db.query(models.Utilisateur).filter(models.Utilisateur.id == user_id).first()
-    if db_user:
-        if db_user.id != current_user.id:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="You don't have enough permissions",
-            )
-        db.delete(db_user)
-        db.commit()
-        return db_user
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="Utilisateur not found",
-    )
+    if user_id != current_user.id:
+        await get_tree_node(db, models.Utilisateur, user_id)
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="You don't have enough permissions",
+        )
+    if background:
+        row, purge = await purge_tree_node(db, models.Utilisateur, user_id)
+        invalidate_principal(row.email)
+        return purge
+    row = await delete_tree_node(db, models.Utilisateur, user_id)
+    await db.commit()
+    invalidate_principal(row.email)
+    return schemas.Utilisateur.model_validate(row._asdict())
 
 
-async def get_user_comptes(db: Session, user_id: int) -> list:
+async def get_user_comptes(db: AsyncSession, user_id: int, fields: frozenset[str] | None = None) -> list:
     """
     Cette fonction permet de récupérer les comptes d'un utilisateur
-    @param db: Session
+    @param db: AsyncSession
     @param user_id: int 
-    @return list
+    @param fields: frozenset[str] | None (champs demandés, les relations absentes ne sont pas chargées)
+    @return list[schemas.Compte]
     """
-    user = db.query(models.Utilisateur).filter(models.Utilisateur.id == user_id).first()
+    user = await db.get(models.Utilisateur, user_id)
     if user:
-        return user.comptes
+        result = await db.scalars(
+            select(models.Compte).filter(models.Compte.utilisateur_id == user_id).options(*loading_plan(schemas.Compte, fields=fields))
+        )
+        return [schemas.Compte.model_validate(compte) for compte in result]
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Utilisateur not found",
     )
 
-async def add_user_compte(db: Session, user_id: int, compte: schemas.CompteCreate) -> models.Compte:
+async def add_user_compte(db: AsyncSession, user_id: int, compte: schemas.CompteCreate) -> models.Compte:
     """
     Cette fonction permet de créer un compte pour un utilisateur
-    @param db: Session
+    @param db: AsyncSession
     @param user_id: int
     @param compte: schemas.CompteCreate
     @return models.Compte
     """
-    user = db.query(models.Utilisateur).filter(models.Utilisateur.id == user_id).first()
+    user = await db.get(models.Utilisateur, user_id)
     if user:
-        db_compte = models.Compte(**compte.dict(), utilisateur_id=user_id)
+        db_compte = models.Compte(**compte.dict(), utilisateur_id=user_id, personnages=[])
         db.add(db_compte)
-        db.commit()
-        db.refresh(db_compte)
+        await db.flush()
+        await touch_tree(db, utilisateur_id=user_id)
+        await record_changes(db, user_id, "compte", "create", db_compte.id)
+        await db.commit()
         return db_compte
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Utilisateur not found",
     )
 
-async def delete_user_compte(db: Session, user_id: int, compte_id: int) -> models.Compte:
+async def delete_user_compte(db: AsyncSession, user_id: int, compte_id: int, background: bool = False) -> schemas.Compte | schemas.Purge:
     """
-    Cette fonction permet de supprimer un compte pour un utilisateur
-    @param db: Session
+    Cette fonction permet de supprimer un compte pour un utilisateur, avec ses personnages et leurs inventaires (en cascade),
+    ou en arrière-plan pour un très grand arbre (background)
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
-    @return models.Compte
-    """
-    db_compte = db.query(models.Compte).filter(models.Compte.id == compte_id).first()
-    if db_compte:
-        db.delete(db_compte)
-        db.commit()
-        return db_compte
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="Compte not found",
-    )
+    @param background: bool
+    @return schemas.Compte (le compte supprimé, sans ses personnages) | schemas.Purge (en arrière-plan)
+    """
+    if background:
+        return (await purge_tree_node(db, models.Compte, compte_id))[1]
+    row = await delete_tree_node(db, models.Compte, compte_id)
+    await record_changes(db, await touch_tree(db, utilisateur_id=row.utilisateur_id), "compte", "delete", compte_id)
+    await db.commit()
+    return schemas.Compte.model_validate(row._asdict())
 
-async def update_user_compte(db: Session, user_id: int, compte_id: int, compte: schemas.CompteCreate) -> models.Compte:
+async def update_user_compte(db: AsyncSession, user_id: int, compte_id: int, compte: schemas.CompteUpdate) -> models.Compte:
     """
-    Cette fonction permet de modifier un compte pour un utilisateur
-    @param db: Session
+    Cette fonction permet de modifier un compte pour un utilisateur (refusé avec une erreur 409 si compte.version n'est plus à jour)
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
-    @param compte: schemas.CompteCreate
+    @param compte: schemas.CompteUpdate
     @return models.Compte
     """
-    db_compte = db.query(models.Compte).filter(models.Compte.id == compte_id).first()
-    if db_compte:
-        db_compte.nom = compte.nom
-        db.commit()
-        db.refresh(db_compte)
-        return db_compte
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="Compte not found",
+    await compare_and_swap(db, models.Compte, compte_id, compte.version, nom=compte.nom)
+    await record_changes(db, await touch_tree(db, compte_id=compte_id), "compte", "update", compte_id)
+    await db.commit()
+    return await db.scalar(
+        select(models.Compte).filter(models.Compte.id == compte_id).options(*compte_options)
     )
 
-async def add_user_personnage(db: Session, user_id: int, compte_id: int, personnage: schemas.PersonnageCreate) -> models.Personnage:
+async def add_user_personnage(db: AsyncSession, user_id: int, compte_id: int, personnage: schemas.PersonnageCreate) -> models.Personnage:
     """
     Cette fonction permet d'ajouter un personnage pour un compte
-    @param db: Session
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
     @param personnage: schemas.PersonnageCreate
     @return models.Personnage
     """
-    compte = db.query(models.Compte).filter(models.Compte.id == compte_id).first()
+    compte = await db.get(models.Compte, compte_id)
     if compte:
-        db_personnage = models.Personnage(**personnage.dict(), compte_id=compte_id)
+        db_personnage = models.Personnage(**personnage.dict(), compte_id=compte_id, inventaire=[])
         db.add(db_personnage)
-        db.commit()
-        db.refresh(db_personnage)
+        await db.flush()
+        await record_changes(db, await touch_tree(db, compte_id=compte_id), "personnage", "create", db_personnage.id)
+        await db.commit()
         return db_personnage
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Compte not found",
     )
 
-async def get_user_personnages(db: Session, user_id: int, compte_id: int) -> list:
+async def get_user_personnages(db: AsyncSession, user_id: int, compte_id: int, fields: frozenset[str] | None = None) -> list:
     """
     Cette fonction permet de récupérer les personnages d'un compte
-    @param db: Session
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
-    @return list
+    @param fields: frozenset[str] | None (champs demandés, les relations absentes ne sont pas chargées)
+    @return list[schemas.Personnage]
     """
-    compte = db.query(models.Compte).filter(models.Compte.id == compte_id).first()
+    compte = await db.get(models.Compte, compte_id)
     if compte:
-        return compte.personnages
+        result = await db.scalars(
+            select(models.Personnage).filter(models.Personnage.compte_id == compte_id).options(*loading_plan(schemas.Personnage, fields=fields))
+        )
+        return [schemas.Personnage.model_validate(personnage) for personnage in result]
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Compte not found",
     )
 
-async def delete_user_personnage(db: Session, user_id: int, compte_id: int, personnage_id: int) -> models.Personnage:
+async def delete_user_personnage(db: AsyncSession, user_id: int, compte_id: int, personnage_id: int, background: bool = False) -> schemas.Personnage | schemas.Purge:
     """
-    Cette fonction permet de supprimer un personnage pour un compte
-    @param db: Session
+    Cette fonction permet de supprimer un personnage pour un compte, avec son inventaire (en cascade),
+    ou en arrière-plan pour un très grand inventaire (background)
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
+    @param background: bool
+    @return schemas.Personnage (le personnage supprimé, sans son inventaire) | schemas.Purge (en arrière-plan)
+    """
+    if background:
+        return (await purge_tree_node(db, models.Personnage, personnage_id))[1]
+    row = await delete_tree_node(db, models.Personnage, personnage_id)
+    await record_changes(db, await touch_tree(db, compte_id=row.compte_id), "personnage", "delete", personnage_id)
+    await db.commit()
+    return schemas.Personnage.model_validate(row._asdict())
+
+async def update_user_personnage(db: AsyncSession, user_id: int, compte_id: int, personnage_id: int, personnage: schemas.PersonnageUpdate) -> models.Personnage:
+    """
+    Cette fonction permet de modifier un personnage pour un compte (refusé avec une erreur 409 si personnage.version n'est plus à jour)
+    @param db: AsyncSession
+    @param user_id: int
+    @param compte_id: int
+    @param personnage_id: int
+    @param personnage: schemas.PersonnageUpdate
     @return models.Personnage
     """
-    db_personnage = db.query(models.Personnage).filter(models.Personnage.id == personnage_id).first()
-    if db_personnage:
-        db.delete(db_personnage)
-        db.commit()
-        return db_personnage
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="Personnage not found",
+    await compare_and_swap(db, models.Personnage, personnage_id, personnage.version, nom=personnage.nom)
+    await record_changes(db, await touch_tree(db, personnage_id=personnage_id), "personnage", "update", personnage_id)
+    await db.commit()
+    return await db.scalar(
+        select(models.Personnage).filter(models.Personnage.id == personnage_id).options(*personnage_options)
     )
 
-async def update_user_personnage(db: Session, user_id: int, compte_id: int, personnage_id: int, personnage: schemas.PersonnageCreate) -> models.Personnage:
+async def get_personnage_or_404(db: AsyncSession, personnage_id: int) -> models.Personnage:
     """
-    Cette fonction permet de modifier un personnage pour un compte
-    @param db: Session
-    @param user_id: int
-    @param compte_id: int
+    Cette fonction permet de récupérer un personnage ou de lever une erreur 404
+    @param db: AsyncSession
     @param personnage_id: int
-    @param personnage: schemas.PersonnageCreate
     @return models.Personnage
     """
-    db_personnage = db.query(models.Personnage).filter(models.Personnage.id == personnage_id).first()
-    if db_personnage:
-        db_personnage.nom = personnage.nom
-        db.commit()
-        db.refresh(db_personnage)
-        return db_personnage
+    personnage = await db.get(models.Personnage, personnage_id)
+    if personnage:
+        return personnage
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Personnage not found",
     )
 
-async def get_user_inventaire(db: Session, user_id: int, compte_id: int, personnage_id: int) -> models.Inventaire:
+async def get_objet_ids(db: AsyncSession, noms: set[str]) -> dict[str, int]:
+    """
+    Cette fonction permet de récupérer les ids des objets du catalogue à partir de leur nom, les objets absents sont ajoutés au catalogue
+    @param db: AsyncSession
+    @param noms: set[str]
+    @return dict[str, int] (nom -> id)
+    """
+    insert_ = dialect_insert(db)
+    await db.execute(insert_(models.Objet).values([{"nom": nom} for nom in noms]).on_conflict_do_nothing(index_elements=["nom"]))
+    result = await db.execute(select(models.Objet.nom, models.Objet.id).filter(models.Objet.nom.in_(noms)))
+    return dict(result.all())
+
+async def stack_inventaire(db: AsyncSession, personnage_id: int, quantites: dict[int, int]) -> dict[int, dict]:
+    """
+    Cette fonction permet d'ajouter des objets à l'inventaire d'un personnage en une seule requête :
+    la quantité est ajoutée à l'emplacement existant (INSERT ... ON CONFLICT DO UPDATE, sa version est incrémentée), ou un emplacement est créé
+    @param db: AsyncSession
+    @param personnage_id: int
+    @param quantites: dict[int, int] (id de l'objet -> quantité ajoutée)
+    @return dict[int, dict] (id de l'objet -> emplacement {id, objet_id, quantite, version})
+    """
+    insert_ = dialect_insert(db)
+    statement = insert_(models.Inventaire).values([
+        {"personnage_id": personnage_id, "objet_id": objet_id, "quantite": quantite}
+        for objet_id, quantite in quantites.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=["personnage_id", "objet_id"],
+        set_={"quantite": models.Inventaire.quantite + statement.excluded.quantite, "version": models.Inventaire.version + 1},
+    ).returning(models.Inventaire.id, models.Inventaire.objet_id, models.Inventaire.quantite, models.Inventaire.version)
+    result = await db.execute(statement)
+    return {row.objet_id: row._asdict() for row in result}
+
+async def get_user_inventaire(db: AsyncSession, user_id: int, compte_id: int, personnage_id: int) -> list:
     """
     Cette fonction permet de récupérer l'inventaire d'un personnage
-    @param db: Session
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
-    @return models.Inventaire
+    @return list[schemas.Inventaire]
     """
-    personnage = db.query(models.Personnage).filter(models.Personnage.id == personnage_id).first()
-    if personnage:
-        return personnage.inventaire
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="Personnage not found",
+    await get_personnage_or_404(db, personnage_id)
+    result = await db.scalars(
+        select(models.Inventaire).filter(models.Inventaire.personnage_id == personnage_id).order_by(models.Inventaire.id)
     )
+    return [schemas.Inventaire.model_validate(slot) for slot in result]
 
-async def update_user_inventaire(db: Session, user_id: int, compte_id: int, personnage_id: int, inventaire: schemas.InventaireCreate) -> models.Inventaire:
+async def update_user_inventaire(db: AsyncSession, user_id: int, compte_id: int, personnage_id: int, inventaire: schemas.InventaireUpdate) -> dict:
     """
-    Cette fonction permet de modifier l'inventaire d'un personnage
-    @param db: Session
+    Cette fonction permet de modifier la quantité d'un objet de l'inventaire d'un personnage (0 retire l'objet) ;
+    refusé avec une erreur 409 si inventaire.version n'est plus à jour
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
-    @param inventaire: schemas.InventaireCreate
-    @return models.Inventaire
-    """
-    db_inventaire = db.query(models.Inventaire).filter(models.Inventaire.personnage_id == personnage_id).first()
-    if db_inventaire:
-        db_inventaire = models.Inventaire(**inventaire.dict(), personnage_id=personnage_id)
-        db.commit()
-        db.refresh(db_inventaire)
-        return db_inventaire
+    @param inventaire: schemas.InventaireUpdate
+    @return dict
+    """
+    await get_personnage_or_404(db, personnage_id)
+    condition = (models.Inventaire.personnage_id == personnage_id) & (
+        models.Inventaire.objet_id == select(models.Objet.id).filter(models.Objet.nom == inventaire.objet).scalar_subquery()
+    )
+    if inventaire.quantite == 0:
+        statement = delete(models.Inventaire).filter(condition)
+    else:
+        statement = update(models.Inventaire).filter(condition).values(
+            quantite=inventaire.quantite, version=models.Inventaire.version + 1
+        )
+    if inventaire.version is not None:
+        statement = statement.filter(models.Inventaire.version == inventaire.version)
+    result = await db.execute(statement.returning(models.Inventaire.id, models.Inventaire.objet_id, models.Inventaire.version))
+    row = result.first()
+    if row:
+        operation = "delete" if inventaire.quantite == 0 else "update"
+        await record_changes(db, await touch_tree(db, personnage_id=personnage_id), "inventaire", operation, row.id)
+        await db.commit()
+        return {**row._asdict(), "personnage_id": personnage_id, "objet": inventaire.objet, "quantite": inventaire.quantite}
+    if inventaire.version is not None and await db.scalar(select(models.Inventaire.id).filter(condition)) is not None:
+        raise version_conflict_exception("Inventaire")
     raise HTTPException(
         status_code=status.HTTP_404_NOT_FOUND,
         detail="Inventaire not found",
     )
 
-async def delete_user_inventaire(db: Session, user_id: int, compte_id: int, personnage_id: int) -> models.Inventaire:
+async def delete_user_inventaire(db: AsyncSession, user_id: int, compte_id: int, personnage_id: int) -> list:
     """
-    Cette fonction permet de supprimer l'inventaire d'un personnage
-    @param db: Session
+    Cette fonction permet de vider l'inventaire d'un personnage
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
-    @return models.Inventaire
-    """
-    db_inventaire = db.query(models.Inventaire).filter(models.Inventaire.personnage_id == personnage_id).first()
-    if db_inventaire:
-        db.delete(db_inventaire)
-        db.commit()
-        return db_inventaire
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="Inventaire not found",
-    )
+    @return list (les emplacements supprimés)
+    """
+    inventaire = await get_user_inventaire(db, user_id, compte_id, personnage_id)
+    await db.execute(delete(models.Inventaire).filter(models.Inventaire.personnage_id == personnage_id))
+    owner = await touch_tree(db, personnage_id=personnage_id)
+    await record_changes(db, owner, "inventaire", "delete", *(slot.id for slot in inventaire))
+    await db.commit()
+    return inventaire
 
 
-async def add_user_inventaire(db: Session, user_id: int, compte_id: int, personnage_id: int, inventaire: schemas.InventaireCreate) -> models.Inventaire:
+async def add_user_inventaire(db: AsyncSession, user_id: int, compte_id: int, personnage_id: int, inventaire: schemas.InventaireCreate) -> dict:
     """
-    Cette fonction permet d'ajouter un inventaire pour un personnage
-    @param db: Session
+    Cette fonction permet d'ajouter un objet à l'inventaire d'un personnage : la quantité s'ajoute à celle déjà possédée
+    @param db: AsyncSession
     @param user_id: int
     @param compte_id: int
     @param personnage_id: int
     @param inventaire: schemas.InventaireCreate
-    @return models.Inventaire
+    @return dict
     """
-    personnage = db.query(models.Personnage).filter(models.Personnage.id == personnage_id).first()
-    if personnage:
-        db_inventaire = models.Inventaire(**inventaire.dict(), personnage_id=personnage_id)
-        db.add(db_inventaire)
-        db.commit()
-        db.refresh(db_inventaire)
-        return db_inventaire
-    raise HTTPException(
-        status_code=status.HTTP_404_NOT_FOUND,
-        detail="Personnage not found",
-    )
\ No newline at end of file
+    await get_personnage_or_404(db, personnage_id)
+    objet_ids = await get_objet_ids(db, {inventaire.objet})
+    slots = await stack_inventaire(db, personnage_id, {objet_ids[inventaire.objet]: inventaire.quantite})
+    slot = slots[objet_ids[inventaire.objet]]
+    # un emplacement créé par l'INSERT ... ON CONFLICT est à sa première version, un emplacement empilé a été modifié
+    operation = "create" if slot["version"] == 1 else "update"
+    await record_changes(db, await touch_tree(db, personnage_id=personnage_id), "inventaire", operation, slot["id"])
+    await db.commit()
+    return {**slots[objet_ids[inventaire.objet]], "personnage_id": personnage_id, "objet": inventaire.objet}
+
+async def batch_user_inventaire(db: AsyncSession, user_id: int, compte_id: int, personnage_id: int, batch: schemas.InventaireBatch) -> list[dict]:
+    """
+    Cette fonction permet d'appliquer un lot d'ajouts / modifications / suppressions à l'inventaire d'un personnage
+    dans une seule transaction : un UPDATE groupé, un DELETE groupé puis un INSERT ... ON CONFLICT groupé pour les ajouts
+    (appliqués après les modifications et suppressions, les quantités d'un même objet s'empilent).
+    L'UPDATE et le DELETE ne touchent que les emplacements encore à la version lue : un emplacement modifié entre-temps, ou dont
+    la version ne correspond pas à celle donnée par l'opération, est signalé "conflict".
+    Les opérations invalides ou visant un emplacement inexistant sont signalées sans empêcher les autres. Quand plusieurs
+    opérations visent le même emplacement, seule la dernière est appliquée : les précédentes sont signalées "superseded".
+    @param db: AsyncSession
+    @param user_id: int
+    @param compte_id: int
+    @param personnage_id: int
+    @param batch: schemas.InventaireBatch
+    @return list[dict] (un résultat par opération, dans l'ordre du lot)
+    """
+    await get_personnage_or_404(db, personnage_id)
+
+    results = [
+        {"index": index, "action": operation.action, "status": "ok", "id": operation.id, "objet": operation.objet, "quantite": operation.quantite,
+         "version": operation.version}
+        for index, operation in enumerate(batch.operations)
+    ]
+    for result in results:
+        if result["action"] == "add":
+            if result["objet"] is None:
+                result.update(status="invalid", detail="objet is required")
+            elif result["quantite"] == 0:
+                result.update(status="invalid", detail="quantite must be at least 1")
+            elif result["quantite"] is None:
+                result["quantite"] = 1
+        elif result["id"] is None:
+            result.update(status="invalid", detail="id is required")
+        elif result["action"] == "update" and result["quantite"] is None:
+            result.update(status="invalid", detail="quantite is required")
+
+    # une seule requête pour vérifier que les emplacements modifiés / supprimés appartiennent au personnage
+    targeted_ids = {result["id"] for result in results if result["status"] == "ok" and result["action"] != "add"}
+    existing = {}
+    if targeted_ids:
+        existing = {
+            slot.id: (slot.objet, slot.version)
+            for slot in await db.scalars(
+                select(models.Inventaire).filter(
+                    models.Inventaire.personnage_id == personnage_id, models.Inventaire.id.in_(targeted_ids)
+                )
+            )
+        }
+    removed_ids = set()
+    updates = {}
+    # emplacement -> dernière opération acceptée qui le vise
+    latest = {}
+    for result in results:
+        if result["status"] != "ok" or result["action"] == "add":
+            continue
+        if result["id"] not in existing or result["id"] in removed_ids:
+            result.update(status="not_found", detail="Inventaire not found")
+            continue
+        result["objet"], version = existing[result["id"]]
+        if result["version"] is not None and result["version"] != version:
+            result.update(status="conflict", detail="Inventaire was modified by another request")
+            continue
+        if result["id"] in latest:
+            latest[result["id"]].update(status="superseded", detail=f"Superseded by operation {result['index']}")
+        latest[result["id"]] = result
+        if result["action"] == "remove" or result["quantite"] == 0:
+            removed_ids.add(result["id"])
+            updates.pop(result["id"], None)
+        else:
+            updates[result["id"]] = result["quantite"]
+
+    # compare-and-swap groupé : (id, version lue) IN (...), les lignes renvoyées sont celles effectivement modifiées
+    versions = {}
+    if updates:
+        statement = update(models.Inventaire).filter(
+            tuple_(models.Inventaire.id, models.Inventaire.version).in_([(id, existing[id][1]) for id in updates])
+        ).values(
+            quantite=case(updates, value=models.Inventaire.id), version=models.Inventaire.version + 1
+        ).returning(models.Inventaire.id, models.Inventaire.version)
+        versions = dict((await db.execute(statement.execution_options(synchronize_session=False))).all())
+    if removed_ids:
+        statement = delete(models.Inventaire).filter(
+            tuple_(models.Inventaire.id, models.Inventaire.version).in_([(id, existing[id][1]) for id in removed_ids])
+        ).returning(models.Inventaire.id)
+        removed_ids = set((await db.scalars(statement.execution_options(synchronize_session=False))).all())
+    for result in results:
+        if result["status"] != "ok" or result["action"] == "add":
+            continue
+        if result["id"] in versions:
+            result["version"] = versions[result["id"]]
+        elif result["id"] not in removed_ids:
+            result.update(status="conflict", detail="Inventaire was modified by another request")
+
+    additions = [result for result in results if result["status"] == "ok" and result["action"] == "add"]
+    stacked = {}
+    if additions:
+        objet_ids = await get_objet_ids(db, {result["objet"] for result in additions})
+        quantites = {}
+        for result in additions:
+            objet_id = objet_ids[result["objet"]]
+            quantites[objet_id] = quantites.get(objet_id, 0) + result["quantite"]
+        slots = await stack_inventaire(db, personnage_id, quantites)
+        stacked = {slot["id"]: slot["version"] for slot in slots.values()}
+        for result in additions:
+            slot = slots[objet_ids[result["objet"]]]
+            result.update(id=slot["id"], quantite=slot["quantite"], version=slot["version"])
+    if versions or removed_ids or additions:
+        owner = await touch_tree(db, personnage_id=personnage_id)
+        await record_changes(db, owner, "inventaire", "delete", *removed_ids)
+        # un emplacement créé par l'INSERT ... ON CONFLICT est à sa première version, un emplacement empilé a été modifié
+        await record_changes(db, owner, "inventaire", "create", *(id for id, version in stacked.items() if version == 1))
+        await record_changes(db, owner, "inventaire", "update", *versions, *(id for id, version in stacked.items() if version > 1))
+    await db.commit()
+    return results
+
+# --- Synchronisation incrémentale (GET /changes/)
+# type de changement -> modèle et schéma de l'état renvoyé (sans les relations)
+CHANGE_TYPES = {
+    "utilisateur": (models.Utilisateur, schemas.UtilisateurSimple),
+    "compte": (models.Compte, schemas.CompteSimple),
+    "personnage": (models.Personnage, schemas.PersonnageSimple),
+    "inventaire": (models.Inventaire, schemas.Inventaire),
+}
+
+async def get_changes(db: AsyncSession, user_id: int, since: int | None = None, limit: int = 500) -> schemas.ChangesPage:
+    """
+    Cette fonction permet de récupérer les lignes de l'arbre d'un utilisateur créées, modifiées ou supprimées après un curseur,
+    avec leur état actuel (une requête par type de ligne) : une ligne modifiée plusieurs fois n'est renvoyée qu'une fois,
+    une ligne créée puis supprimée depuis le curseur ne l'est pas. Sans curseur, seul le curseur actuel est renvoyé
+    (à lire avant de charger l'arbre complet, qui sert de point de départ)
+    @param db: AsyncSession
+    @param user_id: int
+    @param since: int | None (curseur de la synchronisation précédente)
+    @param limit: int (nombre de changements lus dans le journal)
+    @return schemas.ChangesPage
+    """
+    changes = models.Changement
+    if since is None:
+        cursor = await db.scalar(select(func.max(changes.id)).filter(changes.utilisateur_id == user_id))
+        return schemas.ChangesPage(cursor=cursor or 0)
+    rows = (await db.execute(
+        select(changes.id, changes.type, changes.cible_id, changes.operation)
+        .filter(changes.utilisateur_id == user_id, changes.id > since).order_by(changes.id).limit(limit + 1)
+    )).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    # dernier changement de chaque ligne, dans l'ordre du journal
+    latest, created = {}, set()
+    for row in rows:
+        key = (row.type, row.cible_id)
+        latest.pop(key, None)
+        latest[key] = row
+        if row.operation == "create":
+            created.add(key)
+    # état actuel des lignes : une ligne supprimée ou cachée depuis n'en a pas et devient une suppression
+    states = {}
+    for kind, (model, schema) in CHANGE_TYPES.items():
+        ids = [cible_id for (type_, cible_id), row in latest.items() if type_ == kind and row.operation != "delete"]
+        if ids:
+            for node in await db.scalars(select(model).filter(model.id.in_(ids))):
+                states[(kind, node.id)] = schema.model_validate(node)
+    result = []
+    for key, row in latest.items():
+        data = states.get(key)
+        if data is None and key in created:
+            continue
+        operation = "delete" if data is None else "create" if key in created else row.operation
+        result.append(schemas.Change(cursor=row.id, type=row.type, id=row.cible_id, operation=operation, data=data))
+    return schemas.ChangesPage(cursor=rows[-1].id if rows else since, changes=result, has_more=has_more)
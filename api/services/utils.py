@@ -1,22 +1,411 @@
 # --- Importation des modules
-from sqlalchemy.orm import Session
-from typing import Annotated
+from sqlalchemy import inspect, select, text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, noload, with_parent
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.dialects import postgresql, sqlite
+from pydantic import BaseModel, TypeAdapter
+from fastapi import HTTPException, Request, Response, status
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.security.utils import get_authorization_scheme_param
+from contextlib import asynccontextmanager
+from functools import lru_cache
+from alembic import command
+from alembic.config import Config
+import hashlib
+import json
+import os
+import time
+from typing import AsyncIterator, get_args, get_origin
 import  database
+import models
+from cache import TTLCache
+
+# --- Configuration des migrations (api/alembic.ini)
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
 
 def create_database():
     """
-    Cette fonction permet de créer la base de données
+    Cette fonction permet de créer ou de mettre à jour la base de données en appliquant les migrations (alembic upgrade head)
     @return None
     """
-    return database.Base.metadata.create_all(bind=database.engine)
+    config = Config(ALEMBIC_INI)
+    config.attributes["configure_logger"] = False
+    with database.engine.begin() as connection:
+        config.attributes["connection"] = connection
+        tables = inspect(connection).get_table_names()
+        if "Utilisateur" in tables and "alembic_version" not in tables:
+            # base créée par create_all avant les migrations : on la marque à la version qui correspond à son schéma
+            columns = {column["name"] for column in inspect(connection).get_columns("Inventaire")}
+            command.stamp(config, "0001" if "objet" in columns else "0002")
+        command.upgrade(config, "head")
+
+# --- Routage des sessions : base principale ou moteur de lecture (réplique DATABASE_READ_URL, ou pool en lecture seule du
+# profil SQLite "production"). Les routes qui ne font que lire utilisent get_read_db, celles qui écrivent get_db (base
+# principale). La réplique peut être en retard : après une écriture, les lectures du même utilisateur (même token, ou même
+# user_id dans le chemin) restent sur la base principale pendant DATABASE_READ_STICKINESS secondes. Comme les autres
+# caches, cet état est propre à chaque worker
+READ_STICKINESS_CACHE_SIZE = int(os.getenv("READ_STICKINESS_CACHE_SIZE", 10000))
+recent_writers = TTLCache(READ_STICKINESS_CACHE_SIZE, database.DATABASE_READ_STICKINESS)
 
-def get_db() -> Session:
+def writer_keys(request: Request) -> list[str]:
     """
-    Cette fonction permet de récupérer la session de la base de données
-    @return Session
+    Cette fonction permet de récupérer les clés qui identifient l'auteur d'une requête : son token et l'utilisateur visé
+    @param request: Request
+    @return list[str]
     """
-    db = database.SessionLocal()
-    try:
+    keys = []
+    scheme, token = get_authorization_scheme_param(request.headers.get("Authorization"))
+    if scheme.lower() == "bearer" and token:
+        keys.append(f"token:{token}")
+    user_id = request.path_params.get("user_id")
+    if user_id is not None:
+        keys.append(f"user:{user_id}")
+    return keys
+
+def stick_to_primary(*keys: str):
+    """
+    Cette fonction permet de faire lire sur la base principale les prochaines requêtes portant l'une des clés
+    (uniquement avec une réplique : le pool en lecture seule de SQLite voit les écritures dès leur validation)
+    @param keys: str (voir writer_keys)
+    @return None
+    """
+    if not database.DATABASE_READ_URL:
+        return
+    for key in keys:
+        recent_writers.set(key, True)
+
+def use_read_engine(request: Request) -> bool:
+    """
+    Cette fonction permet de savoir si une requête peut lire sur le moteur de lecture (réplique ou pool en lecture seule)
+    @param request: Request
+    @return bool
+    """
+    if database.async_read_engine is database.async_engine:
+        return False
+    return not any(recent_writers.get(key) for key in writer_keys(request))
+
+@asynccontextmanager
+async def open_session(session_factory, telemetry: database.PoolTelemetry) -> AsyncIterator[AsyncSession]:
+    """
+    Cette fonction permet d'ouvrir une session et d'y prendre une connexion du pool (erreur 503 si le pool reste plein)
+    @param session_factory: async_sessionmaker
+    @param telemetry: database.PoolTelemetry
+    @return AsyncSession
+    """
+    async with session_factory() as db:
+        # la connexion est prise dans le pool dès le début de la requête pour mesurer l'attente
+        start = time.perf_counter()
+        try:
+            await db.connection()
+        except PoolTimeoutError:
+            telemetry.timeouts += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="No database connection available, retry later",
+                headers={"Retry-After": "1"},
+            )
+        telemetry.record(time.perf_counter() - start)
         yield db
+
+async def get_db(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    Cette fonction permet de récupérer la session asynchrone de la base principale, pour les routes qui écrivent
+    (avec le profil SQLite "production", elle tient l'unique connexion d'écriture jusqu'à la fin de la requête)
+    @param request: Request
+    @return AsyncSession
+    """
+    stick_to_primary(*writer_keys(request))
+    try:
+        async with open_session(database.AsyncSessionLocal, database.pool_telemetry) as db:
+            yield db
     finally:
-        db.close()
\ No newline at end of file
+        # la fenêtre court à partir de la fin de l'écriture
+        stick_to_primary(*writer_keys(request))
+
+async def get_read_session(request: Request) -> AsyncIterator[AsyncSession]:
+    """
+    Cette fonction permet de récupérer une session pour les routes qui ne font que lire : réplique ou pool en lecture seule
+    si possible, base principale sinon
+    @param request: Request
+    @return AsyncSession
+    """
+    if use_read_engine(request):
+        session_factory, telemetry = database.AsyncReadSessionLocal, database.read_pool_telemetry
+    else:
+        session_factory, telemetry = database.AsyncSessionLocal, database.pool_telemetry
+    async with open_session(session_factory, telemetry) as db:
+        yield db
+
+# sans moteur de lecture distinct, get_read_db est get_db : FastAPI ne l'appelle qu'une fois par requête, l'utilisateur
+# courant et la route partagent alors la même session (une seule connexion par requête)
+get_read_db = get_read_session if database.async_read_engine is not database.async_engine else get_db
+
+async def check_database() -> bool:
+    """
+    Cette fonction permet de vérifier que la base de données (et sa réplique en lecture) répond
+    @return bool
+    """
+    try:
+        for session_factory in {database.AsyncSessionLocal, database.AsyncReadSessionLocal}:
+            async with session_factory() as db:
+                await db.execute(text("SELECT 1"))
+        return True
+    except Exception:
+        return False
+
+def dialect_insert(db: AsyncSession):
+    """
+    Cette fonction permet de récupérer la construction insert() du dialecte de la base (SQLite ou PostgreSQL),
+    qui seule permet les INSERT ... ON CONFLICT (ajout ou mise à jour atomique en une requête)
+    @param db: AsyncSession
+    @return fonction insert du dialecte
+    """
+    dialects = {"sqlite": sqlite.insert, "postgresql": postgresql.insert}
+    return dialects[db.bind.dialect.name]
+
+def _nested_schema(annotation) -> type[BaseModel] | None:
+    """
+    Cette fonction permet de retrouver le schéma Pydantic contenu dans une annotation (ex : Optional[List[Compte]])
+    @param annotation: type
+    @return type[BaseModel] | None
+    """
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in get_args(annotation):
+        schema = _nested_schema(arg)
+        if schema is not None:
+            return schema
+    return None
+
+def _is_list(annotation) -> bool:
+    """
+    Cette fonction permet de savoir si une annotation est une liste (ex : Optional[List[Compte]])
+    @param annotation: type
+    @return bool
+    """
+    return get_origin(annotation) is list or any(_is_list(arg) for arg in get_args(annotation))
+
+# --- Champs demandés (?fields=id,login,comptes.nom)
+# fields vaut None pour « tous les champs », sinon l'ensemble des chemins demandés ; un chemin qui désigne une relation sans
+# sous-champ (ex : comptes) demande tout son sous-arbre
+def parse_fields(schema: type[BaseModel], fields: str | None) -> frozenset[str] | None:
+    """
+    Cette fonction permet de lire le paramètre ?fields= et de vérifier que chaque chemin existe dans le schéma de réponse
+    @param schema: type[BaseModel]
+    @param fields: str | None (chemins séparés par des virgules)
+    @return frozenset[str] | None
+    """
+    if fields is None:
+        return None
+    paths = frozenset(path.strip() for path in fields.split(",") if path.strip())
+    for path in paths:
+        current = schema
+        for part in path.split("."):
+            if current is None or part not in current.model_fields:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Unknown field '{path}'",
+                )
+            current = _nested_schema(current.model_fields[part].annotation)
+    return paths
+
+def _sub_fields(fields: frozenset[str] | None, name: str) -> frozenset[str] | None:
+    # champs demandés sous name (None : tout le sous-arbre)
+    if fields is None or name in fields:
+        return None
+    return frozenset(path[len(name) + 1:] for path in fields if path.startswith(name + "."))
+
+def _is_selected(fields: frozenset[str] | None, name: str) -> bool:
+    return fields is None or name in fields or any(path.startswith(name + ".") for path in fields)
+
+def include_fields(schema: type[BaseModel], fields: frozenset[str] | None) -> dict | None:
+    """
+    Cette fonction permet de convertir les champs demandés au format include de Pydantic (model_dump_json(include=...))
+    @param schema: type[BaseModel]
+    @param fields: frozenset[str] | None
+    @return dict | None
+    """
+    if fields is None:
+        return None
+    include = {}
+    for name, field in schema.model_fields.items():
+        if not _is_selected(fields, name):
+            continue
+        sub_fields = _sub_fields(fields, name)
+        child_schema = _nested_schema(field.annotation)
+        if sub_fields is None or child_schema is None:
+            include[name] = True
+        else:
+            child = include_fields(child_schema, sub_fields)
+            include[name] = {"__all__": child} if _is_list(field.annotation) else child
+    return include
+
+@lru_cache
+def loading_plan(schema: type[BaseModel], model: type | None = None, fields: frozenset[str] | None = None) -> tuple:
+    """
+    Cette fonction permet de construire les options de chargement (selectinload) correspondant à la profondeur d'un schéma de réponse :
+    chaque relation exposée par le schéma est chargée en une requête par niveau, quel que soit le nombre de lignes.
+    Les relations absentes de fields ne sont pas chargées (noload : liste vide sans requête).
+    @param schema: type[BaseModel] (ex : schemas.Utilisateur)
+    @param model: modèle SQLAlchemy (par défaut, le modèle du même nom que le schéma)
+    @param fields: frozenset[str] | None (champs demandés, voir parse_fields)
+    @return tuple d'options à passer à select(...).options(...)
+    """
+    model = model or getattr(models, schema.__name__)
+    schema.model_rebuild()
+    relationships = inspect(model).relationships
+    options = []
+    for name, field in schema.model_fields.items():
+        if name not in relationships:
+            continue
+        if not _is_selected(fields, name):
+            options.append(noload(getattr(model, name)))
+            continue
+        loader = selectinload(getattr(model, name))
+        child_schema = _nested_schema(field.annotation)
+        child_options = loading_plan(child_schema, relationships[name].mapper.class_, _sub_fields(fields, name)) if child_schema else ()
+        options.append(loader.options(*child_options) if child_options else loader)
+    return tuple(options)
+
+async def load_relationships(db: AsyncSession, instance, schema: type[BaseModel], fields: frozenset[str] | None = None):
+    """
+    Cette fonction permet de charger les relations d'une ligne déjà lue (ex : par get_tree_node pour l'ETag) selon le plan de
+    loading_plan, sans relire la ligne elle-même : une requête par niveau de relations
+    @param db: AsyncSession
+    @param instance: ligne de la session (ex : models.Utilisateur)
+    @param schema: type[BaseModel] (schéma de réponse, ex : schemas.Utilisateur)
+    @param fields: frozenset[str] | None (champs demandés, voir parse_fields)
+    @return None
+    """
+    model = type(instance)
+    schema.model_rebuild()
+    relationships = inspect(model).relationships
+    for name, field in schema.model_fields.items():
+        if name not in relationships:
+            continue
+        children = []
+        if _is_selected(fields, name):
+            child_model = relationships[name].mapper.class_
+            child_schema = _nested_schema(field.annotation)
+            child_options = loading_plan(child_schema, child_model, _sub_fields(fields, name)) if child_schema else ()
+            statement = select(child_model).where(with_parent(instance, getattr(model, name))).options(*child_options)
+            children = list(await db.scalars(statement))
+        set_committed_value(instance, name, children)
+
+# --- Réponses JSON
+# JSON_RESPONSE=orjson : les réponses encodées par FastAPI le sont avec orjson (si installé) au lieu du module json.
+# Les routes de lecture n'en dépendent pas : leurs services renvoient des modèles déjà validés, sérialisés directement
+# par Pydantic (json_response), sans nouvelle validation ni passage par jsonable_encoder.
+JSON_RESPONSE = os.getenv("JSON_RESPONSE", "default")
+
+def default_response_class() -> type[Response]:
+    """
+    Cette fonction permet de choisir la classe de réponse par défaut de l'application selon JSON_RESPONSE
+    @return type[Response]
+    """
+    if JSON_RESPONSE == "orjson":
+        try:
+            import orjson  # noqa: F401
+        except ImportError:
+            raise RuntimeError("JSON_RESPONSE=orjson requires the orjson package")
+        return ORJSONResponse
+    if JSON_RESPONSE != "default":
+        raise RuntimeError(f"Unknown JSON_RESPONSE {JSON_RESPONSE!r} (expected 'default' or 'orjson')")
+    return JSONResponse
+
+@lru_cache
+def _adapter(schema: type[BaseModel], many: bool) -> TypeAdapter:
+    return TypeAdapter(list[schema] if many else schema)
+
+def dump_json(payload: BaseModel | list, schema: type[BaseModel], fields: frozenset[str] | None = None) -> bytes:
+    """
+    Cette fonction permet de sérialiser un modèle (ou une liste de modèles) déjà validé, limité aux champs demandés
+    @param payload: BaseModel | list
+    @param schema: type[BaseModel]
+    @param fields: frozenset[str] | None
+    @return bytes
+    """
+    many = isinstance(payload, list)
+    include = include_fields(schema, fields)
+    if many and include is not None:
+        include = {"__all__": include}
+    return _adapter(schema, many).dump_json(payload, include=include)
+
+def json_response(payload: BaseModel | list, schema: type[BaseModel], fields: frozenset[str] | None = None, headers: dict | None = None, status_code: int = 200) -> Response:
+    """
+    Cette fonction permet de renvoyer un modèle (ou une liste de modèles) déjà validé sans repasser par la validation de FastAPI
+    @param payload: BaseModel | list
+    @param schema: type[BaseModel]
+    @param fields: frozenset[str] | None
+    @param headers: dict | None
+    @param status_code: int
+    @return Response
+    """
+    return Response(content=dump_json(payload, schema, fields), status_code=status_code, media_type="application/json", headers=headers)
+
+def if_none_match(request: Request, etag: str) -> bool:
+    """
+    Cette fonction permet de savoir si l'ETag correspond à l'en-tête If-None-Match de la requête
+    @param request: Request
+    @param etag: str (avec ses guillemets)
+    @return bool
+    """
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [candidate.strip().removeprefix("W/") for candidate in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+def etag_headers(etag: str) -> dict:
+    """
+    Cette fonction permet de construire les en-têtes de cache d'une réponse portant un ETag
+    @param etag: str
+    @return dict
+    """
+    # le client doit revalider à chaque fois, mais peut réutiliser sa copie si elle n'a pas changé
+    return {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+def not_modified(etag: str) -> Response:
+    """
+    Cette fonction permet de renvoyer une réponse 304 vide
+    @param etag: str
+    @return Response
+    """
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=etag_headers(etag))
+
+@lru_cache
+def _schema_digest(schema: type[BaseModel]) -> str:
+    # l'ETag change si le format de la réponse change (déploiement d'une nouvelle version des schémas)
+    return hashlib.blake2b(json.dumps(schema.model_json_schema(), sort_keys=True).encode(), digest_size=8).hexdigest()
+
+def version_etag(schema: type[BaseModel], node_id: int, version: int, fields: frozenset[str] | None = None) -> str:
+    """
+    Cette fonction permet de calculer l'ETag d'une réponse à partir de la version de l'arbre lu (version_arbre),
+    sans charger ni sérialiser l'arbre
+    @param schema: type[BaseModel] (schéma de la réponse)
+    @param node_id: int (utilisateur, compte ou personnage dont l'arbre est lu)
+    @param version: int (version_arbre de ce nœud)
+    @param fields: frozenset[str] | None (champs demandés)
+    @return str
+    """
+    selection = ",".join(sorted(fields)) if fields is not None else "*"
+    key = f"{schema.__name__}:{_schema_digest(schema)}:{node_id}:{version}:{selection}"
+    return f'"{hashlib.blake2b(key.encode(), digest_size=16).hexdigest()}"'
+
+def etag_response(request: Request, payload: BaseModel | list, schema: type[BaseModel], fields: frozenset[str] | None = None) -> Response:
+    """
+    Cette fonction permet de renvoyer un modèle (ou une liste de modèles) en JSON avec un ETag calculé sur son contenu,
+    ou une réponse 304 vide si le client possède déjà cette version (If-None-Match)
+    @param request: Request
+    @param payload: BaseModel | list
+    @param schema: type[BaseModel]
+    @param fields: frozenset[str] | None (champs demandés)
+    @return Response
+    """
+    body = dump_json(payload, schema, fields)
+    etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+    if if_none_match(request, etag):
+        return not_modified(etag)
+    return Response(content=body, media_type="application/json", headers=etag_headers(etag))
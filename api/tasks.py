@@ -9,15 +9,42 @@ from jose import JWTError, jwt
 from passlib.context import CryptContext
 # datetime est utilisé pour la gestion des dates
 from datetime import datetime, timedelta, timezone
+# base64, hashlib, hmac et json sont utilisés par l'implémentation rapide des JWT signés par HMAC (HS256, HS384, HS512)
+import base64
+import hashlib
+import hmac
+import json
+# asyncio et concurrent.futures sont utilisés pour exécuter le hashage des mots de passe hors de la boucle d'événements
+import asyncio
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
 # os est utilisé pour la gestion des variables d'environnement
 import os
 # dotenv est utilisé pour charger les variables d'environnement
 from dotenv import load_dotenv
 load_dotenv()
 
+from cache import TTLCache
+# PyJWT est optionnel : il n'est utilisé que si JWT_BACKEND="pyjwt"
+try:
+    import jwt as pyjwt
+except ImportError:
+    pyjwt = None
+
 # --- Variables d'environnement
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
+# type d'exécuteur utilisé pour bcrypt : "thread" (bcrypt libère le GIL) ou "process"
+HASH_EXECUTOR = os.getenv("HASH_EXECUTOR", "thread")
+# nombre maximum de hashages exécutés en parallèle
+HASH_MAX_WORKERS = int(os.getenv("HASH_MAX_WORKERS", os.cpu_count() or 1))
+# nombre maximum de hashages en attente avant de refuser les nouvelles demandes
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", 64))
+# implémentation des tokens d'accès : "hmac" (bibliothèque standard, HS* uniquement), "jose" ou "pyjwt" ; "auto" choisit
+# "hmac" pour les algorithmes HS* et "jose" sinon
+JWT_BACKEND = os.getenv("JWT_BACKEND", "auto")
+# nombre maximum de tokens vérifiés gardés en mémoire (jusqu'à leur expiration)
+TOKEN_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", 10000))
 
 # --- variables de contexte
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -41,6 +68,251 @@ def get_password_hash(password) -> str:
     """
     return pwd_context.hash(password)
 
+class HashingPoolFull(Exception):
+    """
+    Exception levée lorsque la file d'attente de l'exécuteur de hashage est pleine
+    """
+
+
+class HashingPool:
+    """
+    Cette classe permet d'exécuter le hashage des mots de passe dans un pool borné (threads ou processus)
+    afin que bcrypt ne bloque pas la boucle d'événements, avec des métriques sur la file d'attente
+    """
+
+    def __init__(self, kind: str = "thread", max_workers: int = 1, max_queue: int = 64):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown hashing executor '{kind}', expected 'thread' or 'process'")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._executor: Executor | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        # métriques
+        self.running = 0
+        self.queued = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hashing")
+        return self._executor
+
+    async def run(self, func, *args):
+        """
+        Cette fonction permet d'exécuter une fonction de hashage dans le pool
+        @param func: fonction à exécuter (doit être sérialisable pour le pool de processus)
+        @param args: arguments de la fonction
+        @return le résultat de la fonction
+        """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise HashingPoolFull()
+        self.queued += 1
+        start = time.perf_counter()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+        wait = time.perf_counter() - start
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.running += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+        finally:
+            self.running -= 1
+            self.completed += 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        """
+        Cette fonction permet de récupérer les métriques du pool de hashage
+        @return dict
+        """
+        return {
+            "executor": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "running": self.running,
+            "queued": self.queued,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_wait_ms": self.total_wait / self.completed * 1000 if self.completed else 0.0,
+            "max_wait_ms": self.max_wait * 1000,
+        }
+
+    def shutdown(self):
+        """
+        Cette fonction permet d'arrêter l'exécuteur
+        @return None
+        """
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+hashing_pool = HashingPool(HASH_EXECUTOR, HASH_MAX_WORKERS, HASH_MAX_QUEUE)
+
+async def verify_password_async(plain_password, hashed_password) -> bool:
+    """
+    Cette fonction permet de vérifier un mot de passe dans le pool de hashage
+    @param plain_password: str
+    @param hashed_password: str
+    @return bool
+    """
+    return await hashing_pool.run(verify_password, plain_password, hashed_password)
+
+async def get_password_hash_async(password) -> str:
+    """
+    Cette fonction permet de hasher un mot de passe dans le pool de hashage
+    @param password: str
+    @return str
+    """
+    return await hashing_pool.run(get_password_hash, password)
+
+# --- Tokens d'accès (JWT)
+class TokenError(Exception):
+    """
+    Exception levée lorsqu'un token est invalide (format, signature, algorithme) ou expiré
+    """
+
+
+class JoseBackend:
+    """
+    Cette classe permet de signer et vérifier les tokens avec python-jose (tous les algorithmes)
+    """
+    name = "jose"
+
+    def __init__(self, secret: str, algorithm: str):
+        self.secret = secret
+        self.algorithm = algorithm
+
+    def encode(self, claims: dict) -> str:
+        return jwt.encode(claims, self.secret, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return jwt.decode(token, self.secret, algorithms=[self.algorithm])
+        except JWTError as exc:
+            raise TokenError(str(exc)) from exc
+
+
+class PyJWTBackend(JoseBackend):
+    """
+    Cette classe permet de signer et vérifier les tokens avec PyJWT (dépendance optionnelle)
+    """
+    name = "pyjwt"
+
+    def __init__(self, secret: str, algorithm: str):
+        if pyjwt is None:
+            raise RuntimeError("JWT_BACKEND=pyjwt requires the PyJWT package")
+        super().__init__(secret, algorithm)
+
+    def encode(self, claims: dict) -> str:
+        return pyjwt.encode(claims, self.secret, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> dict:
+        try:
+            return pyjwt.decode(token, self.secret, algorithms=[self.algorithm])
+        except pyjwt.PyJWTError as exc:
+            raise TokenError(str(exc)) from exc
+
+
+def _b64encode(data: bytes) -> bytes:
+    return base64.urlsafe_b64encode(data).rstrip(b"=")
+
+def _b64decode(data: bytes) -> bytes:
+    return base64.urlsafe_b64decode(data + b"=" * (-len(data) % 4))
+
+
+class HmacBackend:
+    """
+    Cette classe permet de signer et vérifier les tokens HS256 / HS384 / HS512 avec la bibliothèque standard :
+    l'en-tête est calculé une seule fois et seuls la signature, "exp" et "nbf" sont vérifiés (tokens compatibles avec jose)
+    """
+    name = "hmac"
+    DIGESTS = {"HS256": hashlib.sha256, "HS384": hashlib.sha384, "HS512": hashlib.sha512}
+
+    def __init__(self, secret: str, algorithm: str):
+        if algorithm not in self.DIGESTS:
+            raise RuntimeError(f"JWT_BACKEND=hmac does not support {algorithm}")
+        self.key = secret.encode()
+        self.digest = self.DIGESTS[algorithm]
+        self.header = _b64encode(json.dumps({"alg": algorithm, "typ": "JWT"}, separators=(",", ":"), sort_keys=True).encode())
+
+    def _sign(self, signing_input: bytes) -> bytes:
+        return hmac.new(self.key, signing_input, self.digest).digest()
+
+    def encode(self, claims: dict) -> str:
+        claims = {key: int(value.timestamp()) if isinstance(value, datetime) else value for key, value in claims.items()}
+        signing_input = self.header + b"." + _b64encode(json.dumps(claims, separators=(",", ":")).encode())
+        return (signing_input + b"." + _b64encode(self._sign(signing_input))).decode()
+
+    def decode(self, token: str) -> dict:
+        try:
+            signing_input, _, signature = token.encode().rpartition(b".")
+            header, _, payload = signing_input.partition(b".")
+            # l'en-tête doit être exactement celui produit par encode : algorithme imposé, pas de "none"
+            if not hmac.compare_digest(header, self.header) or not hmac.compare_digest(_b64decode(signature), self._sign(signing_input)):
+                raise TokenError("Signature verification failed")
+            claims = json.loads(_b64decode(payload))
+        except (ValueError, TypeError) as exc:
+            raise TokenError("Invalid token") from exc
+        if not isinstance(claims, dict):
+            raise TokenError("Invalid payload")
+        now = time.time()
+        try:
+            if "exp" in claims and now >= float(claims["exp"]):
+                raise TokenError("Signature has expired")
+            if "nbf" in claims and now < float(claims["nbf"]):
+                raise TokenError("The token is not yet valid")
+        except (TypeError, ValueError) as exc:
+            raise TokenError("Invalid registered claim") from exc
+        return claims
+
+
+JWT_BACKENDS = {"jose": JoseBackend, "hmac": HmacBackend, "pyjwt": PyJWTBackend}
+
+def get_token_backend(name: str = JWT_BACKEND, secret: str = SECRET_KEY, algorithm: str = ALGORITHM):
+    """
+    Cette fonction permet de construire l'implémentation des tokens d'accès
+    @param name: str ("auto", "hmac", "jose" ou "pyjwt")
+    @param secret: str
+    @param algorithm: str
+    @return JoseBackend | HmacBackend | PyJWTBackend
+    """
+    if name == "auto":
+        name = "hmac" if algorithm in HmacBackend.DIGESTS else "jose"
+    if name not in JWT_BACKENDS:
+        raise RuntimeError(f"Unknown JWT_BACKEND {name!r} (expected one of: auto, {', '.join(JWT_BACKENDS)})")
+    return JWT_BACKENDS[name](secret or "", algorithm)
+
+token_backend = get_token_backend()
+# claims des tokens déjà vérifiés, gardés jusqu'à l'expiration du token : une vérification répétée est une recherche dans un dictionnaire
+claims_cache = TTLCache(TOKEN_CACHE_SIZE, ttl=24 * 3600)
+
+def verify_access_token(token: str) -> dict:
+    """
+    Cette fonction permet de vérifier un token d'accès et de récupérer ses claims (mémorisés jusqu'à l'expiration du token)
+    @param token: str
+    @return dict (à ne pas modifier, partagé entre les requêtes)
+    """
+    claims = claims_cache.get(token)
+    if claims is None:
+        claims = token_backend.decode(token)
+        expires_in = claims["exp"] - time.time() if isinstance(claims.get("exp"), (int, float)) else None
+        claims_cache.set(token, claims, ttl=expires_in)
+    return claims
+
 def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     """
     Cette fonction permet de créer un token d'accès
@@ -54,7 +326,7 @@ def create_access_token(data: dict, expires_delta: timedelta = None) -> str:
     else:
         expire = get_current_datetime() + timedelta(minutes=300)
     to_encode.update({"exp": expire})
-    encoded_jwt = jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    encoded_jwt = token_backend.encode(to_encode)
     return encoded_jwt
 
 